@@ -0,0 +1,319 @@
+"""Vectorized backtest of the valuation rules over historical data.
+
+Prices and fundamentals for many tickers are read from local files and laid
+out as (date, ticker) float64 arrays. Fundamentals are carried forward from
+the date they were reported until newer ones arrive or they get too old, so
+every date only sees what was known then. The MOS, ten cap, payback and DCF
+prices of every (date, ticker) are computed with the same vectorized
+functions valuation uses, and a rule signals a buy wherever the close is
+below its price. Each signal is scored by the forward return over each
+horizon, whether that return was positive, and the largest drawdown from the
+entry price within the horizon.
+
+Tickers are processed in column chunks and only sums are kept, so memory
+stays bounded however long the history is.
+
+Prices file: long (date, ticker, close) or wide (date, then one column per
+ticker). Fundamentals file: long (date, ticker, then any of eps, growth,
+fcfps, shares, cap_ex, income_tax_exp and industry), dated when the numbers
+became public. growth is the EPS growth rate as a decimal, e.g. the mean of
+the moat averages / 100. CSV or Parquet.
+
+    python backtest.py prices.parquet fundamentals.parquet --step 21 -o report.csv
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from valuation import (EPS_GR, MARR, cap_eps_growth, get_8_year_payback_prices,
+                       get_dcf_prices, get_mos_prices, get_ten_cap_prices)
+
+RULES = ['mos', 'ten_cap', 'payback', 'dcf']
+FIELDS = ['eps', 'growth', 'fcfps', 'shares', 'cap_ex', 'income_tax_exp']
+HORIZONS = [21, 63, 252]  # Trading days: about a month, a quarter and a year
+MAX_AGE = 550  # Days fundamentals are used after being reported
+CHUNK = 256  # Tickers per pass
+COLUMNS = ['signals', 'mean_return', 'hit_rate', 'excess_return',
+           'mean_drawdown', 'max_drawdown']
+
+
+def read_table(path: str):
+    """Reads a CSV or Parquet file.
+
+    Args:
+        path (str): .csv or .parquet file.
+
+    Returns:
+        pd.DataFrame: File contents.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.parquet', '.pq'):
+        return pd.read_parquet(path)
+    if ext == '.csv':
+        return pd.read_csv(path)
+    raise ValueError(f'Unsupported data file: {path}')
+
+
+def as_days(dates):
+    """Dates as float days since the epoch, NaN for missing dates."""
+    dates = pd.to_datetime(pd.Series(dates))
+    return ((dates - pd.Timestamp('1970-01-01')) / pd.Timedelta(days=1)).to_numpy(np.float64)
+
+
+class History:
+    """Prices and fundamentals on one (date, ticker) grid.
+
+    Args:
+        dates (pd.DatetimeIndex): Trading dates, oldest first.
+        tickers (list): Ticker symbols.
+        prices (np.ndarray): (dates, tickers) closes. NaN where missing.
+        fundamentals (dict): Key in FIELDS -> (dates, tickers) values known on
+                             each date. Missing fields are left out.
+        financial (np.ndarray, optional): Per ticker, True for Financial
+                                          Services. Defaults to all False.
+    """
+    __slots__ = ('dates', 'tickers', 'prices', 'fundamentals', 'financial')
+
+    def __init__(self, dates: pd.DatetimeIndex, tickers: list, prices: np.ndarray,
+                 fundamentals: dict, financial: np.ndarray = None):
+        self.dates = dates
+        self.tickers = list(tickers)
+        self.prices = prices
+        self.fundamentals = fundamentals
+        self.financial = np.zeros(len(self.tickers), dtype=bool) \
+            if financial is None else np.asarray(financial, dtype=bool)
+
+    @classmethod
+    def from_frames(cls, prices: pd.DataFrame, fundamentals: pd.DataFrame,
+                    max_age: float = MAX_AGE):
+        """Aligns price and fundamentals tables.
+
+        Args:
+            prices (pd.DataFrame): Long or wide prices.
+            fundamentals (pd.DataFrame): Long fundamentals.
+            max_age (float, optional): Days fundamentals are used after being
+                                       reported. Defaults to MAX_AGE.
+
+        Returns:
+            History: Aligned history.
+        """
+        if 'ticker' in prices.columns:
+            prices = prices.pivot_table(index='date', columns='ticker', values='close',
+                                        aggfunc='last')
+        else:
+            prices = prices.set_index('date')
+        prices.index = pd.to_datetime(prices.index)
+        prices = prices.sort_index()
+        dates, tickers = prices.index, list(prices.columns)
+
+        fundamentals = fundamentals.assign(date=pd.to_datetime(fundamentals['date'])) \
+            .sort_values('date').drop_duplicates(['date', 'ticker'], keep='last')
+        fundamentals['reported'] = as_days(fundamentals['date'])
+
+        def align(field):
+            table = fundamentals.pivot(index='date', columns='ticker', values=field)
+            table = table.reindex(columns=tickers)
+            return table.reindex(table.index.union(dates)).ffill().reindex(dates) \
+                .to_numpy(np.float64)
+
+        stale = as_days(dates)[:, None] - align('reported') > max_age
+        values = {}
+        for field in FIELDS:
+            if field in fundamentals.columns:
+                values[field] = np.where(stale, np.nan, align(field))
+
+        financial = None
+        if 'industry' in fundamentals.columns:
+            industry = fundamentals.groupby('ticker')['industry'].last()
+            financial = (industry.reindex(tickers) == 'Financial Services').to_numpy()
+        return cls(dates, tickers, prices.to_numpy(np.float64), values, financial)
+
+    @classmethod
+    def from_files(cls, prices_path: str, fundamentals_path: str, max_age: float = MAX_AGE):
+        """Reads and aligns price and fundamentals files. See from_frames."""
+        return cls.from_frames(read_table(prices_path), read_table(fundamentals_path), max_age)
+
+    @property
+    def shape(self):
+        return self.prices.shape
+
+
+def rule_prices(fundamentals: dict, financial: np.ndarray = None, marr: float = MARR):
+    """The price of every rule on every (date, ticker).
+
+    Args:
+        fundamentals (dict): Key in FIELDS -> (dates, tickers) values.
+        financial (np.ndarray, optional): Per ticker, True for Financial
+                                          Services, which have no cap ex.
+                                          Defaults to None.
+        marr (float, optional): Discount rate. Defaults to MARR.
+
+    Returns:
+        dict: Rule -> (dates, tickers) prices. NaN where inputs are missing.
+    """
+    shape = next(iter(fundamentals.values())).shape
+    missing = np.full(shape, np.nan)
+    field = {name: fundamentals.get(name, missing) for name in FIELDS}
+
+    growth = field['growth']
+    growth = cap_eps_growth(np.where(np.isnan(growth), EPS_GR, growth))
+    cap_ex = field['cap_ex']
+    if financial is not None:
+        cap_ex = np.where(financial, 0.0, cap_ex)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'mos': get_mos_prices(field['eps'], growth, marr),
+            'ten_cap': get_ten_cap_prices(field['fcfps'], field['shares'], cap_ex,
+                                          field['income_tax_exp']),
+            'payback': get_8_year_payback_prices(field['fcfps'], marr),
+            'dcf': get_dcf_prices(field['fcfps'], growth, marr),
+        }
+
+
+def forward_returns(prices: np.ndarray, horizon: int):
+    """Return from each date's close to the close horizon dates later.
+
+    Args:
+        prices (np.ndarray): (dates, tickers) closes.
+        horizon (int): Dates ahead.
+
+    Returns:
+        np.ndarray: (dates, tickers) returns. NaN near the end.
+    """
+    returns = np.full(prices.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[:-horizon] = prices[horizon:]/prices[:-horizon] - 1
+    return returns
+
+
+def forward_drawdowns(prices: np.ndarray, horizon: int):
+    """Largest fall below each date's close within the next horizon dates.
+
+    Args:
+        prices (np.ndarray): (dates, tickers) closes.
+        horizon (int): Dates ahead.
+
+    Returns:
+        np.ndarray: (dates, tickers) drawdowns, zero or negative. NaN near
+                    the end.
+    """
+    drawdowns = np.full(prices.shape, np.nan)
+    if horizon >= len(prices):
+        return drawdowns
+    # Minimum of windows doubling in length, so any window is the minimum of
+    # two overlapping power-of-two windows. NaN closes are skipped by fmin.
+    lows, width = prices[1:], 1
+    while 2*width <= horizon:
+        lows = np.fmin(lows[:-width], lows[width:])
+        width *= 2
+    lows = np.fmin(lows[:len(prices) - horizon], lows[horizon - width:len(prices) - width])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdowns[:-horizon] = np.minimum(lows/prices[:-horizon] - 1, 0)
+    return drawdowns
+
+
+def backtest(history: History, horizons: list = HORIZONS, step: int = 1,
+             margin: float = 0.0, marr: float = MARR, chunk: int = CHUNK):
+    """Scores the buy signals of every rule.
+
+    Args:
+        history (History): Aligned prices and fundamentals.
+        horizons (list, optional): Dates ahead to measure returns over.
+                                   Defaults to HORIZONS.
+        step (int, optional): Evaluate every step-th date, e.g. 21 for about
+                              monthly. Defaults to 1.
+        margin (float, optional): Discount below the rule price required to
+                                  buy, e.g. 0.1 for 10%. Defaults to 0.
+        marr (float, optional): Discount rate of the rules. Defaults to MARR.
+        chunk (int, optional): Tickers per pass. Defaults to CHUNK.
+
+    Returns:
+        pd.DataFrame: One row per rule and horizon, plus "all" for every
+                      (date, ticker) with a price, with the number of
+                      signals, mean forward return, hit rate, mean return
+                      above "all", and mean and worst drawdown.
+    """
+    rows = np.arange(0, history.shape[0], max(1, step))
+    groups = ['all'] + RULES
+    sums = {key: np.zeros((len(groups), len(horizons))) for key in
+            ('signals', 'returns', 'hits', 'drawdowns')}
+    worst = np.zeros((len(groups), len(horizons)))
+
+    for start in range(0, history.shape[1], chunk):
+        cols = slice(start, start + chunk)
+        prices = history.prices[:, cols]
+        fundamentals = {field: values[:, cols] for field, values in history.fundamentals.items()}
+        targets = rule_prices(fundamentals, history.financial[cols], marr) if fundamentals else {}
+        entry = prices[rows]
+        with np.errstate(invalid='ignore'):
+            signals = np.stack([np.isfinite(entry)] + [
+                (targets[rule][rows] > 0) & (entry < targets[rule][rows]*(1 - margin))
+                if rule in targets else np.zeros(entry.shape, dtype=bool)
+                for rule in RULES
+            ]).reshape(len(groups), -1).astype(np.float64)
+
+        for h, horizon in enumerate(horizons):
+            returns = forward_returns(prices, horizon)[rows].ravel()
+            valid = np.isfinite(returns)
+            returns = np.where(valid, returns, 0.0)
+            drawdowns = np.where(valid, forward_drawdowns(prices, horizon)[rows].ravel(), 0.0)
+            # Sums over the signals of every group as one matrix product each
+            sums['signals'][:, h] += signals @ valid.astype(np.float64)
+            sums['returns'][:, h] += signals @ returns
+            sums['hits'][:, h] += signals @ (returns > 0).astype(np.float64)
+            sums['drawdowns'][:, h] += signals @ drawdowns
+            worst[:, h] = np.minimum(worst[:, h], (signals*drawdowns).min(axis=1))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        count = sums['signals']
+        mean_return = sums['returns']/count
+        report = {
+            'signals': count.astype(np.int64),
+            'mean_return': mean_return,
+            'hit_rate': sums['hits']/count,
+            'excess_return': mean_return - mean_return[0],
+            'mean_drawdown': sums['drawdowns']/count,
+            'max_drawdown': np.where(count > 0, worst, np.nan),
+        }
+    index = pd.MultiIndex.from_product([groups, horizons], names=['rule', 'horizon'])
+    return pd.DataFrame({name: values.ravel() for name, values in report.items()},
+                        index=index)[COLUMNS]
+
+
+def parse_args(argv: list = None):
+    """Parses command line arguments.
+
+    Args:
+        argv (list, optional): Arguments to parse. Defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: Parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='Backtests the MOS, ten cap, payback and DCF rules on historical data.'
+    )
+    parser.add_argument('prices', help='.csv or .parquet closes, long or wide')
+    parser.add_argument('fundamentals', help='.csv or .parquet fundamentals by report date')
+    parser.add_argument('--horizons', type=int, nargs='+', default=HORIZONS,
+                        help='trading days ahead to measure returns over')
+    parser.add_argument('--step', type=int, default=1,
+                        help='evaluate every STEP-th date')
+    parser.add_argument('--margin', type=float, default=0.0,
+                        help='discount below the rule price required to buy')
+    parser.add_argument('--max-age', type=float, default=MAX_AGE,
+                        help='days fundamentals are used after being reported')
+    parser.add_argument('-o', '--output', help='write the report to a .csv file')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    history = History.from_files(args.prices, args.fundamentals, args.max_age)
+    report = backtest(history, args.horizons, args.step, args.margin)
+    print(f'{history.shape[1]} tickers, {history.shape[0]} dates '
+          f'({history.dates[0].date()} to {history.dates[-1].date()})')
+    print(report.to_string(float_format=lambda x: '%.4f' % x))
+    if args.output is not None:
+        report.to_csv(args.output)
@@ -0,0 +1,68 @@
+"""Values a whole universe of stocks in one vectorized pass.
+
+Uses the same price kernels as the scalar get_mos_price,
+get_8_year_payback_price, get_ten_cap_price and get_dcf_price, so every row
+matches the value those functions give for the same inputs.
+"""
+import numpy as np
+import pandas as pd
+
+from valuation import (MARR, cap_eps_growth, get_8_year_payback_prices,
+                       get_dcf_prices, get_mos_prices, get_ten_cap_prices)
+
+COLUMNS = ['eps', 'growth', 'fcfps', 'shares', 'capex', 'tax']
+
+
+def value_universe(universe: pd.DataFrame|dict, marr: float = MARR):
+    """Calculates the MOS, ten cap, payback and DCF prices of every stock.
+
+    Args:
+        universe (pd.DataFrame | dict): One row per ticker with columns
+            eps (current year EPS), growth (average EPS growth as a decimal,
+            capped like get_mos_price), fcfps, shares, capex and tax (income
+            tax expense). An optional industry column zeroes capex for
+            Financial Services. Dicts of arrays are accepted too.
+        marr (float, optional): Minimal acceptable rate of return.
+                                Defaults to MARR.
+
+    Returns:
+        pd.DataFrame: MOS, Ten Cap, 8 Yr Payback and DCF prices, indexed
+                      like universe. NaN where inputs are missing.
+    """
+    values = universe_arrays(universe)
+    growth = cap_eps_growth(values['growth'])
+    return pd.DataFrame(
+        {
+            'MOS': get_mos_prices(values['eps'], growth, marr),
+            'Ten Cap': get_ten_cap_prices(values['fcfps'], values['shares'],
+                                          values['capex'], values['tax']),
+            '8 Yr Payback': get_8_year_payback_prices(values['fcfps'], marr),
+            'DCF': get_dcf_prices(values['fcfps'], growth, marr)
+        }, index=values['index']
+    )
+
+
+def universe_arrays(universe: pd.DataFrame|dict):
+    """Extracts the valuation inputs of a universe as float64 arrays.
+
+    Args:
+        universe (pd.DataFrame | dict): Universe as described in value_universe.
+
+    Returns:
+        dict: One array per column in COLUMNS plus the universe index. capex
+              is zero for Financial Services.
+    """
+    if not isinstance(universe, pd.DataFrame):
+        universe = pd.DataFrame(universe)
+
+    missing = [col for col in COLUMNS if col not in universe.columns]
+    if missing:
+        raise KeyError(f'Universe is missing columns: {missing}')
+
+    values = {col: universe[col].to_numpy(dtype=np.float64, na_value=np.nan)
+              for col in COLUMNS}
+    if 'industry' in universe.columns:
+        financial = universe['industry'].to_numpy() == 'Financial Services'
+        values['capex'] = np.where(financial, 0.0, values['capex'])
+    values['index'] = universe.index
+    return values
@@ -0,0 +1,99 @@
+"""Compares per-page load time and Chrome memory use of the default and the
+lean browser profiles.
+
+Usage:
+    python benchmarks/browser_profile.py [--pages 5] [--path chromedriver] [links ...]
+
+Without links, the first pages from get_links are used. Memory is the summed
+resident set size of the Chrome processes, which needs psutil; it is skipped
+otherwise.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import valuation  # noqa: E402
+
+
+def chrome_memory(driver):
+    """Sums the resident memory of chromedriver and its Chrome children.
+
+    Args:
+        driver (WebDriver): Running web driver.
+
+    Returns:
+        float: Megabytes. None if psutil is not installed.
+    """
+    try:
+        import psutil
+    except ImportError:
+        return None
+    process = psutil.Process(driver.service.process.pid)
+    processes = [process] + process.children(recursive=True)
+    rss = 0
+    for proc in processes:
+        try:
+            rss += proc.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return rss / 2**20
+
+
+def run_profile(links: list, path: str, lean: bool):
+    """Scrapes every link with one profile. Each page is loaded once, by
+    scrape_link, and its load time is read from the page_load stage that
+    load_page records for the page.
+
+    Args:
+        links (list): Valuation pages.
+        path (str): Path to chromedriver.
+        lean (bool): Use the lean profile.
+
+    Returns:
+        tuple: Page load times, scrape times including the load (seconds)
+               and peak memory (MB).
+    """
+    load_times, scrape_times, memory = [], [], []
+    with valuation.ScraperSession(path=path, lean=lean) as session:
+        driver = session.driver
+        for link in links:
+            start = time.perf_counter()
+            with valuation.METRICS.ticker(link):
+                valuation.scrape_link(driver, link)
+            scrape_times.append(time.perf_counter() - start)
+            load_times.append(valuation.METRICS.tickers.pop(link)['page_load'])
+            memory.append(chrome_memory(driver))
+    peak = max((m for m in memory if m is not None), default=None)
+    return load_times, scrape_times, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('links', nargs='*')
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--path', default=valuation.PATH)
+    args = parser.parse_args()
+
+    links = args.links
+    if not links:
+        with valuation.ScraperSession(path=args.path) as session:
+            links = valuation.get_links(session.driver)
+    links = links[:args.pages]
+    # Limiter waits would land in the page_load stage of whichever profile
+    # runs second, so the few benchmark loads are not rate limited
+    valuation.RESILIENCE.configure('morningstar', rate=None)
+
+    print(f'{"profile":<10}{"load p50 (s)":>14}{"scrape p50 (s)":>16}{"peak MB":>10}')
+    for name, lean in (('default', False), ('lean', True)):
+        load_times, scrape_times, peak = run_profile(links, args.path, lean)
+        peak = f'{peak:.0f}' if peak is not None else 'n/a'
+        print(f'{name:<10}{statistics.median(load_times):>14.2f}'
+              f'{statistics.median(scrape_times):>16.2f}{peak:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Generates the synthetic section text in sections.json.
+
+The fixtures are not recorded pages. Each ticker gets section lines laid out
+like the Morningstar valuation page (row labels, one value per fiscal year,
+TTM and 5-Yr columns, "—" for NA) with seeded random values, plus rough
+fundamentals for the price functions. The shapes cover full and short
+histories, missing values and a Financial Services stock. The seed is fixed,
+so the output is the same on every run.
+
+Usage:
+    python benchmarks/fixtures/generate.py [--output sections.json]
+"""
+import argparse
+import json
+import os
+import random
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+OUTPUT = os.path.join(HERE, 'sections.json')
+SEED = 7
+LAST_YEAR = 2023
+
+AVERAGES = ['Year over Year', '3-Year Average', '5-Year Average', '10-Year Average']
+OP_EFF = ['Gross Margin %', 'Operating Margin %', 'Net Margin %', 'EBITDA Margin %',
+          'Tax Rate %', 'Asset Turnover', 'Return on Equity %',
+          'Return on Invested Capital %', 'Return on Assets %', 'Interest Coverage']
+FIN_HEALTH = ['Book Value/Share', 'Current Ratio', 'Quick Ratio', 'Debt/Equity']
+CASH_FLOW = ['Free Cash Flow/Share', 'Cash Conversion Cycle', 'Capital Expenditure/Revenue %']
+
+# Ticker, fiscal years, share of NA values, industry, EPS, shares, cap ex,
+# income tax expense and price
+STOCKS = [
+    ('AAPL', 11, 0.0, 'Technology', 6.1, 15.9e9, -10.7e9, 19.3e9, 150.0),
+    ('JPM', 11, 0.0, 'Financial Services', 12.1, 2.93e9, 0.0, 8.5e9, 135.0),
+    ('KO', 11, 0.15, 'Consumer Defensive', 2.5, 4.32e9, -1.5e9, 2.1e9, 61.0),
+    ('SNOW', 8, 0.1, 'Technology', -0.9, 0.32e9, -0.06e9, 0.01e9, 150.0),
+    ('RIVN', 5, 0.2, 'Consumer Cyclical', -6.9, 0.91e9, -1.7e9, 0.0, 30.0),
+]
+
+
+def number(rng: random.Random, low: float = -10, high: float = 35, na: float = 0.05):
+    """A page value: a number with two decimals, or "—" with probability na."""
+    return '—' if rng.random() < na else f'{rng.uniform(low, high):,.2f}'
+
+
+def rows(rng: random.Random, labels: list, n: int, **kwargs):
+    """One line per label followed by n values."""
+    return [' '.join([label, *[number(rng, **kwargs) for _ in range(n)]]) for label in labels]
+
+
+def fixture(rng: random.Random, ticker: str, years: int, na: float, industry: str,
+            eps: float, shares: float, cap_ex: float, tax: float, price: float):
+    """Sections and fundamentals of one synthetic ticker.
+
+    Returns:
+        dict: ticker, sections and fundamentals, as load_fixtures reads them.
+    """
+    labels = [str(year) for year in range(LAST_YEAR - years, LAST_YEAR)]
+    growth = ['Revenue % ' + ' '.join(labels) + ' TTM 5-Yr',
+              *rows(rng, AVERAGES, years + 1, na=na),
+              'Operating Income %', *rows(rng, AVERAGES, years + 1, na=na),
+              'EPS %', *rows(rng, AVERAGES, years + 1, na=na)]
+    return {
+        'ticker': ticker,
+        'sections': {
+            'growth': growth,
+            'op_eff_years': ['Metric', *labels, 'TTM', '5-Yr'],
+            'op_eff': rows(rng, OP_EFF, years + 2, low=-5, high=60, na=na),
+            'fin_health': rows(rng, FIN_HEALTH, years + 1, low=0.5, high=90, na=na),
+            'cash_flow': rows(rng, CASH_FLOW, years + 1, low=0.2, high=15, na=0),
+        },
+        'fundamentals': {'industry': industry, 'epsCurrentYear': eps,
+                         'sharesOutstanding': shares, 'capitalExpenditures': cap_ex,
+                         'incomeTaxExpense': tax, 'regularMarketPrice': price},
+    }
+
+
+def generate(seed: int = SEED):
+    """Builds the fixtures of every stock in STOCKS.
+
+    Args:
+        seed (int, optional): Random seed. Defaults to SEED.
+
+    Returns:
+        list: One fixture dict per stock.
+    """
+    rng = random.Random(seed)
+    return [fixture(rng, *stock) for stock in STOCKS]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=OUTPUT)
+    args = parser.parse_args()
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(generate(), file, indent=1, ensure_ascii=False)
@@ -0,0 +1,461 @@
+"""Offline benchmarks of the parsing and valuation hot paths.
+
+Every case runs on a universe built by cycling the synthetic section text in
+fixtures/sections.json, so nothing touches the network or a browser. The
+fixtures are generated by fixtures/generate.py with a fixed seed; they have
+the layout of the valuation page, not recorded values. Each case is timed at
+every universe size and run once more under tracemalloc to measure
+allocations.
+
+Results are compared with baseline.json, which holds the results of an
+earlier run on the same machine. Cases slower or allocating more than the
+tolerance allows are reported as regressions and the script exits with
+status 1. Timings only compare on one machine, so the baseline is not
+committed. It records the machine it was saved on and is ignored elsewhere.
+To refresh it, run the benchmarks on the commit to compare against with
+--save-baseline, then run them again on the change:
+
+    git stash && python benchmarks/hot_paths.py --save-baseline
+    git stash pop && python benchmarks/hot_paths.py
+
+Cases added since the baseline was saved show "n/a" until it is refreshed.
+A case that looks slower is rerun before it counts as a regression. On shared
+or virtualized machines even the fastest of several runs can vary by half,
+so use a larger --tolerance there.
+
+Usage:
+    python benchmarks/hot_paths.py [--sizes 1 10 100 1000 10000] [--repeat 5]
+                                   [--cases transform mos ...] [--tolerance 0.25]
+                                   [--save-baseline]
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import fastparse  # noqa: E402
+import valuation  # noqa: E402
+from fundamentals import FundamentalsCache  # noqa: E402
+from profiler import Profiler  # noqa: E402
+from universe import Universe  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, 'fixtures', 'sections.json')
+BASELINE = os.path.join(HERE, 'baseline.json')
+SIZES = [1, 10, 100, 1000, 10000]
+REPEAT = 5  # Timed runs per case; the fastest is kept
+TOLERANCE = 0.25
+CONFIRM = 2  # Reruns of a case that looks slower, keeping its best results
+# Absolute differences below these are noise, whatever the relative change
+SLACK = {'seconds': 1e-3, 'peak_bytes': 64*1024}
+
+
+def machine():
+    """Identifies the machine and libraries timings were taken with.
+
+    Returns:
+        dict: Host, CPU, Python, NumPy and pandas versions.
+    """
+    return {
+        'host': platform.node(),
+        'cpu': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+
+def load_baseline(path: str):
+    """Reads the results of a baseline saved on this machine.
+
+    Args:
+        path (str): Baseline file.
+
+    Returns:
+        dict: 'case:size' -> result. Empty if there is no baseline or it was
+              saved on another machine.
+    """
+    if not os.path.exists(path):
+        print(f'No baseline at {path}; run with --save-baseline to capture one.')
+        return {}
+    with open(path) as file:
+        baseline = json.load(file)
+    if baseline.get('machine') != machine():
+        print(f'Baseline at {path} was saved on another machine or library versions; '
+              f'not comparing. Run with --save-baseline to capture one here.')
+        return {}
+    return baseline['results']
+
+
+def load_fixtures(path: str = FIXTURES):
+    """Reads the synthetic section text and fundamentals of each ticker.
+
+    Args:
+        path (str, optional): Fixture file. Defaults to FIXTURES.
+
+    Returns:
+        list: One dict per ticker with ticker, sections and fundamentals.
+    """
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def build_universe(fixtures: list, size: int):
+    """Cycles the fixtures into a universe of unique tickers.
+
+    Args:
+        fixtures (list): Output of load_fixtures.
+        size (int): Number of tickers.
+
+    Returns:
+        list: Fixture dicts with ticker renamed to be unique.
+    """
+    return [dict(fixtures[i % len(fixtures)], ticker=f'{fixtures[i % len(fixtures)]["ticker"]}{i}')
+            for i in range(size)]
+
+
+def fill_fundamentals(universe: list):
+    """Builds an in-memory FundamentalsCache holding each ticker's quote,
+    cash flow, income statement and company info.
+
+    Args:
+        universe (list): Output of build_universe.
+
+    Returns:
+        FundamentalsCache: Cache the scalar price functions can read from.
+    """
+    cache = FundamentalsCache(maxsize=4*len(universe) + 1)
+    for stock in universe:
+        ticker, data = stock['ticker'], stock['fundamentals']
+        cache.put(ticker, 'quote', {key: data[key] for key in
+                                    ('epsCurrentYear', 'sharesOutstanding', 'regularMarketPrice')})
+        cache.put(ticker, 'cash_flow',
+                  pd.DataFrame({0: [data['capitalExpenditures']]}, index=['capitalExpenditures']))
+        cache.put(ticker, 'income_statement',
+                  pd.DataFrame({0: [data['incomeTaxExpense']]}, index=['incomeTaxExpense']))
+        cache.put(ticker, 'company_info',
+                  pd.DataFrame({'Value': [data['industry']]}, index=['sector']))
+    return cache
+
+
+def split_rows(lines: list):
+    """Splits section lines into token rows like transform does."""
+    return [line.split() for line in lines]
+
+
+def prepare(universe: list):
+    """Precomputes the inputs of every case so only the case itself is timed.
+
+    Args:
+        universe (list): Output of build_universe.
+
+    Returns:
+        dict: Inputs shared by the cases.
+    """
+    parsed = [valuation.parse_section_lines_reference(stock['sections'])
+              for stock in universe]
+    tables = [valuation.create_dataframes(p['rev'], p['eps'], p['bvps'], p['roe'],
+                                          p['roic'], p['growth_yrs'], p['op_eff_yrs'])
+              for p in parsed]
+    averaged = [valuation.get_data_averages(copy.deepcopy(moat)) for moat, _ in tables]
+    fundamentals = [stock['fundamentals'] for stock in universe]
+    growth = valuation.cap_eps_growth([np.nanmean(moat.iloc[-1])/100 for moat in averaged])
+    return {
+        'universe': universe,
+        'parsed': parsed,
+        'tables': tables,
+        'averaged': averaged,
+        'raw_rows': [
+            [split_rows(stock['sections']['growth'][1:5]),
+             split_rows(stock['sections']['fin_health']),
+             split_rows(stock['sections']['cash_flow'])]
+            for stock in universe
+        ],
+        'op_eff_rows': [split_rows(stock['sections']['op_eff'][6:8]) for stock in universe],
+        'years': [stock['sections']['growth'][0].split()[2:-2] for stock in universe],
+        'arrays': {
+            'fcfps': np.array([p['fcfps'] for p in parsed], dtype=np.float64),
+            'shares': np.array([f['sharesOutstanding'] for f in fundamentals], dtype=np.float64),
+            'capex': np.array([0 if f['industry'] == 'Financial Services'
+                               else f['capitalExpenditures'] for f in fundamentals],
+                              dtype=np.float64),
+            'tax': np.array([f['incomeTaxExpense'] for f in fundamentals], dtype=np.float64),
+            'eps': np.array([f['epsCurrentYear'] for f in fundamentals], dtype=np.float64),
+            'growth': growth,
+        },
+    }
+
+
+def case_transform(data):
+    for stock in data['universe']:
+        sections = stock['sections']
+        valuation.transform(sections['growth'][1:5], 'growth')
+        valuation.transform(sections['growth'][-4:], 'growth')
+        valuation.transform(sections['op_eff'][6:7], 'op_eff')
+        valuation.transform(sections['op_eff'][7:8], 'op_eff')
+        valuation.transform(sections['fin_health'], 'fin_health')
+        valuation.transform(sections['cash_flow'], 'cash_flow')
+
+
+def case_parse_section_lines(data):
+    for stock in data['universe']:
+        valuation.parse_section_lines_reference(stock['sections'])
+
+
+def case_parse_batch(data):
+    fastparse.parse_batch([stock['sections'] for stock in data['universe']])
+
+
+def case_moat_data_cleaner(data):
+    for rows in data['raw_rows']:
+        for section in rows:
+            valuation.moat_data_cleaner(section)
+
+
+def case_scrape_data_format1(data):
+    for growth, fin_health, cash_flow in data['cleaned_rows']:
+        valuation.scrape_data_format1(growth)
+        valuation.scrape_data_format1(fin_health, fin_health_section=True)
+        valuation.scrape_data_format1(cash_flow, cash_flow_section=True)
+
+
+def case_scrape_data_format2(data):
+    for roe, roic in data['cleaned_op_eff']:
+        valuation.scrape_data_format2([roe])
+        valuation.scrape_data_format2([roic])
+
+
+def case_get_years(data):
+    for years in data['years']:
+        valuation.get_years(years)
+
+
+def case_check_length(data):
+    for (growth, fin_health, _), years in zip(data['cleaned_rows'], data['years']):
+        valuation.check_length(growth)
+        valuation.check_length(fin_health)
+        valuation.check_length(years, years=True)
+
+
+def case_create_dataframes(data):
+    for p in data['parsed']:
+        valuation.create_dataframes(p['rev'], p['eps'], p['bvps'], p['roe'],
+                                    p['roic'], p['growth_yrs'], p['op_eff_yrs'])
+
+
+def case_create_dataframes_profiled(data):
+    # Same work as create_dataframes with the sampler running at its default
+    # interval and the thread inside a ticker, so every round samples it
+    with Profiler(), valuation.METRICS.ticker('profiled'):
+        case_create_dataframes(data)
+
+
+def case_get_data_averages(data):
+    for moat, management in data['table_copies']:
+        valuation.get_data_averages(moat)
+        valuation.get_data_averages(management)
+
+
+def case_universe(data):
+    universe = Universe.from_sections([stock['ticker'] for stock in data['universe']],
+                                      [stock['ticker'] for stock in data['universe']],
+                                      data['parsed'])
+    universe.moat_averages()
+    universe.management_averages()
+    universe.eps_growth()
+
+
+def case_ten_cap(data):
+    for stock, p in zip(data['universe'], data['parsed']):
+        valuation.get_ten_cap_price(stock['ticker'], p['fcfps'], stock['fundamentals']['industry'])
+
+
+def case_mos(data):
+    for stock, moat in zip(data['universe'], data['averaged']):
+        valuation.get_mos_price(stock['ticker'], moat)
+
+
+def case_payback(data):
+    for p in data['parsed']:
+        valuation.get_8_year_payback_price(p['fcfps'])
+
+
+def case_dcf(data):
+    for p, moat in zip(data['parsed'], data['averaged']):
+        valuation.get_dcf_price(p['fcfps'], moat)
+
+
+def case_prices_vectorized(data):
+    arrays = data['arrays']
+    valuation.get_ten_cap_prices(arrays['fcfps'], arrays['shares'], arrays['capex'], arrays['tax'])
+    valuation.get_mos_prices(arrays['eps'], arrays['growth'])
+    valuation.get_8_year_payback_prices(arrays['fcfps'])
+
+
+def case_dcf_vectorized(data):
+    arrays = data['arrays']
+    valuation.get_dcf_prices(arrays['fcfps'], arrays['growth'])
+
+
+def setup_cleaned(data):
+    data['cleaned_rows'] = [[valuation.moat_data_cleaner(section) for section in rows]
+                            for rows in data['raw_rows']]
+    data['cleaned_op_eff'] = [valuation.moat_data_cleaner(rows) for rows in data['op_eff_rows']]
+
+
+def setup_table_copies(data):
+    # get_data_averages appends a row in place, so every run needs fresh tables
+    data['table_copies'] = [(copy.deepcopy(moat), copy.deepcopy(management))
+                            for moat, management in data['tables']]
+
+
+# Case -> (function, setup run before every timed run)
+CASES = {
+    'transform': (case_transform, None),
+    'parse_section_lines': (case_parse_section_lines, None),
+    'parse_batch': (case_parse_batch, None),
+    'moat_data_cleaner': (case_moat_data_cleaner, None),
+    'scrape_data_format1': (case_scrape_data_format1, setup_cleaned),
+    'scrape_data_format2': (case_scrape_data_format2, setup_cleaned),
+    'get_years': (case_get_years, None),
+    'check_length': (case_check_length, setup_cleaned),
+    'create_dataframes': (case_create_dataframes, None),
+    'create_dataframes_profiled': (case_create_dataframes_profiled, None),
+    'get_data_averages': (case_get_data_averages, setup_table_copies),
+    'universe': (case_universe, None),
+    'ten_cap': (case_ten_cap, None),
+    'mos': (case_mos, None),
+    'payback': (case_payback, None),
+    'dcf': (case_dcf, None),
+    'prices_vectorized': (case_prices_vectorized, None),
+    'dcf_vectorized': (case_dcf_vectorized, None),
+}
+
+
+def run_case(name: str, data: dict, repeat: int):
+    """Times a case and measures its allocations.
+
+    Args:
+        name (str): Key in CASES.
+        data (dict): Output of prepare.
+        repeat (int): Timed runs. The fastest one is kept.
+
+    Returns:
+        dict: seconds, peak_bytes and allocated_blocks.
+    """
+    func, setup = CASES[name]
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup(data)
+        start = time.perf_counter()
+        func(data)
+        times.append(time.perf_counter() - start)
+
+    if setup is not None:
+        setup(data)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename')
+                 if stat.count_diff > 0)
+    return {'seconds': min(times), 'peak_bytes': peak, 'allocated_blocks': blocks}
+
+
+def compare(results: dict, baseline: dict, tolerance: float = TOLERANCE):
+    """Finds results worse than the baseline by more than the tolerance.
+
+    Args:
+        results (dict): 'case:size' -> output of run_case.
+        baseline (dict): Same shape, loaded from the baseline file.
+        tolerance (float, optional): Allowed relative slowdown or allocation
+                                     growth, on top of SLACK. Defaults to TOLERANCE.
+
+    Returns:
+        list: (key, metric, baseline value, new value) of every regression.
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        for metric, slack in SLACK.items():
+            if result[metric] > base[metric]*(1 + tolerance) + slack:
+                regressions.append((key, metric, base[metric], result[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store these results as the new baseline')
+    args = parser.parse_args()
+    # Fixtures with missing years average empty slices on purpose
+    warnings.simplefilter('ignore', RuntimeWarning)
+
+    fixtures = load_fixtures()
+    baseline = load_baseline(args.baseline)
+
+    results = {}
+    print(f'{"case":<28}{"size":>7}{"tickers/s":>13}{"peak KiB":>10}'
+          f'{"blocks":>9}{"vs base":>9}')
+    for size in args.sizes:
+        universe = build_universe(fixtures, size)
+        valuation.FUNDAMENTALS = fill_fundamentals(universe)
+        data = prepare(universe)
+        for name in args.cases:
+            key = f'{name}:{size}'
+            result = run_case(name, data, args.repeat)
+            # One slow sample on a busy machine is noise; only a regression
+            # that shows in the best of several runs counts
+            for _ in range(CONFIRM):
+                if not compare({key: result}, baseline, args.tolerance):
+                    break
+                again = run_case(name, data, args.repeat)
+                result = {metric: min(result[metric], again[metric]) for metric in result}
+            results[key] = result
+            base = baseline.get(key)
+            ratio = f'{result["seconds"]/base["seconds"]:.2f}x' if base else 'n/a'
+            print(f'{name:<28}{size:>7}{size/result["seconds"]:>13,.0f}'
+                  f'{result["peak_bytes"]/1024:>10,.0f}{result["allocated_blocks"]:>9,}'
+                  f'{ratio:>9}')
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as file:
+            json.dump({'machine': machine(), 'results': baseline}, file, indent=1,
+                      sort_keys=True)
+        print(f'Baseline saved to {args.baseline}')
+        return
+
+    missing = [key for key in results if key not in baseline]
+    if baseline and missing:
+        print(f'No baseline for {", ".join(missing)}; refresh it with --save-baseline.')
+    regressions = compare(results, baseline, args.tolerance)
+    for key, metric, old, new in regressions:
+        print(f'REGRESSION ~ {key} {metric}: {old:.6g} -> {new:.6g}')
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
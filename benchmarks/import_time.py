@@ -0,0 +1,65 @@
+"""Measures how long it takes to import valuation.py in a fresh interpreter,
+next to the cost of the scraping dependencies it no longer loads up front and
+of pipeline.py, which holds the command line and run orchestration.
+
+Usage:
+    python benchmarks/import_time.py [--runs 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATEMENTS = {
+    'valuation': 'import valuation',
+    'pipeline': 'import pipeline',
+    'scraping deps': (
+        'import selenium.webdriver, yahoo_fin.stock_info, '
+        'forex_python.converter'
+    ),
+}
+
+
+def time_import(statement: str, runs: int):
+    """Imports a statement in fresh interpreters and times each run.
+
+    Args:
+        statement (str): Import statement to run.
+        runs (int): Number of fresh interpreters to start.
+
+    Returns:
+        list: Wall times in seconds.
+    """
+    code = (
+        'import time; start = time.perf_counter(); '
+        f'{statement}; print(time.perf_counter() - start)'
+    )
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', code], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    print(f'{"import":<15}{"median (s)":>12}{"min (s)":>12}{"max (s)":>12}')
+    for name, statement in STATEMENTS.items():
+        try:
+            times = time_import(statement, args.runs)
+        except subprocess.CalledProcessError as err:
+            print(f'{name:<15} failed: {err.stderr.strip().splitlines()[-1]}')
+            continue
+        print(f'{name:<15}{statistics.median(times):>12.3f}'
+              f'{min(times):>12.3f}{max(times):>12.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+"""Compiled fast path for parsing the text of the valuation tables.
+
+The original parsers split every line, filter tokens with is_valid and
+convert values one float() at a time. Here the section text of any number of
+tickers is joined and tokenized with one regex pass. It is converted to a
+float64 matrix (NaN for NA) with one cast, right-aligned so that the negative
+INDEXES select the same cells for every row. The INDEXES selection is then a
+single fancy index per section.
+
+The results are the same values valuation.parse_section_lines_reference
+returns, and valuation.parse_section_lines delegates here.
+"""
+import re
+
+import numpy as np
+
+from valuation import INDEXES, NA
+
+# Tokens moat_data_cleaner keeps: anything holding a decimal point or NA
+TOKEN_RE = re.compile(rf'(?<!\S)[^\s.{NA}]*[.{NA}]\S*|\n')
+NA_RE = re.compile(rf'(?<!\S)[^\s{NA}]*{NA}\S*')
+YEAR_RE = re.compile(r'\d{4}|\n')
+
+# Minimum row/year lengths of each INDEXES key, as in check_rows/check_years
+THRESHOLDS = {
+    'data': [2, 5, 7, 9, 12],
+    'years': [1, 4, 6, 8, 11],
+}
+MIN_WIDTH = 13  # Wide enough for every negative index, after dropping "5-Yr"
+
+# Growth rows paired with the indexes: 10, 5, 3-year averages then YoY twice
+GROWTH_ORDER = np.array([3, 2, 1, 0, 0])
+
+SECTION_FIELDS = ['rev', 'eps', 'growth_yrs', 'roe', 'roic', 'op_eff_yrs', 'bvps', 'fcfps']
+
+
+def index_table(kind: str):
+    """Packs INDEXES[kind] into an array, one row per key.
+
+    Args:
+        kind (str): 'data' or 'years'.
+
+    Returns:
+        tuple: Negative indexes padded with -1 (keys + 1, 5) and the number of
+               indexes per row. Row 0 stands for lengths too short for any key.
+    """
+    keys = sorted(INDEXES[kind])
+    width = max(len(idxs) for idxs in INDEXES[kind].values())
+    table = np.full((len(keys) + 1, width), -1, dtype=np.intp)
+    counts = np.zeros(len(keys) + 1, dtype=np.intp)
+    for row, key in enumerate(keys, start=1):
+        idxs = INDEXES[kind][key]
+        table[row, :len(idxs)] = idxs
+        counts[row] = len(idxs)
+    return table, counts
+
+
+TABLES = {kind: index_table(kind) for kind in INDEXES}
+
+
+def select_indexes(lengths: np.ndarray, kind: str = 'data'):
+    """Vectorized check_length: the INDEXES selection for many lengths.
+
+    Args:
+        lengths (np.ndarray): Row lengths, or numbers of years.
+        kind (str, optional): 'data' or 'years'. Defaults to 'data'.
+
+    Returns:
+        tuple: Negative indexes (..., 5) and how many of them are used. A
+               count of 0 means check_length returns None.
+    """
+    table, counts = TABLES[kind]
+    rows = np.searchsorted(THRESHOLDS[kind], lengths, side='right')
+    return table[rows], counts[rows]
+
+
+def parse_matrix(lines: list, pattern: re.Pattern = TOKEN_RE):
+    """Tokenizes lines of text in one regex pass into a float64 matrix.
+
+    Rows are right-aligned and padded with NaN, so negative indexes count
+    from the end of each row like they do on the token lists.
+
+    Args:
+        lines (list): Lines of text, one per row.
+        pattern (re.Pattern, optional): Token regex, which must also match
+                                        newlines. Defaults to TOKEN_RE.
+
+    Returns:
+        tuple: Matrix (len(lines), width) and the number of tokens per row.
+    """
+    text = '\n'.join(lines) + '\n'
+    if pattern is TOKEN_RE:
+        text = NA_RE.sub(NA, text.replace(',', ''))
+    tokens = np.array(pattern.findall(text))
+
+    newline = tokens == '\n'
+    row = np.cumsum(newline) - newline
+    row, tokens = row[~newline], tokens[~newline]
+    lengths = np.bincount(row, minlength=len(lines))[:len(lines)]
+
+    values = np.full(tokens.shape, np.nan)
+    present = tokens != NA
+    values[present] = tokens[present].astype(np.float64)
+
+    width = max(int(lengths.max(initial=0)), MIN_WIDTH)
+    starts = np.cumsum(lengths) - lengths
+    cols = np.arange(tokens.size) - starts[row] + (width - lengths)[row]
+    matrix = np.full((len(lines), width), np.nan)
+    matrix[row, cols] = values
+    return matrix, lengths
+
+
+def parse_blocks(blocks: list, rows: int):
+    """Parses equally sized blocks of lines, one block per ticker.
+
+    Args:
+        blocks (list): Lists of lines. Short blocks are padded with empty rows.
+        rows (int): Rows per block.
+
+    Returns:
+        tuple: Matrix (len(blocks), rows, width) and lengths (len(blocks), rows).
+    """
+    lines = []
+    for block in blocks:
+        block = list(block[:rows])
+        lines.extend(block + [''] * (rows - len(block)))
+    matrix, lengths = parse_matrix(lines)
+    return matrix.reshape(len(blocks), rows, -1), lengths.reshape(len(blocks), rows)
+
+
+def parse_years(years: list):
+    """Vectorized get_years for many tickers: the years selected by INDEXES,
+    most recent first.
+
+    Args:
+        years (list): Lists of year strings, one per ticker.
+
+    Returns:
+        list: Selected years per ticker. None where get_years fails.
+    """
+    return select_years(*parse_matrix([' '.join(yrs) for yrs in years], YEAR_RE))
+
+
+def select_years(matrix: np.ndarray, lengths: np.ndarray):
+    """The years INDEXES selects from right-aligned rows of years.
+
+    Args:
+        matrix (np.ndarray): (tickers, width) years.
+        lengths (np.ndarray): Number of years per ticker.
+
+    Returns:
+        list: Selected years per ticker, most recent first. None where
+              get_years fails.
+    """
+    idxs, counts = select_indexes(lengths, 'years')
+    width = matrix.shape[1]
+    selected = matrix[np.arange(len(matrix))[:, None], width + idxs].astype(np.int64)
+    result = []
+    for values, count in zip(selected.tolist(), counts.tolist()):
+        if count == 0:
+            print('Function "check_years" failed to account for other test cases.')
+            result.append(None)
+        else:
+            result.append(values[:count][::-1])
+    return result
+
+
+def align_rows(rows: list):
+    """Right-aligns rows of numbers into a matrix like parse_matrix, for
+    values that don't come from page text.
+
+    Args:
+        rows (list): Lists of numbers. None for NA.
+
+    Returns:
+        tuple: Matrix (len(rows), width) and the number of values per row.
+    """
+    lengths = np.array([len(row) for row in rows], dtype=np.intp)
+    width = max(int(lengths.max(initial=0)), MIN_WIDTH)
+    matrix = np.full((len(rows), width), np.nan)
+    for i, row in enumerate(rows):
+        if len(row):
+            matrix[i, width - len(row):] = [np.nan if value is None else value for value in row]
+    return matrix, lengths
+
+
+def split_selected(values: np.ndarray, counts: np.ndarray):
+    """Turns padded selections back into the lists the original parsers
+    return, None where no index applied."""
+    return [row[:count] if count else None
+            for row, count in zip(values.tolist(), counts.tolist())]
+
+
+def parse_growth(blocks: list):
+    """Vectorized "Revenue %" or "EPS %" rows of the growth table, like
+    transform(rows, 'growth').
+
+    Args:
+        blocks (list): The four average rows of each ticker.
+
+    Returns:
+        list: Selected values per ticker.
+    """
+    return select_growth(*parse_blocks(blocks, 4))
+
+
+def select_growth(matrix: np.ndarray, lengths: np.ndarray):
+    """The growth values INDEXES selects from the YoY, 3, 5 and 10-year
+    average rows.
+
+    Args:
+        matrix (np.ndarray): (tickers, 4, width) right-aligned rows.
+        lengths (np.ndarray): (tickers, 4) values per row.
+
+    Returns:
+        list: Selected values per ticker.
+    """
+    idxs, counts = select_indexes(lengths[:, 0])
+    tickers = np.arange(len(matrix))[:, None]
+    values = matrix[tickers, GROWTH_ORDER[:idxs.shape[1]], matrix.shape[2] + idxs]
+    return split_selected(values, counts)
+
+
+def parse_first_row(blocks: list, cash_flow: bool = False):
+    """Vectorized financial health or cash flow values, like
+    transform(rows, 'fin_health') and transform(rows, 'cash_flow').
+
+    Args:
+        blocks (list): Section lines of each ticker.
+        cash_flow (bool, optional): Return only the latest value.
+                                    Defaults to False.
+
+    Returns:
+        list: Selected values, or the latest value, per ticker.
+    """
+    matrix, lengths = parse_blocks(blocks, 1)
+    return select_first_row(matrix[:, 0], lengths[:, 0], cash_flow)
+
+
+def select_first_row(matrix: np.ndarray, lengths: np.ndarray, cash_flow: bool = False):
+    """The financial health values INDEXES selects, or the latest cash flow.
+
+    Args:
+        matrix (np.ndarray): (tickers, width) right-aligned rows.
+        lengths (np.ndarray): Values per row.
+        cash_flow (bool, optional): Return only the latest value.
+                                    Defaults to False.
+
+    Returns:
+        list: Selected values, or the latest value, per ticker.
+    """
+    idxs, counts = select_indexes(lengths)
+    width = matrix.shape[1]
+    if cash_flow:
+        latest = matrix[:, width - 2].tolist()
+        return [value if count else None for value, count in zip(latest, counts.tolist())]
+    values = matrix[np.arange(len(matrix))[:, None], width + idxs]
+    return split_selected(values, counts)
+
+
+def parse_op_eff_rows(lines: list):
+    """Vectorized scrape_data_format2 for one row per ticker: the averages of
+    the years since each selected year, and the latest value.
+
+    Args:
+        lines (list): "Return on ..." line of each ticker.
+
+    Returns:
+        list: Selected values per ticker.
+    """
+    matrix, lengths = parse_matrix(lines)
+    return select_op_eff(matrix[:, :-1], lengths - 1)  # Discard "5-Yr" column
+
+
+def select_op_eff(matrix: np.ndarray, lengths: np.ndarray):
+    """The averages of the years since each selected year, and the latest
+    value, of right-aligned operating efficiency rows.
+
+    Args:
+        matrix (np.ndarray): (tickers, width) rows of yearly values and TTM.
+        lengths (np.ndarray): Values per row.
+
+    Returns:
+        list: Selected values per ticker.
+    """
+    idxs, counts = select_indexes(lengths)
+    width = matrix.shape[1]
+
+    values = np.full(idxs.shape, np.nan)
+    used = np.arange(idxs.shape[1]) < counts[:, None]
+    latest = used & (np.arange(idxs.shape[1]) == counts[:, None] - 1)
+    values[latest] = np.broadcast_to(matrix[:, width - 2, None], idxs.shape)[latest]
+
+    # Averages are grouped by window so each one is summed exactly like
+    # np.nanmean over the same slice
+    averaged = used & ~latest
+    for start in np.unique(idxs[averaged]):
+        rows, cols = np.nonzero(averaged & (idxs == start))
+        window = matrix[rows[:, None], width + start + np.arange(-start - 1)]
+        values[rows, cols] = np.nanmean(window, axis=1)
+    return split_selected(values, counts)
+
+
+def parse_batch(batch: list):
+    """Fast parse_section_lines for many tickers at once.
+
+    Args:
+        batch (list): Per ticker, a dict of key in SECTION_KEYS -> section
+                      text split by lines. None for missing sections.
+
+    Returns:
+        list: Per ticker, a dict of rev, eps, growth_yrs, roe, roic,
+              op_eff_yrs, bvps and fcfps. Values of missing sections are None.
+    """
+    results = [dict.fromkeys(SECTION_FIELDS) for _ in batch]
+
+    def having(*keys):
+        return [i for i, lines in enumerate(batch)
+                if all(lines.get(key) is not None for key in keys)]
+
+    growth = having('growth')
+    if growth:
+        sections = [batch[i]['growth'] for i in growth]
+        columns = zip(parse_growth([lines[1:5] for lines in sections]),
+                      parse_growth([lines[-4:] for lines in sections]),
+                      parse_years([lines[0].split()[2:-2] for lines in sections]))
+        for i, (rev, eps, years) in zip(growth, columns):
+            results[i].update(rev=rev, eps=eps, growth_yrs=years)
+
+    op_eff = having('op_eff_years', 'op_eff')
+    if op_eff:
+        roe = parse_op_eff_rows([batch[i]['op_eff'][6] for i in op_eff])
+        roic = parse_op_eff_rows([batch[i]['op_eff'][7] for i in op_eff])
+        years = parse_years([batch[i]['op_eff_years'][1:-2] for i in op_eff])
+        for i, values in zip(op_eff, zip(roe, roic, years)):
+            results[i].update(zip(('roe', 'roic', 'op_eff_yrs'), values))
+
+    for key, field, cash_flow in (('fin_health', 'bvps', False), ('cash_flow', 'fcfps', True)):
+        tickers = having(key)
+        if tickers:
+            values = parse_first_row([batch[i][key] for i in tickers], cash_flow)
+            for i, value in zip(tickers, values):
+                results[i][field] = value
+    return results
+
+
+def parse_section_lines(lines: dict):
+    """Fast drop-in for valuation.parse_section_lines_reference.
+
+    Args:
+        lines (dict): Key in SECTION_KEYS -> section text split by lines.
+                      None for missing sections.
+
+    Returns:
+        dict: rev, eps, growth_yrs, roe, roic, op_eff_yrs, bvps and fcfps.
+              Values of missing sections are None.
+    """
+    return parse_batch([lines])[0]
@@ -0,0 +1,212 @@
+"""Concurrent fetching of yahoo_fin fundamentals with asyncio.
+
+All requests for a batch of tickers share one pooled aiohttp session and run
+concurrently up to a limit. Responses are parsed into the same shapes
+yahoo_fin.stock_info returns and stored in a FundamentalsCache, so the
+valuation functions read them without making more requests. The base URLs
+can be pointed at a local stub server.
+"""
+import asyncio
+import json
+import re
+
+import pandas as pd
+
+from fundamentals import LOADERS
+from resilience import RESILIENCE, TransientError
+
+QUOTE_URL = 'https://query1.finance.yahoo.com/v7/finance/quote'
+PAGE_URL = 'https://finance.yahoo.com/quote'
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 '
+                  '(KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36'
+}
+CONCURRENCY = 8
+QUOTE_BATCH = 50  # Symbols per quote request
+TIMEOUT = 30  # Seconds
+
+# Statement -> (page, key in QuoteSummaryStore, key of the yearly rows)
+PAGES = {
+    'income_statement': ('financials', 'incomeStatementHistory', 'incomeStatementHistory'),
+    'balance_sheet': ('balance-sheet', 'balanceSheetHistory', 'balanceSheetStatements'),
+    'cash_flow': ('cash-flow', 'cashflowStatementHistory', 'cashflowStatements'),
+    'company_info': ('profile', 'assetProfile', None),
+}
+
+
+def parse_quote_summary(html: str):
+    """Extracts the QuoteSummaryStore JSON embedded in a Yahoo quote page.
+
+    Args:
+        html (str): Page text.
+
+    Returns:
+        dict: Quote summary with raw values unwrapped. Empty if missing.
+    """
+    try:
+        json_str = html.split('root.App.main =')[1].split(
+            '(this)')[0].split(';\n}')[0].strip()
+        data = json.loads(json_str)['context']['dispatcher']['stores']['QuoteSummaryStore']
+    except (IndexError, KeyError, ValueError):
+        return {}
+    data = json.dumps(data).replace('{}', 'null')
+    data = re.sub(r'\{[\'|\"]raw[\'|\"]:(.*?),(.*?)\}', r'\1', data)
+    return json.loads(data)
+
+
+def parse_statement(summary: dict, statement: str):
+    """Builds a statement table from a quote summary.
+
+    Args:
+        summary (dict): Output of parse_quote_summary.
+        statement (str): Key in PAGES.
+
+    Returns:
+        pd.DataFrame: Statement with one column per fiscal year end, or the
+                      company profile with a "Value" column.
+    """
+    _, store, rows = PAGES[statement]
+    if statement == 'company_info':
+        info = dict(summary[store])
+        info.pop('companyOfficers', None)
+        frame = pd.DataFrame.from_dict(info, orient='index', columns=['Value'])
+        frame.index.name = 'Breakdown'
+        return frame
+
+    df = pd.DataFrame((summary.get(store) or {}).get(rows, []))
+    if df.empty:
+        return df
+    df = df.drop(columns='maxAge', errors='ignore').set_index('endDate')
+    df.index = pd.to_datetime(df.index, unit='s')
+    df = df.transpose()
+    df.index.name = 'Breakdown'
+    return df
+
+
+class FundamentalsFetcher:
+    """Fetches fundamentals for many tickers over one pooled HTTP session.
+
+    Args:
+        concurrency (int, optional): Requests in flight at once.
+                                     Defaults to CONCURRENCY.
+        quote_url (str, optional): Quote API endpoint. Defaults to QUOTE_URL.
+        page_url (str, optional): Base of the quote pages. Defaults to PAGE_URL.
+        timeout (float, optional): Seconds per request. Defaults to TIMEOUT.
+    """
+
+    def __init__(self, concurrency: int = CONCURRENCY, quote_url: str = QUOTE_URL,
+                 page_url: str = PAGE_URL, timeout: float = TIMEOUT):
+        self.concurrency = concurrency
+        self.quote_url = quote_url
+        self.page_url = page_url.rstrip('/')
+        self.timeout = timeout
+
+    async def fetch(self, tickers: list, statements: list = None):
+        """Fetches statements for every ticker concurrently.
+
+        Args:
+            tickers (list): Ticker symbols.
+            statements (list, optional): Keys in fundamentals.LOADERS.
+                                         Defaults to all of them.
+
+        Returns:
+            dict: (ticker, statement) -> statement, or the exception raised
+                  while fetching it.
+        """
+        import aiohttp
+
+        statements = list(LOADERS) if statements is None else statements
+        tickers = list(dict.fromkeys(tickers))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=HEADERS) as session:
+            jobs = []
+            if 'quote' in statements:
+                for start in range(0, len(tickers), QUOTE_BATCH):
+                    jobs.append(self._quotes(session, semaphore, tickers[start:start+QUOTE_BATCH]))
+
+            pages = {}  # One request per (ticker, page) even if pages are shared
+            for ticker in tickers:
+                for statement in statements:
+                    if statement in PAGES:
+                        pages.setdefault((ticker, PAGES[statement][0]), []).append(statement)
+            for (ticker, page), page_statements in pages.items():
+                jobs.append(self._page(session, semaphore, ticker, page, page_statements))
+
+            results = {}
+            for batch in await asyncio.gather(*jobs):
+                results.update(batch)
+            return results
+
+    async def _get(self, session, semaphore, url: str, params: dict = None):
+        import aiohttp
+
+        # The semaphore is taken per attempt, so a request waiting out a
+        # backoff doesn't hold a concurrency slot
+        return await RESILIENCE.guard('yahoo').call_async(
+            self._request, session, semaphore, url, params,
+            retry_on=(TransientError, aiohttp.ClientConnectionError, asyncio.TimeoutError)
+        )
+
+    async def _request(self, session, semaphore, url: str, params: dict = None):
+        async with semaphore, session.get(url, params=params) as resp:
+            if resp.status == 429 or resp.status >= 500:
+                raise TransientError(f'HTTP {resp.status} from {url}')
+            resp.raise_for_status()
+            return await resp.text()
+
+    async def _quotes(self, session, semaphore, tickers: list):
+        try:
+            text = await self._get(session, semaphore, self.quote_url,
+                                   params={'symbols': ','.join(tickers)})
+            quotes = {quote.get('symbol'): quote
+                      for quote in json.loads(text)['quoteResponse']['result']}
+        except Exception as err:
+            return {(ticker, 'quote'): err for ticker in tickers}
+        return {(ticker, 'quote'): quotes.get(ticker, KeyError(ticker)) for ticker in tickers}
+
+    async def _page(self, session, semaphore, ticker: str, page: str, statements: list):
+        try:
+            text = await self._get(session, semaphore, f'{self.page_url}/{ticker}/{page}',
+                                   params={'p': ticker})
+            summary = parse_quote_summary(text)
+        except Exception as err:
+            return {(ticker, statement): err for statement in statements}
+
+        results = {}
+        for statement in statements:
+            try:
+                results[(ticker, statement)] = parse_statement(summary, statement)
+            except (KeyError, TypeError, ValueError) as err:
+                results[(ticker, statement)] = err
+        return results
+
+
+def prefetch(tickers: list, cache, fetcher: FundamentalsFetcher = None,
+             statements: list = None):
+    """Fetches fundamentals for a batch of tickers concurrently and stores
+    them in a cache. Failed statements are left for the cache to load itself.
+
+    Args:
+        tickers (list): Ticker symbols.
+        cache (FundamentalsCache): Cache to fill.
+        fetcher (FundamentalsFetcher, optional): Fetcher to use.
+                                                 Defaults to FundamentalsFetcher().
+        statements (list, optional): Keys in fundamentals.LOADERS.
+                                     Defaults to all of them.
+
+    Returns:
+        dict: (ticker, statement) -> exception for every failed fetch.
+    """
+    fetcher = FundamentalsFetcher() if fetcher is None else fetcher
+    results = asyncio.run(fetcher.fetch(tickers, statements))
+    errors = {}
+    for (ticker, statement), value in results.items():
+        if isinstance(value, Exception):
+            errors[(ticker, statement)] = value
+        else:
+            cache.put(ticker, statement, value)
+    return errors
@@ -0,0 +1,204 @@
+"""Per-ticker cache of the yahoo_fin fundamentals used by the valuations.
+
+Every statement is loaded once per ticker and kept in memory with a TTL and an
+LRU size bound. Entries are also written to disk, so repeat runs during the
+day reuse them instead of making the same HTTP requests again. Quotes carry
+the market price, so they expire after minutes instead of hours. Threads
+missing the same entry wait for one load instead of each making the request.
+"""
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import METRICS
+from resilience import RESILIENCE
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'fundamentals')
+CACHE_TTL = 12 * 60 * 60  # Seconds
+QUOTE_TTL = 5 * 60  # Seconds a quote, and so its price, is reused for
+CACHE_SIZE = 512  # Entries held in memory
+
+# Statement name -> yahoo_fin.stock_info loader
+LOADERS = {
+    'quote': 'get_quote_data',
+    'income_statement': 'get_income_statement',
+    'cash_flow': 'get_cash_flow',
+    'balance_sheet': 'get_balance_sheet',
+    'company_info': 'get_company_info',
+}
+
+
+class FundamentalsCache:
+    """Loads yahoo_fin statements once per ticker and caches them.
+
+    Args:
+        ttl (float, optional): Seconds an entry stays fresh. Defaults to CACHE_TTL.
+        quote_ttl (float, optional): Seconds a quote stays fresh, at most ttl.
+                                     Defaults to QUOTE_TTL.
+        maxsize (int, optional): Entries kept in memory. Defaults to CACHE_SIZE.
+        cache_dir (str, optional): Directory of the on-disk store. None keeps
+                                   the cache in memory only. Defaults to None.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL, quote_ttl: float = QUOTE_TTL,
+                 maxsize: int = CACHE_SIZE, cache_dir: str = None):
+        self.ttl = ttl
+        self.quote_ttl = quote_ttl
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}  # key -> lock held while the entry is loaded
+
+    def configure(self, ttl: float = None, quote_ttl: float = None,
+                  maxsize: int = None, cache_dir: str = None):
+        """Changes the cache settings. Arguments left as None are unchanged.
+
+        Args:
+            ttl (float, optional): Seconds an entry stays fresh.
+            quote_ttl (float, optional): Seconds a quote stays fresh.
+            maxsize (int, optional): Entries kept in memory.
+            cache_dir (str, optional): Directory of the on-disk store.
+        """
+        with self._lock:
+            if ttl is not None:
+                self.ttl = ttl
+            if quote_ttl is not None:
+                self.quote_ttl = quote_ttl
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if cache_dir is not None:
+                self.cache_dir = cache_dir
+            self._evict()
+
+    def get(self, ticker: str, statement: str):
+        """Gets a statement for a ticker from memory, disk or yahoo_fin.
+
+        Args:
+            ticker (str): Ticker symbol.
+            statement (str): Key in LOADERS.
+
+        Returns:
+            Any: The value yahoo_fin returns for the statement.
+        """
+        key = (ticker, statement)
+        entry = self._cached(key)
+        if entry is not None:
+            return entry[1]
+
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+        try:
+            with loading:
+                # Loaded by another thread while this one waited
+                entry = self._cached(key)
+                if entry is not None:
+                    return entry[1]
+
+                now = time.time()
+                entry = self._read(key)
+                if entry is None or now - entry[0] >= self.ttl_of(statement):
+                    self.misses += 1
+                    entry = (now, self.load(ticker, statement))
+                    self._write(key, entry)
+                else:
+                    self.hits += 1
+                self._remember(key, entry)
+                return entry[1]
+        finally:
+            with self._lock:
+                if self._loading.get(key) is loading:
+                    del self._loading[key]
+
+    def put(self, ticker: str, statement: str, value):
+        """Stores a statement fetched elsewhere, e.g. by fetch.prefetch.
+
+        Args:
+            ticker (str): Ticker symbol.
+            statement (str): Key in LOADERS.
+            value (Any): The statement, shaped like yahoo_fin returns it.
+        """
+        key = (ticker, statement)
+        entry = (time.time(), value)
+        self._write(key, entry)
+        self._remember(key, entry)
+
+    def ttl_of(self, statement: str):
+        """Seconds a statement stays fresh.
+
+        Args:
+            statement (str): Key in LOADERS.
+
+        Returns:
+            float: quote_ttl for quotes, capped at ttl, or ttl.
+        """
+        return min(self.ttl, self.quote_ttl) if statement == 'quote' else self.ttl
+
+    def load(self, ticker: str, statement: str):
+        """Fetches a statement from yahoo_fin, bypassing the cache. Calls go
+        through the shared yahoo rate limiter, retries and circuit breaker.
+
+        Args:
+            ticker (str): Ticker symbol.
+            statement (str): Key in LOADERS.
+
+        Returns:
+            Any: The value yahoo_fin returns for the statement.
+        """
+        import yahoo_fin.stock_info as si
+
+        with METRICS.stage(f'yahoo.{statement}'):
+            return RESILIENCE.call('yahoo', getattr(si, LOADERS[statement]), ticker)
+
+    def clear(self):
+        """Empties the in-memory cache. Files on disk are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def _cached(self, key: tuple):
+        """Fresh entry in memory, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] < self.ttl_of(key[1]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        return None
+
+    def _remember(self, key: tuple, entry: tuple):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > max(0, self.maxsize):
+            self._entries.popitem(last=False)
+
+    def _path(self, key: tuple):
+        ticker, statement = key
+        ticker = ticker.replace(os.sep, '_').replace('/', '_')
+        return os.path.join(self.cache_dir, ticker, f'{statement}.pkl')
+
+    def _read(self, key: tuple):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._path(key), 'rb') as file:
+                return pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _write(self, key: tuple, entry: tuple):
+        if self.cache_dir is None:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(entry, file)
+        os.replace(tmp_path, path)
@@ -0,0 +1,152 @@
+"""Exchange rate table used to convert prices between currencies.
+
+Rates for each base currency are loaded once from forex_python and cached with
+a TTL. Whole arrays, Series or DataFrame columns are converted with a single
+multiplication. Rates can also be pinned from a JSON file so runs are
+reproducible and make no network calls.
+"""
+import json
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from resilience import RESILIENCE
+
+FX_TTL = 60 * 60  # Seconds
+QUOTE_CURR = 'CAD'
+
+
+class FxRates:
+    """Cached table of exchange rates keyed by base currency.
+
+    Args:
+        ttl (float, optional): Seconds loaded rates stay fresh. Defaults to FX_TTL.
+        pinned (dict, optional): Fixed rates as {base: {quote: rate}}. When
+                                 given, no rates are fetched. Defaults to None.
+    """
+
+    def __init__(self, ttl: float = FX_TTL, pinned: dict = None):
+        self.ttl = ttl
+        self.pinned = pinned
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str):
+        """Creates a table with rates pinned from a JSON file.
+
+        Args:
+            path (str): JSON file shaped like {base: {quote: rate}}.
+
+        Returns:
+            FxRates: Offline rate table.
+        """
+        table = cls()
+        table.pin(path)
+        return table
+
+    def pin(self, path: str):
+        """Pins rates from a JSON file. No rates are fetched afterwards.
+
+        Args:
+            path (str): JSON file shaped like {base: {quote: rate}}.
+        """
+        with open(path) as file:
+            self.pinned = json.load(file)
+
+    def save(self, path: str, bases: list = None):
+        """Writes rates to a JSON file that from_file can pin later.
+
+        Args:
+            path (str): File to write.
+            bases (list, optional): Base currencies to write. Defaults to every
+                                    base loaded so far.
+        """
+        if bases is None:
+            bases = self.pinned.keys() if self.pinned is not None else self._tables.keys()
+        table = {base: self.rates(base) for base in bases}
+        with open(path, 'w') as file:
+            json.dump(table, file, indent=2, sort_keys=True)
+
+    def rates(self, base: str):
+        """Gets every rate for a base currency.
+
+        Args:
+            base (str): Base currency code.
+
+        Returns:
+            dict: Quote currency -> rate.
+        """
+        if self.pinned is not None:
+            if base not in self.pinned:
+                raise KeyError(f'No pinned exchange rates for {base}')
+            return self.pinned[base]
+
+        now = time.time()
+        with self._lock:
+            entry = self._tables.get(base)
+        if entry is None or now - entry[0] >= self.ttl:
+            from forex_python.converter import CurrencyRates, RatesNotAvailableError
+
+            rates = RESILIENCE.call('forex', CurrencyRates().get_rates, base,
+                                    retry_on=(OSError, RatesNotAvailableError))
+            entry = (now, rates)
+            with self._lock:
+                self._tables[base] = entry
+        return entry[1]
+
+    def rate(self, base: str, quote: str = QUOTE_CURR):
+        """Gets the rate converting base into quote currency.
+
+        Args:
+            base (str): Base currency code.
+            quote (str, optional): Quote currency code. Defaults to QUOTE_CURR.
+
+        Returns:
+            float: Exchange rate.
+        """
+        if base == quote:
+            return 1.0
+        rate = self.rates(base).get(quote)
+        if rate is None:
+            raise KeyError(f'No exchange rate from {base} to {quote}')
+        return rate
+
+    def convert(self, values, base: str, quote: str = QUOTE_CURR):
+        """Converts values from base into quote currency.
+
+        Args:
+            values (int | float | list | np.ndarray | pd.Series | pd.DataFrame):
+                Values to convert.
+            base (str): Base currency code.
+            quote (str, optional): Quote currency code. Defaults to QUOTE_CURR.
+
+        Returns:
+            Converted values of the same shape. Lists become arrays.
+        """
+        rate = self.rate(base, quote)
+        if isinstance(values, (list, tuple)):
+            values = np.asarray(values, dtype=np.float64)
+        return values * rate
+
+    def convert_columns(self, df: pd.DataFrame, columns: list, currency: str,
+                        quote: str = QUOTE_CURR):
+        """Converts DataFrame columns where each row is in the currency given
+        by another column. Each base currency is looked up once.
+
+        Args:
+            df (pd.DataFrame): Data to convert.
+            columns (list): Columns holding amounts.
+            currency (str): Column holding each row's currency code.
+            quote (str, optional): Quote currency code. Defaults to QUOTE_CURR.
+
+        Returns:
+            pd.DataFrame: Copy of df with the columns converted.
+        """
+        bases = df[currency].unique()
+        rates = df[currency].map({base: self.rate(base, quote) for base in bases})
+        converted = df.copy()
+        converted[columns] = df[columns].mul(rates.to_numpy(dtype=np.float64), axis=0)
+        return converted
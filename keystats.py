@@ -0,0 +1,319 @@
+"""Morningstar key stats over plain HTTP/JSON, without a browser.
+
+The valuation page fills its growth, operating and efficiency, financial
+health and cash flow tables from a JSON API. Here those four tables are
+requested directly, concurrently over one pooled aiohttp session, and their
+yearly values are laid out like the rows the page shows: fiscal years oldest
+first, then TTM. The fastparse INDEXES selection then gives the same rev,
+eps, growth_yrs, roe, roic, op_eff_yrs, bvps and fcfps the browser scrapers
+get, so valuation doesn't change.
+
+The API is keyed by a performance ID, which is looked up by ticker through
+the search endpoint. Both URLs can be pointed at a local stub server.
+"""
+import asyncio
+import os
+import time
+
+from fastparse import (SECTION_FIELDS, align_rows, select_first_row, select_growth,
+                       select_op_eff, select_years)
+from fetch import HEADERS, TIMEOUT
+from metrics import METRICS
+from resilience import RESILIENCE, TransientError
+
+BASE_URL = 'https://api-global.morningstar.com/sal-service/v1/stock'
+SEARCH_URL = 'https://www.morningstar.com/api/v2/search/securities'
+API_KEY = os.environ.get('MORNINGSTAR_API_KEY')
+PARAMS = {'languageId': 'en', 'locale': 'en', 'clientId': 'MDC', 'version': '3.x'}
+CONCURRENCY = 16
+CHUNK = 50  # Tickers fetched per batch of requests
+TITLE = '{ticker} {name} | Valuation'  # Same shape as the page title
+
+# Section -> endpoint of its table, as named by the page's LOCATORS
+TABLES = {
+    'growth': 'keyStats/growthTable',
+    'op_eff': 'keyStats/OperatingAndEfficiency',
+    'fin_health': 'keyStats/financialHealth',
+    'cash_flow': 'keyStats/cashFlow',
+}
+
+# Where values are in each entry of a table's dataList
+PERIOD = 'fiscalPeriodYear'
+TTM = 'TTM'
+AVERAGES = ['yearOverYear', 'threeYearAverage', 'fiveYearAverage', 'tenYearAverage']
+GROWTH_PATHS = [(field, average) for field in ('revenuePer', 'epsPer') for average in AVERAGES]
+OP_EFF_PATHS = [('roe',), ('roic',)]
+FIN_HEALTH_PATHS = [('bookValuePerShare',)]
+CASH_FLOW_PATHS = [('freeCashFlowPerShare',)]
+
+
+def number(value):
+    """Converts a JSON value to float. None for missing or invalid values."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def value_at(entry: dict, path: tuple):
+    """Gets a nested value of a table entry.
+
+    Args:
+        entry (dict): Entry of a dataList.
+        path (tuple): Keys leading to the value.
+
+    Returns:
+        float: The value. None if it is missing.
+    """
+    for key in path:
+        if not isinstance(entry, dict):
+            return None
+        entry = entry.get(key)
+    return number(entry)
+
+
+def table_rows(table: dict, paths: list):
+    """Lays out a key stats table like the page: one value per fiscal year,
+    oldest first, then TTM.
+
+    Args:
+        table (dict): Key stats JSON.
+        paths (list): Path of each row's values in the entries.
+
+    Returns:
+        tuple: Fiscal years and the rows. Values are None for NA.
+    """
+    periods = {}
+    for entry in table.get('dataList') or []:
+        if isinstance(entry, dict):
+            periods[str(entry.get(PERIOD))] = entry
+    years = sorted(int(period) for period in periods if period.isdigit())
+    columns = [periods[str(year)] for year in years] + [periods.get(TTM, {})]
+    return years, [[value_at(entry, path) for entry in columns] for path in paths]
+
+
+def parse_batch(batch: list):
+    """Maps the key stats tables of many tickers into what
+    valuation.parse_section_lines returns for their pages.
+
+    Args:
+        batch (list): Per ticker, a dict of key in TABLES -> JSON. None for
+                      missing tables.
+
+    Returns:
+        list: Per ticker, a dict of rev, eps, growth_yrs, roe, roic,
+              op_eff_yrs, bvps and fcfps. Values of missing tables are None.
+    """
+    results = [dict.fromkeys(SECTION_FIELDS) for _ in batch]
+
+    def laid_out(key, paths):
+        tickers = [i for i, tables in enumerate(batch) if tables.get(key) is not None]
+        return tickers, [table_rows(batch[i][key], paths) for i in tickers]
+
+    growth, tables = laid_out('growth', GROWTH_PATHS)
+    if growth:
+        matrix, lengths = align_rows([row for _, rows in tables for row in rows])
+        matrix = matrix.reshape(len(growth), 2, len(AVERAGES), -1)
+        lengths = lengths.reshape(len(growth), 2, len(AVERAGES))
+        columns = zip(select_growth(matrix[:, 0], lengths[:, 0]),
+                      select_growth(matrix[:, 1], lengths[:, 1]),
+                      select_years(*align_rows([years for years, _ in tables])))
+        for i, (rev, eps, years) in zip(growth, columns):
+            results[i].update(rev=rev, eps=eps, growth_yrs=years)
+
+    op_eff, tables = laid_out('op_eff', OP_EFF_PATHS)
+    if op_eff:
+        roe = select_op_eff(*align_rows([rows[0] for _, rows in tables]))
+        roic = select_op_eff(*align_rows([rows[1] for _, rows in tables]))
+        years = select_years(*align_rows([years for years, _ in tables]))
+        for i, values in zip(op_eff, zip(roe, roic, years)):
+            results[i].update(zip(('roe', 'roic', 'op_eff_yrs'), values))
+
+    for key, paths, field, cash_flow in (('fin_health', FIN_HEALTH_PATHS, 'bvps', False),
+                                         ('cash_flow', CASH_FLOW_PATHS, 'fcfps', True)):
+        tickers, tables = laid_out(key, paths)
+        if tickers:
+            values = select_first_row(*align_rows([rows[0] for _, rows in tables]), cash_flow)
+            for i, value in zip(tickers, values):
+                results[i][field] = value
+    return results
+
+
+def link_symbol(link: str):
+    """Gets the exchange and ticker of a Morningstar stock link, e.g.
+    https://www.morningstar.com/stocks/xnas/aapl/valuation -> (XNAS, AAPL).
+
+    Args:
+        link (str): Stock link.
+
+    Returns:
+        tuple: Exchange and ticker symbol.
+    """
+    exchange, ticker = link.rstrip('/').split('/')[-3:-1]
+    return exchange.upper(), ticker.upper()
+
+
+class KeyStatsSource:
+    """Fetches the key stats of many stocks over one pooled HTTP session.
+
+    Args:
+        base_url (str, optional): Key stats API. Defaults to BASE_URL.
+        search_url (str, optional): Security search endpoint. Defaults to SEARCH_URL.
+        api_key (str, optional): Key sent in the apikey header. Defaults to
+                                 the MORNINGSTAR_API_KEY environment variable.
+        concurrency (int, optional): Requests in flight at once.
+                                     Defaults to CONCURRENCY.
+        timeout (float, optional): Seconds per request. Defaults to TIMEOUT.
+    """
+
+    def __init__(self, base_url: str = BASE_URL, search_url: str = SEARCH_URL,
+                 api_key: str = API_KEY, concurrency: int = CONCURRENCY,
+                 timeout: float = TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.search_url = search_url
+        self.api_key = api_key
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.securities = {}  # (exchange, ticker) -> (performance ID, name) or LookupError
+
+    async def fetch(self, links: list):
+        """Fetches the tables of every link concurrently.
+
+        Args:
+            links (list): Morningstar valuation pages.
+
+        Returns:
+            dict: Link -> (title, dict of key in TABLES -> JSON or None), or
+                  the exception raised while fetching it.
+        """
+        import aiohttp
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        headers = dict(HEADERS, apikey=self.api_key) if self.api_key else HEADERS
+        lookups = {}  # (exchange, ticker) -> search task of this event loop
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=headers) as session:
+            links = list(dict.fromkeys(links))
+            results = await asyncio.gather(
+                *(self._stock(session, semaphore, lookups, link) for link in links),
+                return_exceptions=True
+            )
+        return dict(zip(links, results))
+
+    async def _get(self, session, semaphore, url: str, params: dict = None):
+        import aiohttp
+
+        # The semaphore is taken per attempt, so a request waiting out a
+        # backoff doesn't hold a concurrency slot
+        return await RESILIENCE.guard('keystats').call_async(
+            self._request, session, semaphore, url, params,
+            retry_on=(TransientError, aiohttp.ClientConnectionError, asyncio.TimeoutError)
+        )
+
+    async def _request(self, session, semaphore, url: str, params: dict = None):
+        async with semaphore, session.get(url, params=params) as resp:
+            if resp.status == 429 or resp.status >= 500:
+                raise TransientError(f'HTTP {resp.status} from {url}')
+            if resp.status == 404:
+                raise LookupError(f'Not found: {url}')
+            resp.raise_for_status()
+            return await resp.json(content_type=None)
+
+    async def _security(self, session, semaphore, lookups: dict, exchange: str, ticker: str):
+        """Looks up the performance ID and name of a stock, once per run.
+        Concurrent lookups of the same stock share one search, and stocks
+        that aren't found aren't searched again."""
+        key = (exchange, ticker)
+        if key not in self.securities:
+            if key not in lookups:
+                lookups[key] = asyncio.ensure_future(
+                    self._search(session, semaphore, exchange, ticker))
+            try:
+                self.securities[key] = await lookups[key]
+            except LookupError as err:
+                self.securities[key] = err
+        security = self.securities[key]
+        if isinstance(security, LookupError):
+            raise LookupError(*security.args)
+        return security
+
+    async def _search(self, session, semaphore, exchange: str, ticker: str):
+        found = await self._get(session, semaphore, self.search_url, {'q': ticker})
+        matches = [result for result in (found or {}).get('results') or []
+                   if str(result.get('ticker', '')).upper() == ticker]
+        matches.sort(key=lambda result: str(result.get('exchange', '')).upper() != exchange)
+        if not matches or not matches[0].get('performanceId'):
+            raise LookupError(f'{exchange}:{ticker} not found')
+        return matches[0]['performanceId'], matches[0].get('name') or ticker
+
+    async def _stock(self, session, semaphore, lookups: dict, link: str):
+        exchange, ticker = link_symbol(link)
+        start = time.perf_counter()
+        performance_id, name = await self._security(session, semaphore, lookups,
+                                                    exchange, ticker)
+        responses = await asyncio.gather(
+            *(self._get(session, semaphore, f'{self.base_url}/{path}/{performance_id}', PARAMS)
+              for path in TABLES.values()),
+            return_exceptions=True
+        )
+        METRICS.record('scrape', time.perf_counter() - start, ticker)
+
+        errors = [resp for resp in responses if isinstance(resp, Exception)]
+        if len(errors) == len(responses):
+            raise errors[0]
+        tables = {}
+        for key, resp in zip(TABLES, responses):
+            if isinstance(resp, Exception):
+                METRICS.count('errors.keystats')
+                print(f'ERROR ~ Key stats failed at section: {key} of {ticker} ({resp})')
+                resp = None
+            tables[key] = resp if isinstance(resp, dict) else None
+        return TITLE.format(ticker=ticker, name=name), tables
+
+    def scrape_links(self, links: list, chunk: int = CHUNK):
+        """Fetches and parses links in chunks. A drop-in for
+        valuation.scrape_links that never starts a browser.
+
+        Stocks that can't be found or fetched, e.g. because the API refuses
+        a missing key, are yielded without data. They are skipped like pages
+        whose sections timed out, and the other stocks are still valued.
+
+        Args:
+            links (list): Morningstar valuation pages.
+            chunk (int, optional): Links fetched at once. Defaults to CHUNK.
+
+        Yields:
+            tuple: Stock name, moat dataframe, management dataframe and free
+                   cash flow per share for each link, in order.
+        """
+        from valuation import create_dataframes
+
+        for start in range(0, len(links), chunk):
+            batch = links[start:start + chunk]
+            with METRICS.stage('keystats'):
+                fetched = asyncio.run(self.fetch(batch))
+            found = [link for link in batch if not isinstance(fetched[link], Exception)]
+            parsed = dict(zip(found, parse_batch([fetched[link][1] for link in found])))
+            for link in batch:
+                result = fetched[link]
+                if isinstance(result, Exception):
+                    if isinstance(result, LookupError):
+                        print(f'ERROR ~ {result}')
+                    else:
+                        METRICS.count('errors.keystats')
+                        print(f'ERROR ~ Key stats failed for {link} ({result!r})')
+                    yield link_symbol(link)[1], None, None, None
+                    continue
+
+                sections = parsed[link]
+                moat, management = create_dataframes(
+                    sections['rev'], sections['eps'], sections['bvps'],
+                    sections['roe'], sections['roic'],
+                    sections['growth_yrs'], sections['op_eff_yrs']
+                )
+                yield result[0], moat, management, sections['fcfps']
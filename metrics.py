@@ -0,0 +1,284 @@
+"""Per-stage and per-ticker latency instrumentation.
+
+Stages are timed with the METRICS.stage context manager. The ticker being
+worked on is tracked per thread, so nested stages are attributed to it. At
+the end of a run the summary can be printed and written as JSON or in the
+Prometheus text format.
+
+Counts, totals and maxima are exact. Percentiles come from a uniform sample
+of at most RESERVOIR durations per stage, so memory stays bounded in
+long-lived processes like the valuation service.
+"""
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+RESERVOIR = 4096  # Durations kept per stage for percentiles
+
+
+class ThreadContext:
+    """Ticker and stages of one thread, and the exception its stages are
+    unwinding from, so it is counted once."""
+    __slots__ = ('ticker', 'stages', 'error')
+
+    def __init__(self):
+        self.ticker = None
+        self.stages = []
+        self.error = None
+
+
+class StageStats:
+    """Running aggregates of one stage's durations, with a reservoir sample
+    for percentiles.
+
+    Args:
+        size (int, optional): Durations kept in the sample. Defaults to RESERVOIR.
+    """
+    __slots__ = ('size', 'count', 'total', 'max', 'sample')
+
+    def __init__(self, size: int = RESERVOIR):
+        self.size = size
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.sample = []
+
+    def add(self, seconds: float):
+        """Adds a duration. Once the sample is full, each new duration
+        replaces a random one with probability size/count, so the sample
+        stays uniform over every duration seen."""
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if len(self.sample) < self.size:
+            self.sample.append(seconds)
+        else:
+            slot = random.randrange(self.count)
+            if slot < self.size:
+                self.sample[slot] = seconds
+
+
+class Metrics:
+    """Collects stage durations and event counts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.contexts = {}  # Thread ID -> ThreadContext, readable from other threads
+        self.reset()
+
+    def reset(self):
+        """Drops everything recorded so far."""
+        with self._lock:
+            self.durations = defaultdict(StageStats)
+            self.tickers = defaultdict(lambda: defaultdict(float))
+            self.counters = defaultdict(int)
+            self.started = time.time()
+
+    @property
+    def context(self):
+        """ThreadContext of the calling thread, registered on first use."""
+        context = getattr(self._local, 'context', None)
+        if context is None:
+            context = self._local.context = ThreadContext()
+            self.contexts[threading.get_ident()] = context
+        return context
+
+    def context_of(self, thread_id: int):
+        """ThreadContext of another thread. None if it never used METRICS."""
+        return self.contexts.get(thread_id)
+
+    @property
+    def current_ticker(self):
+        """Ticker the calling thread is working on, if any."""
+        return self.context.ticker
+
+    @property
+    def current_stages(self):
+        """Stages the calling thread is inside, outermost first."""
+        return self.context.stages
+
+    @contextmanager
+    def ticker(self, ticker: str):
+        """Attributes stages inside the block to a ticker.
+
+        Args:
+            ticker (str): Ticker symbol.
+        """
+        context = self.context
+        previous = context.ticker
+        context.ticker = ticker
+        try:
+            yield
+        finally:
+            context.ticker = previous
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times a block as a pipeline stage. Exceptions are counted as
+        errors of the stage and re-raised. An exception passing through
+        nested stages counts as an error of each stage but once in the
+        errors total.
+
+        Args:
+            name (str): Stage name.
+        """
+        context = self.context
+        stages = context.stages
+        stages.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as err:
+            if context.error is not err:
+                context.error = err
+                self.count('errors')
+            self.count(f'errors.{name}')
+            raise
+        finally:
+            stages.pop()
+            if not stages:
+                context.error = None
+            self.record(name, time.perf_counter() - start)
+
+    def timed(self, name: str):
+        """Decorator timing every call of a function as a stage.
+
+        Args:
+            name (str): Stage name.
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name: str, seconds: float, ticker: str = None):
+        """Records a stage duration.
+
+        Args:
+            name (str): Stage name.
+            seconds (float): Duration.
+            ticker (str, optional): Ticker. Defaults to the current ticker.
+        """
+        ticker = self.current_ticker if ticker is None else ticker
+        with self._lock:
+            self.durations[name].add(seconds)
+            if ticker is not None:
+                self.tickers[ticker][name] += seconds
+
+    def count(self, name: str, n: int = 1):
+        """Increments an event counter, e.g. timeouts or errors.
+
+        Args:
+            name (str): Counter name.
+            n (int, optional): Increment. Defaults to 1.
+        """
+        with self._lock:
+            self.counters[name] += n
+
+    def summary(self):
+        """Summarises every stage.
+
+        Returns:
+            dict: Stage -> count, total, p50, p95 and max seconds. The
+                  percentiles are estimated from each stage's sample.
+        """
+        with self._lock:
+            stages = {name: (stats.count, stats.total, stats.max, np.asarray(stats.sample))
+                      for name, stats in self.durations.items() if stats.count}
+        return {
+            name: {
+                'count': count,
+                'total': total,
+                'p50': float(np.percentile(sample, 50)),
+                'p95': float(np.percentile(sample, 95)),
+                'max': max_,
+            }
+            for name, (count, total, max_, sample) in sorted(stages.items())
+        }
+
+    def report(self):
+        """Prints the stage summary and counters."""
+        print(f'{"Stage":<32}{"Count":>7}{"p50 (s)":>10}{"p95 (s)":>10}{"Max (s)":>10}')
+        for name, stats in self.summary().items():
+            print(f'{name:<32}{stats["count"]:>7}{stats["p50"]:>10.3f}'
+                  f'{stats["p95"]:>10.3f}{stats["max"]:>10.3f}')
+        for name, value in sorted(self.counters.items()):
+            print(f'{name:<32}{value:>7}')
+
+    def to_dict(self):
+        """Everything recorded as JSON-serializable data.
+
+        Returns:
+            dict: started, elapsed, stages, counters and per-ticker totals.
+        """
+        with self._lock:
+            tickers = {ticker: dict(stages) for ticker, stages in self.tickers.items()}
+            counters = dict(self.counters)
+        return {
+            'started': self.started,
+            'elapsed': time.time() - self.started,
+            'stages': self.summary(),
+            'counters': counters,
+            'tickers': tickers,
+        }
+
+    def to_prometheus(self):
+        """Formats the summary in the Prometheus text exposition format.
+
+        Returns:
+            str: Metrics text.
+        """
+        lines = [
+            '# HELP valuation_stage_seconds Duration of pipeline stages.',
+            '# TYPE valuation_stage_seconds summary',
+        ]
+        summary = self.summary()
+        for name, stats in summary.items():
+            for quantile in ('0.5', '0.95'):
+                key = 'p50' if quantile == '0.5' else 'p95'
+                lines.append(f'valuation_stage_seconds{{stage="{name}",quantile="{quantile}"}} {stats[key]}')
+            lines.append(f'valuation_stage_seconds_sum{{stage="{name}"}} {stats["total"]}')
+            lines.append(f'valuation_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+        lines += [
+            '# HELP valuation_stage_seconds_max Slowest run of pipeline stages.',
+            '# TYPE valuation_stage_seconds_max gauge',
+        ]
+        lines += [f'valuation_stage_seconds_max{{stage="{name}"}} {stats["max"]}'
+                  for name, stats in summary.items()]
+        lines += [
+            '# HELP valuation_events_total Timeouts, errors and other events.',
+            '# TYPE valuation_events_total counter',
+        ]
+        with self._lock:
+            counters = sorted(self.counters.items())
+        lines += [f'valuation_events_total{{event="{name}"}} {value}' for name, value in counters]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str):
+        """Writes the metrics to a .json file or, for any other extension,
+        a Prometheus text file.
+
+        Args:
+            path (str): File to write.
+        """
+        if os.path.splitext(path)[1].lower() == '.json':
+            text = json.dumps(self.to_dict(), indent=2)
+        else:
+            text = self.to_prometheus()
+        with open(path, 'w') as file:
+            file.write(text)
+
+
+# Shared by every stage of the pipeline
+METRICS = Metrics()
@@ -0,0 +1,393 @@
+"""Command line and orchestration of a valuation run.
+
+Links come from the most viewed stocks, a universe file or a work queue.
+Their fundamentals can be prefetched concurrently, pages are scraped by
+Chrome workers or fetched from the key stats API, results can be reused from
+a store, and each record goes to the configured sinks, screener and per-year
+store as soon as it is valued. valuation.py keeps the scraping and pricing
+functions, so importing it doesn't load any of this.
+
+    python pipeline.py -w 4 --store -o results.jsonl
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from fetch import CONCURRENCY, FundamentalsFetcher, prefetch
+from metrics import METRICS
+from profiler import INTERVAL, PROFILE_DIR, Profiler
+from resilience import ATTEMPTS, BREAKER_FAILURES, BREAKER_RESET, RESILIENCE
+from screener import TARGETS, TOP_K, Screener
+from sinks import PrintSink, open_sink
+from store import MAX_AGE, STORE_DIR, ResultsStore
+from valuation import (FUNDAMENTALS, FX, ScraperSession, get_links, scrape_link,
+                       scrape_link_script, scrape_links, ticker_from_link, value_stock)
+from workqueue import (EXCHANGE, LEASE, MAX_ATTEMPTS, QUEUE_PATH, Heartbeat,
+                       WorkQueue, read_universe, worker_name)
+from yearstore import YEARS_DIR, YearStore
+
+
+def iter_valuations(links: list, workers: int = 1, store: ResultsStore = None,
+                    max_age: float = MAX_AGE, scraper=None, lean: bool = False,
+                    source=None):
+    """Scrapes and values each link, yielding a record per stock as soon as
+    it is ready. Records come in the same order as the links.
+
+    With a store, tickers scraped less than max_age seconds ago are rebuilt
+    from it instead of being scraped again; only their prices are recomputed.
+    New scrapes and all prices are saved to the store.
+
+    Args:
+        links (list): Morningstar valuation pages.
+        workers (int, optional): Number of Chrome workers. Defaults to 1.
+        store (ResultsStore, optional): Store of previous results. Defaults to None.
+        max_age (float, optional): Oldest scrape, in seconds, to reuse.
+                                   Defaults to MAX_AGE.
+        scraper (callable, optional): scrape_link or scrape_link_script.
+                                      Defaults to scrape_link.
+        lean (bool, optional): Use the lean browser profile. Defaults to False.
+        source (KeyStatsSource, optional): HTTP source of the key stats used
+                                           instead of Chrome. Defaults to None.
+
+    Yields:
+        dict: Valuation record from value_stock.
+    """
+    now = time.time()
+    fresh = set() if store is None else store.fresh_tickers(max_age, now)
+    stale = [link for link in links if ticker_from_link(link) not in fresh]
+    if source is not None:
+        scraped = source.scrape_links(stale)
+    else:
+        scraped = scrape_links(stale, workers, scraper, lean)
+    try:
+        for link in links:
+            ticker = ticker_from_link(link)
+            if ticker in fresh:
+                stock_name, moat, management, fcfps = store.load_scrape(ticker, max_age, now)
+            else:
+                stock_name, moat, management, fcfps = next(scraped)
+                if store is not None:
+                    store.save_scrape(ticker, stock_name, moat, management, fcfps)
+
+            if moat is not None or management is not None:
+                with METRICS.ticker(ticker), METRICS.stage('valuation'):
+                    record = value_stock(stock_name, moat, management, fcfps)
+                if store is not None:
+                    store.save_prices(record)
+                yield record
+    finally:
+        scraped.close()
+
+
+def prefetch_links(links: list, concurrency: int = CONCURRENCY):
+    """Prefetches the fundamentals of every link's ticker into FUNDAMENTALS.
+
+    Args:
+        links (list): Morningstar valuation pages.
+        concurrency (int, optional): Requests in flight. Defaults to CONCURRENCY.
+    """
+    tickers = [ticker_from_link(link) for link in links]
+    with METRICS.stage('prefetch'):
+        errors = prefetch(tickers, FUNDAMENTALS, FundamentalsFetcher(concurrency))
+    METRICS.count('errors.prefetch', len(errors))
+    if errors:
+        print(f'ERROR ~ {len(errors)} fundamentals could not be prefetched.')
+
+
+def iter_queue_valuations(queue: WorkQueue, worker: str = None, batch: int = None,
+                          workers: int = 1, concurrency: int = 0, **kwargs):
+    """Claims pages from a work queue and values them until the queue has
+    nothing left to claim. Leases are renewed by a heartbeat while pages are
+    being worked on. Pages of a batch that raised are returned to the queue
+    to be retried, one page per claim until a batch succeeds so a single bad
+    page doesn't use up the attempts of others. Held pages are released if
+    the run is interrupted.
+
+    Args:
+        queue (WorkQueue): Queue to pull pages from.
+        worker (str, optional): Worker ID. Defaults to worker_name().
+        batch (int, optional): Pages claimed at once. Defaults to four per
+                               Chrome worker.
+        workers (int, optional): Number of Chrome workers. Defaults to 1.
+        concurrency (int, optional): Fundamentals requests in flight while
+                                     prefetching each batch. 0 disables
+                                     prefetching. Defaults to 0.
+        **kwargs: store, max_age, scraper, lean and source for iter_valuations.
+
+    Yields:
+        dict: Valuation record from value_stock.
+    """
+    worker = worker_name() if worker is None else worker
+    batch = 4*max(1, workers) if batch is None else batch
+    size = batch
+    with Heartbeat(queue, worker):
+        try:
+            while True:
+                links = queue.claim(worker, size)
+                if not links:
+                    break
+                if concurrency > 0:
+                    prefetch_links(links, concurrency)
+
+                unfinished = {ticker_from_link(link): link for link in links}
+                try:
+                    for record in iter_valuations(links, workers, **kwargs):
+                        link = unfinished.pop(record['ticker'], None)
+                        if link is not None:
+                            queue.complete(link, worker)
+                        yield record
+                except Exception as err:
+                    METRICS.count('errors.queue')
+                    print(f'ERROR ~ Batch failed, returning {len(unfinished)} pages to the queue: {err}')
+                    for link in unfinished.values():
+                        queue.fail(link, worker, repr(err))
+                    size = 1
+                    continue
+                size = batch
+
+                # Pages without data are done too; scraping them again won't help
+                for link in unfinished.values():
+                    queue.complete(link, worker)
+        finally:
+            queue.release(worker)
+
+
+def main(workers: int = 1, concurrency: int = CONCURRENCY, outputs: list = (),
+         quiet: bool = False, store_dir: str = None, max_age: float = MAX_AGE,
+         extract: str = 'clicks', lean: bool = False, metrics_path: str = None,
+         links: list = None, queue: WorkQueue = None, worker: str = None,
+         batch: int = None, source=None, screener: Screener = None,
+         years_dir: str = None, profile_dir: str = None,
+         profile_interval: float = INTERVAL):
+    """Runs the entire pipeline to value a stock: data collection through webscraping,
+    data cleaning, data manipulation, and stock valuation. Prints the top 50 most
+    viewed stocks.
+
+    Args:
+        workers (int, optional): Number of Chrome workers scraping in parallel.
+                                 Defaults to 1.
+        concurrency (int, optional): Fundamentals requests in flight while
+                                     prefetching. 0 disables prefetching.
+                                     Defaults to CONCURRENCY.
+        outputs (list, optional): .jsonl, .csv or .parquet files records are
+                                  appended to. Defaults to ().
+        quiet (bool, optional): Skip printing the results. Defaults to False.
+        store_dir (str, optional): Directory of the results store. Enables
+                                   incremental refresh. Defaults to None.
+        max_age (float, optional): Oldest stored scrape, in seconds, reused
+                                   instead of scraping. Defaults to MAX_AGE.
+        extract (str, optional): 'clicks' reads each section through WebDriver
+                                 calls, 'script' reads all of them in one
+                                 script execution. Defaults to 'clicks'.
+        lean (bool, optional): Use the lean browser profile. Defaults to False.
+        metrics_path (str, optional): .json or Prometheus text file the stage
+                                      timings are written to. Defaults to None.
+        links (list, optional): Valuation pages to value, e.g. from a universe
+                                file. Defaults to the most viewed stocks.
+        queue (WorkQueue, optional): Work queue shared with other workers.
+                                     links are added to it, then pages are
+                                     claimed from it until none are left.
+                                     Without links, only queued pages are
+                                     valued. Defaults to None.
+        worker (str, optional): Worker ID in the queue. Defaults to worker_name().
+        batch (int, optional): Pages claimed from the queue at once.
+                               Defaults to four per Chrome worker.
+        source (KeyStatsSource, optional): HTTP source of the key stats used
+                                           instead of Chrome. The browser is
+                                           then only started to get the most
+                                           viewed stocks. Defaults to None.
+        screener (Screener, optional): Ranks records as they arrive and prints
+                                       the best ones at the end. Defaults to None.
+        years_dir (str, optional): Directory of the memory-mapped store the
+                                   per-year metrics are kept in. Defaults to None.
+        profile_dir (str, optional): Directory the sampled stacks of each
+                                     ticker and of the whole run are written
+                                     to. Defaults to None.
+        profile_interval (float, optional): Seconds between profile samples.
+                                            Defaults to INTERVAL.
+    """
+    profiler = Profiler(profile_interval).start() if profile_dir is not None else None
+    try:
+        start_time = time.time()
+        if links is None and queue is None:
+            with ScraperSession(lean=lean) as session, METRICS.stage('links'):
+                links = get_links(session.driver)
+
+        if queue is not None:
+            if links:
+                print(f'{queue.add(links)} new pages queued.')
+        elif concurrency > 0:
+            prefetch_links(links, concurrency)
+
+        store = ResultsStore(store_dir) if store_dir is not None else None
+        sinks = [open_sink(path) for path in outputs]
+        if not quiet:
+            sinks.append(PrintSink())
+        if screener is not None:
+            sinks.append(screener)
+        if years_dir is not None:
+            sinks.append(YearStore(years_dir))
+        valued = 0
+        try:
+            scraper = scrape_link_script if extract == 'script' else scrape_link
+            if queue is not None:
+                records = iter_queue_valuations(queue, worker, batch, workers, concurrency,
+                                                store=store, max_age=max_age,
+                                                scraper=scraper, lean=lean, source=source)
+            else:
+                records = iter_valuations(links, workers, store, max_age, scraper, lean, source)
+            for record in records:
+                valued += 1
+                for sink in sinks:
+                    sink.write(record)
+        finally:
+            for sink in sinks:
+                sink.close()
+            if store is not None:
+                store.close()
+
+        time_taken = time.time() - start_time
+        count = valued if queue is not None else len(links)
+        print(f'Average time taken per stock: {np.round(time_taken/max(count, 1), 2)} seconds')
+        print('-'*75)
+        if queue is not None:
+            print(f'Queue: {queue.stats()}')
+        METRICS.count('fundamentals.hits', FUNDAMENTALS.hits)
+        METRICS.count('fundamentals.misses', FUNDAMENTALS.misses)
+        METRICS.report()
+        if metrics_path is not None:
+            METRICS.write(metrics_path)
+
+    except KeyboardInterrupt:
+        sys.exit()
+
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.write(profile_dir)
+            profiler.report()
+
+
+def parse_args(argv: list = None):
+    """Parses command line arguments.
+
+    Args:
+        argv (list, optional): Arguments to parse. Defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: Parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='Values the most viewed stocks on morningstar.com.'
+    )
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='number of Chrome workers scraping in parallel')
+    parser.add_argument('-c', '--concurrency', type=int, default=CONCURRENCY,
+                        help='fundamentals requests in flight while prefetching (0 disables)')
+    parser.add_argument('--extract', choices=['clicks', 'script'], default='clicks',
+                        help='read sections with WebDriver calls or one script execution')
+    parser.add_argument('--source', choices=['browser', 'keystats'], default='browser',
+                        help='scrape pages with Chrome or fetch key stats over HTTP/JSON')
+    parser.add_argument('--keystats-url',
+                        help='base URL of the key stats API, e.g. a local stub server')
+    parser.add_argument('--keystats-search-url',
+                        help='URL of the security search used by the key stats source')
+    parser.add_argument('--lean', action='store_true',
+                        help='lean browser profile that blocks images, fonts, ads and analytics')
+    parser.add_argument('-u', '--universe',
+                        help='file of valuation URLs, EXCHANGE:SYMBOL pairs or symbols to value')
+    parser.add_argument('--exchange', default=EXCHANGE,
+                        help='exchange of bare symbols in the universe file')
+    parser.add_argument('--queue', nargs='?', const=QUEUE_PATH, default=None,
+                        help='SQLite work queue shared by workers on this or other machines')
+    parser.add_argument('--worker', help='worker ID in the queue (default host:pid)')
+    parser.add_argument('--batch', type=int,
+                        help='pages claimed from the queue at once')
+    parser.add_argument('--lease', type=float, default=LEASE,
+                        help='seconds a claimed page is held without a heartbeat')
+    parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                        help='claims of a page before it is marked failed')
+    parser.add_argument('-o', '--output', action='append', default=[],
+                        help='append records to a .jsonl, .csv or .parquet file (repeatable)')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not print the results')
+    parser.add_argument('-k', '--top', type=int,
+                        help='rank the stocks and print the top K at the end')
+    parser.add_argument('--rank', choices=TARGETS, default='mos',
+                        help='price whose discount ranks the stocks')
+    parser.add_argument('-f', '--filter', action='append', default=[],
+                        help='screen on a record field, e.g. "roic_avg>15" (repeatable)')
+    parser.add_argument('--metrics',
+                        help='write stage timings to a .json or Prometheus text file')
+    parser.add_argument('--profile', nargs='?', const=PROFILE_DIR, default=None,
+                        help='sample the pipeline and write flame graph stacks to a directory')
+    parser.add_argument('--profile-interval', type=float, default=INTERVAL*1000,
+                        help='milliseconds between profile samples')
+    parser.add_argument('--store', nargs='?', const=STORE_DIR, default=None,
+                        help='directory of the results store; reuses recent scrapes')
+    parser.add_argument('--years', nargs='?', const=YEARS_DIR, default=None,
+                        help='directory of the memory-mapped per-year metrics store')
+    parser.add_argument('--max-age', type=float, default=MAX_AGE/3600,
+                        help='hours a stored scrape is reused for')
+    parser.add_argument('--cache-ttl', type=float, default=FUNDAMENTALS.ttl/3600,
+                        help='hours yahoo_fin fundamentals stay cached')
+    parser.add_argument('--quote-ttl', type=float, default=FUNDAMENTALS.quote_ttl/60,
+                        help='minutes quotes, and so market prices, stay cached')
+    parser.add_argument('--cache-size', type=int, default=FUNDAMENTALS.maxsize,
+                        help='fundamentals entries kept in memory')
+    parser.add_argument('--cache-dir', default=FUNDAMENTALS.cache_dir,
+                        help='directory of the on-disk fundamentals cache')
+    parser.add_argument('--rate', action='append', default=[], metavar='HOST=RATE[/BURST]',
+                        help='calls per second to yahoo, forex, morningstar or keystats (repeatable)')
+    parser.add_argument('--retries', type=int, default=ATTEMPTS - 1,
+                        help='retries of external calls after transient errors')
+    parser.add_argument('--breaker-failures', type=int, default=BREAKER_FAILURES,
+                        help='consecutive failures that stop calls to a host')
+    parser.add_argument('--breaker-reset', type=float, default=BREAKER_RESET,
+                        help='seconds before a stopped host is tried again')
+    parser.add_argument('--fx-rates',
+                        help='JSON file of pinned exchange rates for offline runs')
+    return parser.parse_args(argv)
+
+
+def run(argv: list = None):
+    """Configures the shared caches and guards from command line arguments
+    and runs main.
+
+    Args:
+        argv (list, optional): Arguments to parse. Defaults to sys.argv.
+    """
+    args = parse_args(argv)
+    FUNDAMENTALS.configure(ttl=args.cache_ttl*3600, quote_ttl=args.quote_ttl*60,
+                           maxsize=args.cache_size, cache_dir=args.cache_dir)
+    if args.fx_rates is not None:
+        FX.pin(args.fx_rates)
+    RESILIENCE.configure(attempts=args.retries + 1, failures=args.breaker_failures,
+                         reset=args.breaker_reset)
+    for limit in args.rate:
+        host, rate = limit.split('=', 1)
+        rate, _, burst = rate.partition('/')
+        RESILIENCE.configure(host, rate=float(rate), burst=int(burst) if burst else None)
+    links = read_universe(args.universe, args.exchange) if args.universe else None
+    queue = WorkQueue(args.queue, args.lease, args.max_attempts) if args.queue else None
+    source = None
+    if args.source == 'keystats':
+        from keystats import BASE_URL, SEARCH_URL, KeyStatsSource
+        source = KeyStatsSource(args.keystats_url or BASE_URL,
+                                args.keystats_search_url or SEARCH_URL)
+    screener = None
+    if args.top is not None or args.filter:
+        screener = Screener(TOP_K if args.top is None else args.top, args.rank, args.filter)
+    main(workers=args.workers, concurrency=args.concurrency,
+         outputs=args.output, quiet=args.quiet, store_dir=args.store,
+         max_age=args.max_age*3600, extract=args.extract,
+         lean=args.lean, metrics_path=args.metrics, links=links,
+         queue=queue, worker=args.worker, batch=args.batch, source=source,
+         screener=screener, years_dir=args.years, profile_dir=args.profile,
+         profile_interval=args.profile_interval/1000)
+
+
+if __name__ == '__main__':
+    run()
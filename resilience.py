@@ -0,0 +1,369 @@
+"""Rate limiting, retries and circuit breaking for calls to external hosts.
+
+Every host (yahoo, forex, morningstar, keystats) gets a HostGuard. It is a token
+bucket shared by all threads, retries with jittered exponential backoff, and
+a circuit breaker that fails calls fast while the host keeps failing. Only
+transient errors (OSError by default, which includes requests and socket
+errors) are retried or count against the breaker. Any other error means the
+host answered, so it is raised as it is, without counting for or against the
+breaker. Events are counted per host and reported through METRICS.
+"""
+import asyncio
+import random
+import threading
+import time
+
+from metrics import METRICS
+
+# Default settings per host. rate is calls per second, None for no limit.
+# yahoo_fin hides HTTP statuses: a ticker without a quote or statement and a
+# throttled request both raise AssertionError or IndexError. Those are not
+# retried, since most are permanent and would open the breaker for every
+# later ticker. Only transport errors are; fetch.py sees the statuses and
+# retries HTTP 429 and 5xx.
+HOSTS = {
+    'yahoo': {'rate': 5.0, 'burst': 5},
+    'forex': {'rate': 1.0, 'burst': 2},
+    'morningstar': {'rate': 1.0, 'burst': 2},
+    'keystats': {'rate': 5.0, 'burst': 5},
+}
+ATTEMPTS = 3
+BACKOFF = 0.5  # Seconds before the first retry, doubling after each one
+MAX_BACKOFF = 30.0
+BREAKER_FAILURES = 5  # Consecutive failures that open the circuit
+BREAKER_RESET = 60.0  # Seconds the circuit stays open before a trial call
+
+COUNTERS = ['calls', 'failures', 'retries', 'throttled', 'rejected', 'opened']
+
+
+class TransientError(OSError):
+    """A host answered with an error worth retrying, e.g. HTTP 429 or 5xx."""
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of calling a host whose circuit is open."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket. Calls reserve a token and wait until it
+    has been refilled, so callers are served in order.
+
+    Args:
+        rate (float): Tokens added per second. None or 0 for no limit.
+        burst (int, optional): Bucket size. Defaults to max(1, rate).
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.burst = max(1, rate or 1) if burst is None else burst
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int = 1):
+        """Takes tokens, going into debt if the bucket is empty.
+
+        Args:
+            tokens (int, optional): Tokens to take. Defaults to 1.
+
+        Returns:
+            float: Seconds to wait before using them.
+        """
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated)*self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return max(0.0, -self._tokens/self.rate)
+
+    def acquire(self, tokens: int = 1):
+        """Takes tokens, sleeping until they are available.
+
+        Returns:
+            float: Seconds waited.
+        """
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: int = 1):
+        """Takes tokens without blocking the event loop.
+
+        Returns:
+            float: Seconds waited.
+        """
+        wait = self.reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures and rejects calls until reset
+    seconds have passed. Then one trial call is let through, and its outcome
+    closes or reopens the circuit.
+
+    Args:
+        failures (int, optional): Consecutive failures that open the circuit.
+                                  Defaults to BREAKER_FAILURES.
+        reset (float, optional): Seconds before a trial call. Defaults to
+                                 BREAKER_RESET.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failures: int = BREAKER_FAILURES, reset: float = BREAKER_RESET):
+        self.failures = failures
+        self.reset = reset
+        self.state = self.CLOSED
+        self._count = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Checks whether a call may go through.
+
+        Returns:
+            bool: False while the circuit is open.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def success(self):
+        """Closes the circuit."""
+        with self._lock:
+            self.state = self.CLOSED
+            self._count = 0
+
+    def release(self):
+        """Ends a call that failed for a reason other than the host, e.g. a
+        bad request. Counts nothing, but a trial call gives its place to the
+        next call."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic() - self.reset
+
+    def failure(self):
+        """Counts a failure, opening the circuit past the threshold or when a
+        trial call fails.
+
+        Returns:
+            bool: True if this failure opened the circuit.
+        """
+        with self._lock:
+            self._count += 1
+            if self.state == self.HALF_OPEN or \
+                    (self.state == self.CLOSED and self._count >= self.failures):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF, cap: float = MAX_BACKOFF):
+    """Full-jitter exponential backoff.
+
+    Args:
+        attempt (int): Retries so far, from 0.
+        base (float, optional): First delay. Defaults to BACKOFF.
+        cap (float, optional): Longest delay. Defaults to MAX_BACKOFF.
+
+    Returns:
+        float: Seconds to wait, uniform in [0, min(cap, base*2**attempt)].
+    """
+    return random.uniform(0, min(cap, base*2**attempt))
+
+
+class HostGuard:
+    """Rate limiter, retries and circuit breaker for one host.
+
+    Args:
+        host (str): Host name used in counters.
+        rate (float, optional): Calls per second. None for no limit.
+        burst (int, optional): Calls allowed at once. Defaults to max(1, rate).
+        attempts (int, optional): Tries per call. Defaults to ATTEMPTS.
+        backoff (float, optional): First retry delay. Defaults to BACKOFF.
+        max_backoff (float, optional): Longest retry delay. Defaults to MAX_BACKOFF.
+        failures (int, optional): Failures that open the circuit.
+                                  Defaults to BREAKER_FAILURES.
+        reset (float, optional): Seconds the circuit stays open.
+                                 Defaults to BREAKER_RESET.
+        retry_on (tuple, optional): Transient exception types.
+                                    Defaults to (OSError,).
+    """
+
+    def __init__(self, host: str, rate: float = None, burst: int = None,
+                 attempts: int = ATTEMPTS, backoff: float = BACKOFF,
+                 max_backoff: float = MAX_BACKOFF, failures: int = BREAKER_FAILURES,
+                 reset: float = BREAKER_RESET, retry_on: tuple = (OSError,)):
+        self.host = host
+        self.limiter = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failures, reset)
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_on = retry_on
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._lock = threading.Lock()
+
+    def count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+        METRICS.count(f'{self.host}.{name}')
+
+    def _before(self):
+        if not self.breaker.allow():
+            self.count('rejected')
+            raise CircuitOpenError(f'Circuit open for {self.host}')
+        self.count('calls')
+
+    def _failed(self, attempt: int):
+        """Records a transient failure. Returns the retry delay, or None if
+        the error should be raised."""
+        self.count('failures')
+        if self.breaker.failure():
+            self.count('opened')
+        if attempt + 1 >= self.attempts or self.breaker.state == CircuitBreaker.OPEN:
+            return None
+        self.count('retries')
+        return backoff_delay(attempt, self.backoff, self.max_backoff)
+
+    def call(self, func, *args, retry_on: tuple = None, **kwargs):
+        """Calls func through the limiter and breaker, retrying transient
+        errors.
+
+        Args:
+            func (callable): Function making the request.
+            *args: Arguments of func.
+            retry_on (tuple, optional): Transient exception types for this
+                                        call. Defaults to self.retry_on.
+            **kwargs: Keyword arguments of func.
+
+        Returns:
+            Any: What func returns.
+        """
+        retry_on = self.retry_on if retry_on is None else retry_on
+        for attempt in range(self.attempts):
+            self._before()
+            if self.limiter.acquire():
+                self.count('throttled')
+            try:
+                result = func(*args, **kwargs)
+            except retry_on:
+                delay = self._failed(attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except Exception:
+                self.breaker.release()
+                raise
+            self.breaker.success()
+            return result
+
+    async def call_async(self, func, *args, retry_on: tuple = None, **kwargs):
+        """Awaits func(*args, **kwargs) like call, without blocking the
+        event loop.
+
+        Args:
+            func (callable): Coroutine function making the request.
+            *args: Arguments of func.
+            retry_on (tuple, optional): Transient exception types for this
+                                        call. Defaults to self.retry_on.
+            **kwargs: Keyword arguments of func.
+
+        Returns:
+            Any: What func returns.
+        """
+        retry_on = self.retry_on if retry_on is None else retry_on
+        for attempt in range(self.attempts):
+            self._before()
+            if await self.limiter.acquire_async():
+                self.count('throttled')
+            try:
+                result = await func(*args, **kwargs)
+            except retry_on:
+                delay = self._failed(attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except Exception:
+                self.breaker.release()
+                raise
+            self.breaker.success()
+            return result
+
+
+class Resilience:
+    """Registry of the HostGuards shared by the whole process.
+
+    Args:
+        hosts (dict, optional): Host -> HostGuard settings. Defaults to HOSTS.
+    """
+
+    def __init__(self, hosts: dict = None):
+        self.settings = {host: dict(config) for host, config in
+                         (HOSTS if hosts is None else hosts).items()}
+        self._defaults = {}
+        self._guards = {}
+        self._lock = threading.Lock()
+
+    def configure(self, host: str = None, **settings):
+        """Changes HostGuard settings of one host, or of every host. Guards
+        are rebuilt, so their counters start over.
+
+        Args:
+            host (str, optional): Host to configure. Defaults to all of them.
+            **settings: HostGuard keyword arguments.
+        """
+        with self._lock:
+            if host is None:
+                self._defaults.update(settings)
+                for config in self.settings.values():
+                    config.update(settings)
+            else:
+                self.settings.setdefault(host, dict(self._defaults)).update(settings)
+            self._guards.clear()
+
+    def guard(self, host: str):
+        """Gets the guard of a host, creating it on first use.
+
+        Args:
+            host (str): Host name.
+
+        Returns:
+            HostGuard: The host's guard.
+        """
+        with self._lock:
+            if host not in self._guards:
+                config = self.settings.get(host, self._defaults)
+                self._guards[host] = HostGuard(host, **config)
+            return self._guards[host]
+
+    def call(self, host: str, func, *args, **kwargs):
+        """Calls func through the guard of a host. See HostGuard.call."""
+        return self.guard(host).call(func, *args, **kwargs)
+
+    def stats(self):
+        """Counters of every host used so far.
+
+        Returns:
+            dict: Host -> counter -> value, plus the breaker state.
+        """
+        with self._lock:
+            guards = list(self._guards.values())
+        return {guard.host: dict(guard.counters, state=guard.breaker.state)
+                for guard in guards}
+
+
+# Shared by every external call
+RESILIENCE = Resilience()
@@ -0,0 +1,261 @@
+"""Streaming screener and ranking of valuation records.
+
+Each record gets the discount of its current price to the MOS, ten cap,
+payback and DCF prices. Records failing any filter are dropped, and the rest are
+pushed on a min-heap holding the best k so far, so ranking any number of
+records takes O(k) memory and O(n log k) time. Only the flat fields are
+kept, never the tables.
+
+The Screener is a sink, so it ranks records while a run is going. It can also
+rank records saved by an earlier run:
+
+    python screener.py results.jsonl -k 25 --rank ten_cap --filter "roic_avg>15"
+"""
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import math
+import operator
+import os
+import re
+
+import pandas as pd
+
+from sinks import FIELDS, TEXT_FIELDS, Sink, clean_value
+
+TOP_K = 20
+TARGETS = ['mos', 'ten_cap', 'payback', 'dcf']
+DISCOUNTS = {target: f'{target}_discount' for target in TARGETS}
+
+# Longest operators first so '>=' isn't read as '>'
+OPERATORS = {
+    '>=': operator.ge, '<=': operator.le, '!=': operator.ne, '==': operator.eq,
+    '>': operator.gt, '<': operator.lt, '=': operator.eq,
+}
+FILTER_RE = re.compile(
+    r'^\s*(\w+)\s*(' + '|'.join(map(re.escape, OPERATORS)) + r')\s*(.+?)\s*$'
+)
+COLUMNS = ['current_price', 'mos', 'ten_cap', 'payback', 'dcf', *DISCOUNTS.values(),
+           'roic_avg', 'debt_to_earnings']
+
+
+def discount(price: float, target: float):
+    """Discount of a price to a target price.
+
+    Args:
+        price (float): Current price.
+        target (float): Valuation price.
+
+    Returns:
+        float: 1 - price/target, e.g. 0.3 for 30% below the target and
+               negative above it. None if either is missing or the target
+               isn't positive.
+    """
+    if price is None or target is None or math.isnan(price) or math.isnan(target) \
+            or target <= 0:
+        return None
+    return 1 - price/target
+
+
+def screen_row(record: dict):
+    """Flat fields of a record plus its discounts.
+
+    Args:
+        record (dict): Valuation record.
+
+    Returns:
+        dict: FIELDS and DISCOUNTS values, NaN turned into None.
+    """
+    row = clean_value({field: record.get(field) for field in FIELDS})
+    for target, field in DISCOUNTS.items():
+        row[field] = discount(row['current_price'], row[target])
+    return row
+
+
+class Filter:
+    """Predicate on one field of a screened row, e.g. "roic_avg>15".
+
+    Args:
+        expr (str): Field, operator (> >= < <= == = !=) and value. Values of
+                    text fields are compared as strings, others as floats.
+    """
+    __slots__ = ('expr', 'field', 'op', 'value')
+
+    def __init__(self, expr: str):
+        match = FILTER_RE.match(expr)
+        if match is None:
+            raise ValueError(f'Invalid filter: {expr!r}')
+        field, op, value = match.groups()
+        if field not in FIELDS and field not in DISCOUNTS.values():
+            raise ValueError(f'Unknown field in filter: {field!r}')
+        self.expr = expr
+        self.field = field
+        self.op = OPERATORS[op]
+        self.value = value if field in TEXT_FIELDS else float(value)
+
+    def __call__(self, row: dict):
+        """Checks a row. Missing values never pass."""
+        value = row.get(self.field)
+        return value is not None and self.op(value, self.value)
+
+    def __repr__(self):
+        return f'Filter({self.expr!r})'
+
+
+class Screener(Sink):
+    """Keeps the k records with the largest discount that pass every filter.
+
+    Args:
+        k (int, optional): Records kept. Defaults to TOP_K.
+        rank (str, optional): Price in TARGETS whose discount ranks records.
+                              Defaults to 'mos'.
+        filters (list, optional): Filter objects or expressions. Defaults to ().
+        show (bool, optional): Print the ranking on close. Defaults to True.
+    """
+
+    def __init__(self, k: int = TOP_K, rank: str = 'mos', filters: list = (),
+                 show: bool = True):
+        super().__init__(batch_size=1)
+        if rank not in DISCOUNTS:
+            raise ValueError(f'Unknown rank: {rank!r}')
+        self.k = k
+        self.rank = rank
+        self.key = DISCOUNTS[rank]
+        self.filters = [f if isinstance(f, Filter) else Filter(f) for f in filters]
+        self.show = show
+        self.seen = self.passed = 0
+        self._heap = []  # (discount, -order, row); the worst kept record on top
+        self._order = itertools.count()
+
+    def write(self, record: dict):
+        """Screens a record and keeps it if it is among the best k so far.
+
+        Args:
+            record (dict): Valuation record.
+        """
+        self.seen += 1
+        row = screen_row(record)
+        if not all(f(row) for f in self.filters):
+            return
+        self.passed += 1
+        score = row[self.key]
+        if score is None or self.k <= 0:
+            return
+        # Earlier records win ties, so later ones sort below them
+        entry = (score, -next(self._order), row)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+
+    def results(self):
+        """The kept rows, largest discount first.
+
+        Returns:
+            list: Screened rows.
+        """
+        return [row for _, _, row in sorted(self._heap, key=lambda e: e[:2], reverse=True)]
+
+    def to_frame(self):
+        """Ranking as a DataFrame indexed by ticker."""
+        rows = self.results()
+        return pd.DataFrame(rows, columns=FIELDS + list(DISCOUNTS.values())) \
+            .set_index('ticker')
+
+    def report(self):
+        """Prints the ranking."""
+        print('-'*75)
+        print(f'Top {len(self._heap)} by {self.rank} discount '
+              f'({self.passed} of {self.seen} passed filters)')
+        for f in self.filters:
+            print(f'  {f.expr}')
+        if self._heap:
+            print(self.to_frame()[COLUMNS].to_string())
+        print('-'*75)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.show:
+            self.report()
+
+
+def screen(records, k: int = TOP_K, rank: str = 'mos', filters: list = ()):
+    """Ranks records without keeping more than k of them.
+
+    Args:
+        records (Iterable): Valuation records.
+        k (int, optional): Records kept. Defaults to TOP_K.
+        rank (str, optional): Price in TARGETS to rank by. Defaults to 'mos'.
+        filters (list, optional): Filter objects or expressions. Defaults to ().
+
+    Returns:
+        list: The best k screened rows, largest discount first.
+    """
+    screener = Screener(k, rank, filters, show=False)
+    for record in records:
+        screener.write(record)
+    return screener.results()
+
+
+def read_records(path: str):
+    """Streams the flat records saved by a .jsonl, .csv or .parquet sink.
+
+    Args:
+        path (str): Output file of an earlier run.
+
+    Yields:
+        dict: Record fields.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.jsonl', '.json'):
+        with open(path) as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+    elif ext == '.csv':
+        with open(path, newline='') as file:
+            for row in csv.DictReader(file):
+                yield {field: (value if field in TEXT_FIELDS else float(value))
+                       if value != '' else None for field, value in row.items()}
+    elif ext in ('.parquet', '.pq'):
+        import pyarrow.parquet as pq
+
+        file = pq.ParquetFile(path)
+        # Files written before a field was added don't have its column
+        columns = [field for field in FIELDS if field in file.schema_arrow.names]
+        for batch in file.iter_batches(columns=columns):
+            yield from batch.to_pylist()
+    else:
+        raise ValueError(f'Unsupported results file: {path}')
+
+
+def parse_args(argv: list = None):
+    """Parses command line arguments.
+
+    Args:
+        argv (list, optional): Arguments to parse. Defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: Parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description='Ranks saved valuation records.')
+    parser.add_argument('paths', nargs='+', help='.jsonl, .csv or .parquet results')
+    parser.add_argument('-k', '--top', type=int, default=TOP_K,
+                        help='number of stocks to keep')
+    parser.add_argument('--rank', choices=TARGETS, default='mos',
+                        help='price whose discount ranks the stocks')
+    parser.add_argument('-f', '--filter', action='append', default=[],
+                        help='predicate such as "roic_avg>15" (repeatable)')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with Screener(args.top, args.rank, args.filter) as screener:
+        for path in args.paths:
+            for record in read_records(path):
+                screener.write(record)
@@ -0,0 +1,153 @@
+"""What-if valuation over discount rates and EPS growth rates.
+
+Every scenario is a (MARR, EPS growth shift) pair. Prices are computed for all
+tickers and scenarios at once by broadcasting the batch kernels over a
+(tickers, scenarios) array. They are then summarised as percentile bands per
+ticker. Module constants are never changed.
+"""
+import numpy as np
+import pandas as pd
+
+from batch import universe_arrays
+from valuation import (MARR, cap_eps_growth, get_8_year_payback_prices,
+                       get_dcf_prices, get_mos_prices, get_ten_cap_prices)
+
+PERCENTILES = (5, 50, 95)
+CHUNK_SIZE = 1024  # Tickers valued per block to bound memory
+
+
+def scenario_prices(values: dict, marr: np.ndarray, growth_shift: np.ndarray):
+    """Prices every ticker under every scenario.
+
+    Args:
+        values (dict): Output of batch.universe_arrays.
+        marr (np.ndarray): Discount rate of each scenario.
+        growth_shift (np.ndarray): Amount added to each ticker's EPS growth
+                                   rate in each scenario, before capping.
+
+    Returns:
+        dict: MOS, Ten Cap, 8 Yr Payback and DCF arrays of shape
+              (tickers, scenarios).
+    """
+    marr = np.asarray(marr, dtype=np.float64)[None, :]
+    growth_shift = np.asarray(growth_shift, dtype=np.float64)[None, :]
+    eps = values['eps'][:, None]
+    fcfps = values['fcfps'][:, None]
+
+    growth = cap_eps_growth(values['growth'][:, None] + growth_shift)
+    ten_cap = get_ten_cap_prices(values['fcfps'], values['shares'],
+                                 values['capex'], values['tax'])
+    return {
+        'MOS': get_mos_prices(eps, growth, marr),
+        'Ten Cap': np.broadcast_to(ten_cap[:, None], (len(ten_cap), marr.shape[1])),
+        '8 Yr Payback': get_8_year_payback_prices(fcfps, marr),
+        'DCF': get_dcf_prices(fcfps, growth, marr)
+    }
+
+
+def nanpercentile_rows(prices: np.ndarray, percentiles: tuple):
+    """Row-wise percentiles that ignore NaN, using linear interpolation like
+    np.nanpercentile but with one sort instead of a Python loop per row.
+
+    Args:
+        prices (np.ndarray): Array of shape (tickers, scenarios).
+        percentiles (tuple): Percentiles to compute.
+
+    Returns:
+        np.ndarray: Array of shape (tickers, len(percentiles)).
+    """
+    ordered = np.sort(prices, axis=1)  # NaN sorts last
+    valid = np.count_nonzero(~np.isnan(ordered), axis=1)
+    pos = np.maximum(valid - 1, 0)[:, None] * (np.asarray(percentiles, dtype=np.float64)/100)
+    lower = np.floor(pos).astype(np.intp)
+    upper = np.ceil(pos).astype(np.intp)
+    low = np.take_along_axis(ordered, lower, axis=1)
+    high = np.take_along_axis(ordered, upper, axis=1)
+    bands = low + (high - low)*(pos - lower)
+    bands[valid == 0] = np.nan
+    return bands
+
+
+def percentile_bands(universe: pd.DataFrame|dict, marr: np.ndarray,
+                     growth_shift: np.ndarray, percentiles: tuple = PERCENTILES,
+                     chunk_size: int = CHUNK_SIZE):
+    """Summarises scenario prices as percentile bands per ticker.
+
+    Args:
+        universe (pd.DataFrame | dict): Universe as described in
+                                        batch.value_universe.
+        marr (np.ndarray): Discount rate of each scenario.
+        growth_shift (np.ndarray): EPS growth shift of each scenario.
+        percentiles (tuple, optional): Percentiles to report.
+                                       Defaults to PERCENTILES.
+        chunk_size (int, optional): Tickers valued per block.
+                                    Defaults to CHUNK_SIZE.
+
+    Returns:
+        pd.DataFrame: Columns (price, percentile), one row per ticker.
+    """
+    values = universe_arrays(universe)
+    n = len(values['index'])
+    bands = {}
+    for start in range(0, n, chunk_size):
+        block = {key: arr[start:start+chunk_size] for key, arr in values.items()
+                 if key != 'index'}
+        for name, prices in scenario_prices(block, marr, growth_shift).items():
+            bands.setdefault(name, []).append(nanpercentile_rows(prices, percentiles))
+
+    columns = pd.MultiIndex.from_product([list(bands), [f'p{q}' for q in percentiles]])
+    data = np.hstack([np.vstack(blocks) for blocks in bands.values()]) if n else \
+        np.empty((0, len(columns)))
+    return pd.DataFrame(data, index=values['index'], columns=columns)
+
+
+def sensitivity_grid(universe: pd.DataFrame|dict, marrs: np.ndarray,
+                     growth_shifts: np.ndarray = (0.0,),
+                     percentiles: tuple = PERCENTILES):
+    """Values the universe over every combination of discount rates and EPS
+    growth shifts.
+
+    Args:
+        universe (pd.DataFrame | dict): Universe as described in
+                                        batch.value_universe.
+        marrs (np.ndarray): Discount rates to evaluate.
+        growth_shifts (np.ndarray, optional): EPS growth shifts to evaluate.
+                                              Defaults to (0.0,).
+        percentiles (tuple, optional): Percentiles to report.
+                                       Defaults to PERCENTILES.
+
+    Returns:
+        pd.DataFrame: Percentile bands per ticker.
+    """
+    marr, growth_shift = np.meshgrid(np.asarray(marrs, dtype=np.float64),
+                                     np.asarray(growth_shifts, dtype=np.float64))
+    return percentile_bands(universe, marr.ravel(), growth_shift.ravel(), percentiles)
+
+
+def monte_carlo(universe: pd.DataFrame|dict, draws: int = 10000,
+                marr_mean: float = MARR, marr_std: float = 0.02,
+                growth_std: float = 0.03, percentiles: tuple = PERCENTILES,
+                seed: int = None):
+    """Values the universe over random draws of discount rates and EPS growth
+    shifts. Both are drawn from normal distributions.
+
+    Args:
+        universe (pd.DataFrame | dict): Universe as described in
+                                        batch.value_universe.
+        draws (int, optional): Number of scenarios. Defaults to 10000.
+        marr_mean (float, optional): Mean discount rate. Defaults to MARR.
+        marr_std (float, optional): Standard deviation of the discount rate.
+                                    Defaults to 0.02.
+        growth_std (float, optional): Standard deviation of the EPS growth
+                                      shift. Defaults to 0.03.
+        percentiles (tuple, optional): Percentiles to report.
+                                       Defaults to PERCENTILES.
+        seed (int, optional): Random seed. Defaults to None.
+
+    Returns:
+        pd.DataFrame: Percentile bands per ticker.
+    """
+    rng = np.random.default_rng(seed)
+    marr = rng.normal(marr_mean, marr_std, draws)
+    growth_shift = rng.normal(0.0, growth_std, draws)
+    return percentile_bands(universe, marr, growth_shift, percentiles)
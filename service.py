@@ -0,0 +1,338 @@
+"""Long-lived local valuation service.
+
+Chrome drivers are started once and lent to one scrape at a time, and the
+fundamentals stay in FUNDAMENTALS between requests, so a valuation doesn't
+pay for a cold start. Requests for a ticker that is already being valued wait
+for that valuation instead of starting another one. Records are cached for
+a while afterwards and answered straight from memory. They hold the current
+price, so they are cached no longer than FUNDAMENTALS keeps quotes.
+
+    python service.py --port 8000 --workers 2 --lean
+
+    GET  /value/{ticker}          Record of one stock, e.g. /value/AAPL or
+                                  /value/XNYS:JPM. ?refresh=1 skips the cache.
+    GET  /value?tickers=A,B       Records of many stocks.
+    POST /value                   Same, with a JSON body {"tickers": [...]}.
+    GET  /health                  Pool, cache and request counters.
+
+Records are the dicts value_stock returns, which print_results prints.
+"""
+import argparse
+import asyncio
+import queue
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from fundamentals import QUOTE_TTL
+from metrics import METRICS
+from sinks import clean_value
+from workqueue import EXCHANGE, entry_link
+
+HOST = '127.0.0.1'
+PORT = 8000
+RESULT_TTL = QUOTE_TTL  # Seconds a record is served from the cache
+CACHE_SIZE = 4096  # Records kept in the cache
+MAX_BATCH = 200  # Tickers per batch request
+
+
+class DriverPool:
+    """Chrome sessions started ahead of time and lent to one scrape at a time.
+
+    Args:
+        size (int, optional): Number of sessions. Defaults to 1.
+        lean (bool, optional): Use the lean browser profile. Defaults to False.
+    """
+
+    def __init__(self, size: int = 1, lean: bool = False):
+        from valuation import ScraperSession
+
+        self.sessions = [ScraperSession(lean=lean) for _ in range(max(1, size))]
+        self._idle = queue.Queue()
+        for session in self.sessions:
+            self._idle.put(session)
+
+    def warm(self, executor: ThreadPoolExecutor):
+        """Starts every driver in parallel.
+
+        Args:
+            executor (ThreadPoolExecutor): Threads to start them on.
+        """
+        list(executor.map(lambda session: session.driver, self.sessions))
+
+    def run(self, func, *args):
+        """Calls func(driver, *args) with an idle driver, waiting for one if
+        they are all busy. A driver that fails is restarted on its next use.
+
+        Returns:
+            Any: What func returns.
+        """
+        from selenium.common.exceptions import WebDriverException
+
+        session = self._idle.get()
+        try:
+            return func(session.driver, *args)
+        except WebDriverException:
+            session.quit()
+            raise
+        finally:
+            self._idle.put(session)
+
+    @property
+    def idle(self):
+        return self._idle.qsize()
+
+    def close(self):
+        for session in self.sessions:
+            session.quit()
+
+
+class ValuationService:
+    """Values stocks on request, sharing warm drivers, coalescing requests
+    for the same stock and caching records.
+
+    Args:
+        workers (int, optional): Chrome drivers, i.e. scrapes at once.
+                                 Defaults to 1.
+        scraper (callable, optional): scrape_link or scrape_link_script.
+                                      Defaults to scrape_link_script.
+        lean (bool, optional): Use the lean browser profile. Defaults to False.
+        source (KeyStatsSource, optional): HTTP source of the key stats used
+                                           instead of Chrome. Defaults to None.
+        ttl (float, optional): Seconds records are cached, at most the quote
+                               TTL of FUNDAMENTALS. Defaults to RESULT_TTL.
+        cache_size (int, optional): Records cached. Defaults to CACHE_SIZE.
+        exchange (str, optional): Exchange of bare symbols. Defaults to EXCHANGE.
+    """
+
+    def __init__(self, workers: int = 1, scraper=None, lean: bool = False, source=None,
+                 ttl: float = RESULT_TTL, cache_size: int = CACHE_SIZE,
+                 exchange: str = EXCHANGE):
+        from valuation import FUNDAMENTALS, scrape_link_script
+
+        self.workers = max(1, workers)
+        self.scraper = scrape_link_script if scraper is None else scraper
+        self.source = source
+        self.ttl = min(ttl, FUNDAMENTALS.ttl_of('quote'))
+        self.cache_size = cache_size
+        self.exchange = exchange
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.pool = DriverPool(self.workers, lean) if source is None else None
+        self.cache = OrderedDict()  # link -> (valued at, record)
+        self.pending = {}  # link -> future of a valuation in progress
+        self.counters = dict.fromkeys(['requests', 'hits', 'coalesced', 'valued', 'failed'], 0)
+
+    async def start(self):
+        """Starts the drivers so the first requests don't wait for Chrome."""
+        if self.pool is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.pool.warm, self.executor)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self.pool is not None:
+            self.pool.close()
+
+    def _scrape(self, link: str):
+        """Scrapes one page and values it. Runs on a worker thread."""
+        from valuation import ticker_from_link, value_stock
+
+        ticker = ticker_from_link(link)
+        with METRICS.ticker(ticker):
+            with METRICS.stage('scrape'):
+                if self.source is not None:
+                    scraped = next(self.source.scrape_links([link]))
+                else:
+                    scraped = self.pool.run(self.scraper, link)
+            stock_name, moat, management, fcfps = scraped
+            if moat is None and management is None:
+                return None
+            with METRICS.stage('valuation'):
+                return clean_value(value_stock(stock_name, moat, management, fcfps))
+
+    def cached(self, link: str, now: float = None):
+        """Record of a link valued less than ttl seconds ago, or None."""
+        entry = self.cache.get(link)
+        now = time.time() if now is None else now
+        if entry is None or now - entry[0] > self.ttl:
+            return None
+        self.cache.move_to_end(link)
+        return entry[1]
+
+    async def value(self, ticker: str, refresh: bool = False):
+        """Values a stock.
+
+        Args:
+            ticker (str): Symbol, "EXCHANGE:SYMBOL" or valuation URL.
+            refresh (bool, optional): Value again even if cached.
+                                      Defaults to False.
+
+        Returns:
+            dict: Valuation record. None if the page has no data.
+        """
+        self.counters['requests'] += 1
+        link = entry_link(ticker.strip(), self.exchange)
+        if not refresh:
+            record = self.cached(link)
+            if record is not None:
+                self.counters['hits'] += 1
+                METRICS.count('service.hits')
+                return record
+
+        future = self.pending.get(link)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, self._scrape, link)
+            self.pending[link] = future
+            future.add_done_callback(lambda done: self._finish(link, done))
+        else:
+            self.counters['coalesced'] += 1
+            METRICS.count('service.coalesced')
+        # Shielded, so a cancelled request doesn't cancel the valuation the
+        # other requests wait for
+        return await asyncio.shield(future)
+
+    def _finish(self, link: str, future: asyncio.Future):
+        """Counts and caches a finished valuation, whether or not any request
+        still waits for it."""
+        self.pending.pop(link, None)
+        if future.cancelled() or future.exception() is not None:
+            self.counters['failed'] += 1
+            return
+        self.counters['valued'] += 1
+        record = future.result()
+        if record is not None:
+            self.cache[link] = (time.time(), record)
+            self.cache.move_to_end(link)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    async def value_many(self, tickers: list, refresh: bool = False):
+        """Values stocks concurrently.
+
+        Args:
+            tickers (list): Symbols, "EXCHANGE:SYMBOL" or valuation URLs.
+            refresh (bool, optional): Value again even if cached.
+                                      Defaults to False.
+
+        Returns:
+            dict: Ticker -> record, None without data, or {"error": message}.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        results = await asyncio.gather(*(self.value(ticker, refresh) for ticker in tickers),
+                                       return_exceptions=True)
+        return {ticker: {'error': repr(result)} if isinstance(result, Exception) else result
+                for ticker, result in zip(tickers, results)}
+
+    def health(self):
+        """Counters of the service.
+
+        Returns:
+            dict: Request counters, cache size, valuations in progress and
+                  idle drivers.
+        """
+        return dict(self.counters, cached=len(self.cache), in_progress=len(self.pending),
+                    idle_drivers=None if self.pool is None else self.pool.idle)
+
+    def app(self):
+        """aiohttp application serving the service.
+
+        Returns:
+            web.Application: Application with the routes of this module.
+        """
+        from aiohttp import web
+
+        async def value_one(request):
+            ticker = request.match_info['ticker']
+            refresh = request.query.get('refresh') in ('1', 'true')
+            try:
+                record = await self.value(ticker, refresh)
+            except Exception as err:
+                print(f'ERROR ~ Valuing {ticker} failed: {err!r}')
+                return web.json_response({'error': repr(err)}, status=502)
+            if record is None:
+                return web.json_response({'error': f'No data for {ticker}'}, status=404)
+            return web.json_response(record)
+
+        async def value_batch(request):
+            if request.method == 'POST':
+                try:
+                    tickers = (await request.json())['tickers']
+                except (ValueError, KeyError, TypeError):
+                    return web.json_response({'error': 'Expected {"tickers": [...]}'}, status=400)
+            else:
+                tickers = [t for t in request.query.get('tickers', '').split(',') if t.strip()]
+            if not isinstance(tickers, list) or not tickers or len(tickers) > MAX_BATCH:
+                return web.json_response(
+                    {'error': f'Expected 1 to {MAX_BATCH} tickers'}, status=400
+                )
+            refresh = request.query.get('refresh') in ('1', 'true')
+            return web.json_response(await self.value_many([str(t) for t in tickers], refresh))
+
+        async def health(request):
+            return web.json_response(self.health())
+
+        async def on_startup(app):
+            await self.start()
+
+        async def on_cleanup(app):
+            await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+        app = web.Application()
+        app.router.add_get('/value/{ticker}', value_one)
+        app.router.add_get('/value', value_batch)
+        app.router.add_post('/value', value_batch)
+        app.router.add_get('/health', health)
+        app.on_startup.append(on_startup)
+        app.on_cleanup.append(on_cleanup)
+        return app
+
+
+def parse_args(argv: list = None):
+    """Parses command line arguments.
+
+    Args:
+        argv (list, optional): Arguments to parse. Defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: Parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description='Serves stock valuations over HTTP.')
+    parser.add_argument('--host', default=HOST, help='address to listen on')
+    parser.add_argument('--port', type=int, default=PORT, help='port to listen on')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='warm Chrome drivers, i.e. scrapes at once')
+    parser.add_argument('--extract', choices=['clicks', 'script'], default='script',
+                        help='read sections with WebDriver calls or one script execution')
+    parser.add_argument('--lean', action='store_true',
+                        help='lean browser profile that blocks images, fonts, ads and analytics')
+    parser.add_argument('--source', choices=['browser', 'keystats'], default='browser',
+                        help='scrape pages with Chrome or fetch key stats over HTTP/JSON')
+    parser.add_argument('--keystats-url',
+                        help='base URL of the key stats API, e.g. a local stub server')
+    parser.add_argument('--keystats-search-url',
+                        help='URL of the security search used by the key stats source')
+    parser.add_argument('--exchange', default=EXCHANGE,
+                        help='exchange of bare symbols')
+    parser.add_argument('--ttl', type=float, default=RESULT_TTL/60,
+                        help='minutes a record is served from the cache, at most the quote TTL')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    from aiohttp import web
+
+    from valuation import scrape_link, scrape_link_script
+
+    args = parse_args()
+    source = None
+    if args.source == 'keystats':
+        from keystats import BASE_URL, SEARCH_URL, KeyStatsSource
+        source = KeyStatsSource(args.keystats_url or BASE_URL,
+                                args.keystats_search_url or SEARCH_URL)
+    service = ValuationService(
+        workers=args.workers,
+        scraper=scrape_link_script if args.extract == 'script' else scrape_link,
+        lean=args.lean, source=source, ttl=args.ttl*60, exchange=args.exchange,
+    )
+    web.run_app(service.app(), host=args.host, port=args.port)
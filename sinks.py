@@ -0,0 +1,275 @@
+"""Destinations for valuation records.
+
+A record is the dict valuation.value_stock returns for one ticker. Sinks buffer
+records and write them in bounded batches, so a run's results can be read
+while it is still going and memory does not grow with the universe. The
+pretty printer is one more sink.
+"""
+import csv
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+# Flat record fields written by the tabular sinks, in column order
+FIELDS = [
+    'ticker', 'name', 'industry', 'current_price', 'mos', 'ten_cap', 'payback',
+    'dcf', 'debt_to_earnings', 'fcfps', 'revenue_avg', 'eps_avg', 'bvps_avg',
+    'roe_avg', 'roic_avg',
+]
+TEXT_FIELDS = {'ticker', 'name', 'industry'}
+BATCH_SIZE = 100
+
+
+def clean_value(value):
+    """Turns NumPy scalars into Python ones and NaN into None.
+
+    Args:
+        value (Any): Value to clean.
+
+    Returns:
+        Any: JSON-serializable value.
+    """
+    if isinstance(value, dict):
+        return {str(key): clean_value(val) for key, val in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [clean_value(val) for val in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def print_record(record: dict):
+    """Prints all relevant information for valuation.
+
+    Args:
+        record (dict): Valuation record.
+    """
+    print('-'*75)
+    # Ticker, name, stock market
+    print(record['name'])
+    print(f'Industry - {record["industry"]}')
+
+    moat = record.get('moat')
+    if moat is not None:
+        moat = pd.DataFrame(moat).T
+    print(f'\nMoat\n{moat}\n')
+
+    management = record.get('management')
+    if management is not None:
+        management = pd.DataFrame(management).T
+    print(f'Management\n{management}')
+
+    if record['fcfps'] is not None:
+        print(f'\nDebt/Earnings: {record["debt_to_earnings"]}\n')
+
+    current_price = record['current_price']
+    if current_price is not None:
+        print(f'Current Price: ${current_price}')
+    else:
+        print(f'Current Price: {current_price}')
+    if record['mos'] is not None:
+        print(f'MOS: ${int(record["mos"])}')
+
+    if record['ten_cap'] is not None and record['payback'] is not None:
+        print(f'Ten Cap: ${int(record["ten_cap"])}\n8 Yr Paypack: ${int(record["payback"])}')
+    if record.get('dcf') is not None:
+        print(f'DCF: ${int(record["dcf"])}')
+    print('-'*75)
+
+
+class Sink:
+    """Base sink. Records are buffered and flushed every batch_size records.
+
+    Args:
+        batch_size (int, optional): Records per write. Defaults to BATCH_SIZE.
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE):
+        self.batch_size = batch_size
+        self._batch = []
+
+    def write(self, record: dict):
+        """Adds a record, flushing the batch once it is full.
+
+        Args:
+            record (dict): Valuation record.
+        """
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes buffered records."""
+        if self._batch:
+            self._write_batch(self._batch)
+            self._batch = []
+
+    def close(self):
+        """Flushes buffered records and releases resources."""
+        self.flush()
+
+    def _write_batch(self, batch: list):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class PrintSink(Sink):
+    """Pretty prints each record as soon as it arrives."""
+
+    def __init__(self):
+        super().__init__(batch_size=1)
+
+    def _write_batch(self, batch: list):
+        for record in batch:
+            print_record(record)
+
+
+class JsonlSink(Sink):
+    """Appends full records, tables included, as JSON lines.
+
+    Args:
+        path (str): File to append to.
+        batch_size (int, optional): Records per write. Defaults to BATCH_SIZE.
+    """
+
+    def __init__(self, path: str, batch_size: int = BATCH_SIZE):
+        super().__init__(batch_size)
+        self.path = path
+
+    def _write_batch(self, batch: list):
+        with open(self.path, 'a') as file:
+            for record in batch:
+                file.write(json.dumps(clean_value(record)) + '\n')
+
+
+class CsvSink(Sink):
+    """Appends the flat record fields as CSV rows.
+
+    A file written with other columns, e.g. before a field was added, is
+    rewritten once with the FIELDS header before rows are appended, like
+    ParquetSink does, so every value stays under its own column.
+
+    Args:
+        path (str): File to append to. A header is written if it is new.
+        batch_size (int, optional): Records per write. Defaults to BATCH_SIZE.
+    """
+
+    def __init__(self, path: str, batch_size: int = BATCH_SIZE):
+        super().__init__(batch_size)
+        self.path = path
+        self._checked = False
+
+    def _check_header(self):
+        """Rewrites an existing file whose header isn't FIELDS."""
+        with open(self.path, newline='') as file:
+            reader = csv.DictReader(file)
+            if reader.fieldnames == FIELDS:
+                return
+            with open(self.path + '.tmp', 'w', newline='') as tmp:
+                writer = csv.DictWriter(tmp, fieldnames=FIELDS, extrasaction='ignore')
+                writer.writeheader()
+                writer.writerows(reader)
+        os.replace(self.path + '.tmp', self.path)
+
+    def _write_batch(self, batch: list):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        if not new_file and not self._checked:
+            self._check_header()
+        self._checked = True
+        with open(self.path, 'a', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=FIELDS, extrasaction='ignore')
+            if new_file:
+                writer.writeheader()
+            writer.writerows(clean_value(record) for record in batch)
+
+
+class ParquetSink(Sink):
+    """Appends the flat record fields to a Parquet file, one row group per
+    batch.
+
+    Parquet files can't be appended to in place, so the rows are written to a
+    temporary file after the row groups of an existing file, and the
+    temporary file replaces it on close. The existing file is left as it is
+    until then.
+
+    Args:
+        path (str): File to append to.
+        batch_size (int, optional): Records per row group. Defaults to BATCH_SIZE.
+    """
+
+    def __init__(self, path: str, batch_size: int = BATCH_SIZE):
+        import pyarrow as pa
+
+        super().__init__(batch_size)
+        self.path = path
+        self.schema = pa.schema(
+            [(field, pa.string() if field in TEXT_FIELDS else pa.float64())
+             for field in FIELDS]
+        )
+        self._writer = None
+
+    def _open(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(self.path + '.tmp', self.schema)
+        if os.path.exists(self.path):
+            file = pq.ParquetFile(self.path)
+            for i in range(file.num_row_groups):
+                table = file.read_row_group(i)
+                # Files written before a field was added don't have its column
+                columns = [table.column(field) if field in table.column_names
+                           else pa.nulls(table.num_rows, field_type.type)
+                           for field, field_type in zip(FIELDS, self.schema)]
+                writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+        return writer
+
+    def _write_batch(self, batch: list):
+        import pyarrow as pa
+
+        rows = []
+        for record in batch:
+            row = clean_value({field: record.get(field) for field in FIELDS})
+            rows.append({field: (str(value) if field in TEXT_FIELDS else float(value))
+                         if value is not None else None for field, value in row.items()})
+        if self._writer is None:
+            self._writer = self._open()
+        self._writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        super().close()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            os.replace(self.path + '.tmp', self.path)
+
+
+def open_sink(path: str, batch_size: int = BATCH_SIZE):
+    """Opens a sink for a file based on its extension.
+
+    Args:
+        path (str): .jsonl, .csv or .parquet file.
+        batch_size (int, optional): Records per write. Defaults to BATCH_SIZE.
+
+    Returns:
+        Sink: Sink writing to path.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.jsonl', '.json'):
+        return JsonlSink(path, batch_size)
+    if ext == '.csv':
+        return CsvSink(path, batch_size)
+    if ext in ('.parquet', '.pq'):
+        return ParquetSink(path, batch_size)
+    raise ValueError(f'Unsupported output file: {path}')
@@ -0,0 +1,216 @@
+"""Parses Morningstar valuation pages from raw HTML without a browser.
+
+Pages saved from a live session with ``driver.page_source`` (or fetched any
+other way) are parsed with lxml using the same XPATHS and INDEXES as the
+Selenium scraper, so cached snapshots can be valued offline and in parallel.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from lxml import html
+
+from fastparse import parse_batch, parse_section_lines
+from valuation import SECTION_KEYS, XPATHS, create_dataframes
+
+
+# Elements WebElement.text never shows, and elements that start a new line
+HIDDEN_TAGS = {'head', 'script', 'style', 'template', 'noscript'}
+BLOCK_TAGS = {'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt',
+              'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li',
+              'main', 'nav', 'ol', 'p', 'pre', 'section', 'table', 'tbody', 'tfoot',
+              'thead', 'tr', 'ul'}
+
+
+def is_hidden(element):
+    """True for elements a browser doesn't render: scripts and styles,
+    the hidden attribute and inline display: none or visibility: hidden."""
+    if not isinstance(element.tag, str) or element.tag in HIDDEN_TAGS:
+        return True
+    if element.get('hidden') is not None:
+        return True
+    style = ''.join(element.get('style', '').split()).lower()
+    return 'display:none' in style or 'visibility:hidden' in style
+
+
+def visible_text(element):
+    """Text of the visible nodes of an element, with a line break around
+    every block element."""
+    parts = []
+
+    def walk(node):
+        block = node.tag in BLOCK_TAGS
+        if block:
+            parts.append('\n')
+        parts.append(node.text or '')
+        for child in node:
+            if not is_hidden(child):
+                walk(child)
+            parts.append(child.tail or '')
+        if block:
+            parts.append('\n')
+
+    if not is_hidden(element):
+        walk(element)
+    return ''.join(parts)
+
+
+def collapse(text: str):
+    """Joins the words of a text with single spaces, like the browser
+    collapses whitespace. Non-breaking spaces count as whitespace."""
+    return ' '.join(text.replace('\xa0', ' ').split())
+
+
+def element_lines(element):
+    """Renders the text of an element the way WebElement.text does for the
+    valuation tables: one line per table row with its cells separated by
+    spaces. Header cells are rendered one per line. Whitespace is collapsed
+    and hidden elements are left out.
+
+    Args:
+        element (lxml.html.HtmlElement): Element to render.
+
+    Returns:
+        list: Non-empty lines of text.
+    """
+    rows = element.xpath('self::tr|.//tr')
+    if not rows:
+        return [line for line in map(collapse, visible_text(element).splitlines()) if line]
+
+    lines = []
+    for row in rows:
+        if is_hidden(row) or any(is_hidden(node) for node in row.iterancestors()):
+            continue
+        cells = [collapse(visible_text(cell)) for cell in row.xpath('./th|./td')]
+        if element.tag == 'thead':
+            lines.extend(cells)
+        else:
+            lines.append(' '.join(cell for cell in cells if cell))
+    return [line for line in lines if line]
+
+
+def find_lines(tree, key: str):
+    """Finds an element by its XPATHS key and renders its lines.
+
+    Args:
+        tree (lxml.html.HtmlElement): Parsed page.
+        key (str): Key in XPATHS.
+
+    Returns:
+        list: Lines of text. None if the element is missing.
+    """
+    elements = tree.xpath(XPATHS.get(key))
+    if not elements:
+        print(f'ERROR ~ Section missing from snapshot: {key}')
+        return None
+    return element_lines(elements[0])
+
+
+def parse_sections(tree):
+    """Parses every valuation section of a page.
+
+    Args:
+        tree (lxml.html.HtmlElement): Parsed page.
+
+    Returns:
+        dict: rev, eps, growth_yrs, roe, roic, op_eff_yrs, bvps and fcfps.
+              Values of missing sections are None.
+    """
+    return parse_section_lines({key: find_lines(tree, key) for key in SECTION_KEYS})
+
+
+def read_tree(source: str|bytes):
+    """Parses raw HTML or a saved HTML file.
+
+    Args:
+        source (str | bytes): Raw HTML or the path to a saved HTML file.
+
+    Returns:
+        tuple: Stock name from the page title and the parsed page.
+    """
+    if isinstance(source, str) and os.path.isfile(source):
+        with open(source, 'rb') as file:
+            source = file.read()
+    if isinstance(source, bytes):
+        source = source.decode('utf-8')
+    tree = html.fromstring(source)
+
+    title = tree.findtext('.//title')
+    return (title.strip() if title is not None else ''), tree
+
+
+def snapshot_lines(source: str|bytes):
+    """Reads the stock name and the text lines of every section.
+
+    Args:
+        source (str | bytes): Raw HTML or the path to a saved HTML file.
+
+    Returns:
+        tuple: Stock name and a dict of key in SECTION_KEYS -> lines.
+    """
+    stock_name, tree = read_tree(source)
+    return stock_name, {key: find_lines(tree, key) for key in SECTION_KEYS}
+
+
+def parse_snapshot(source: str|bytes):
+    """Parses a valuation page snapshot into the same values scrape_link
+    returns for a live page.
+
+    Args:
+        source (str | bytes): Raw HTML or the path to a saved HTML file.
+
+    Returns:
+        tuple: Stock name, moat dataframe, management dataframe and free cash
+               flow per share.
+    """
+    stock_name, tree = read_tree(source)
+    sections = parse_sections(tree)
+
+    moat, management = create_dataframes(
+        sections['rev'], sections['eps'], sections['bvps'],
+        sections['roe'], sections['roic'],
+        sections['growth_yrs'], sections['op_eff_yrs']
+    )
+    return stock_name, moat, management, sections['fcfps']
+
+
+def parse_snapshots(sources: list, workers: int = None):
+    """Parses many snapshots in parallel processes.
+
+    Args:
+        sources (list): Raw HTML strings or paths to saved HTML files.
+        workers (int, optional): Number of processes. Defaults to the number
+                                 of CPUs.
+
+    Returns:
+        list: Output of parse_snapshot for each source, in the same order.
+    """
+    if workers == 1:
+        return [parse_snapshot(source) for source in sources]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(parse_snapshot, sources, chunksize=16))
+
+
+def snapshot_universe(sources: list, workers: int = None):
+    """Parses many snapshots into a Universe without building DataFrames.
+    Pages are read in parallel processes and their text is parsed in one
+    batch.
+
+    Args:
+        sources (list): Raw HTML strings or paths to saved HTML files.
+        workers (int, optional): Number of processes. Defaults to the number
+                                 of CPUs.
+
+    Returns:
+        Universe: Metrics of every snapshot, in the same order.
+    """
+    from universe import Universe
+
+    if workers == 1:
+        pages = [snapshot_lines(source) for source in sources]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pages = list(executor.map(snapshot_lines, sources, chunksize=16))
+
+    names = [name for name, _ in pages]
+    tickers = [name.split()[0] if name else '' for name in names]
+    return Universe.from_sections(tickers, names, parse_batch([lines for _, lines in pages]))
@@ -0,0 +1,208 @@
+"""Persistent columnar store of scraped tables and computed prices.
+
+Scraped moat and management tables are kept in long format, keyed by ticker,
+table, fiscal year and metric. Prices are keyed by ticker and the latest
+fiscal year. Both live in Parquet files under one directory. Refresh runs use
+the store to skip scraping tickers whose tables are recent enough.
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from sinks import FIELDS, clean_value
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'store')
+MAX_AGE = 24 * 60 * 60  # Seconds a scrape is reused for
+
+# Column order of the scraped tables
+TABLE_COLUMNS = {
+    'moat': ['Revenue %', 'EPS %', 'BVPS %'],
+    'management': ['ROE %', 'ROIC %'],
+}
+
+SCRAPE_COLUMNS = ['ticker', 'table', 'fiscal_year', 'metric', 'value', 'scraped_at']
+STOCK_COLUMNS = ['ticker', 'name', 'fcfps', 'scraped_at']
+PRICE_COLUMNS = ['ticker', 'fiscal_year', 'valued_at'] + FIELDS[1:]
+
+
+class ResultsStore:
+    """Parquet-backed store of scrapes and prices. Writes are buffered until
+    flush or close.
+
+    Args:
+        root (str, optional): Directory holding the Parquet files.
+                              Defaults to STORE_DIR.
+    """
+
+    def __init__(self, root: str = STORE_DIR):
+        self.root = root
+        self._tables = {}
+        self._pending = {'scrapes': [], 'stocks': [], 'prices': []}
+        self._dirty = set()
+
+    def _path(self, name: str):
+        return os.path.join(self.root, f'{name}.parquet')
+
+    def _load(self, name: str, columns: list, keys: list, unique: bool = True):
+        """Reads a table once and merges in pending rows, replacing stored
+        rows with the same keys. unique means keys identify a single row."""
+        if name not in self._tables:
+            path = self._path(name)
+            self._tables[name] = pd.read_parquet(path) if os.path.exists(path) \
+                else pd.DataFrame(columns=columns)
+
+        pending = self._pending[name]
+        if pending:
+            df = self._tables[name]
+            new = pd.DataFrame(pending, columns=columns)
+            if unique:
+                new = new.drop_duplicates(subset=keys, keep='last')
+            old_keys = pd.MultiIndex.from_frame(df[keys]) if len(keys) > 1 else df[keys[0]]
+            new_keys = pd.MultiIndex.from_frame(new[keys]) if len(keys) > 1 else new[keys[0]]
+            df = df[~old_keys.isin(new_keys)]
+            self._tables[name] = pd.concat([part for part in (df, new) if not part.empty],
+                                           ignore_index=True) if not df.empty else new
+            self._pending[name] = []
+            self._dirty.add(name)
+        return self._tables[name]
+
+    @property
+    def scrapes(self):
+        """Long table of scraped metrics."""
+        return self._load('scrapes', SCRAPE_COLUMNS, ['ticker'], unique=False)
+
+    @property
+    def stocks(self):
+        """Stock name and free cash flow per share of each scrape."""
+        return self._load('stocks', STOCK_COLUMNS, ['ticker'])
+
+    @property
+    def prices(self):
+        """Computed prices keyed by ticker and fiscal year."""
+        return self._load('prices', PRICE_COLUMNS, ['ticker', 'fiscal_year'])
+
+    def save_scrape(self, ticker: str, stock_name: str, moat: pd.DataFrame,
+                    management: pd.DataFrame, fcfps: float, scraped_at: float = None):
+        """Replaces the stored scrape of a ticker. A failed scrape, without
+        either table, is not saved, so it doesn't make the ticker fresh and
+        the ticker is scraped again next run.
+
+        Args:
+            ticker (str): Ticker symbol.
+            stock_name (str): Page title.
+            moat (pd.DataFrame): Moat dataframe from create_dataframes.
+            management (pd.DataFrame): Management dataframe from create_dataframes.
+            fcfps (float): Free cash flow per share.
+            scraped_at (float, optional): Unix time. Defaults to now.
+        """
+        if moat is None and management is None:
+            return
+        scraped_at = time.time() if scraped_at is None else scraped_at
+        # Scrapes are replaced per ticker, so only the latest rows are kept
+        self._pending['scrapes'] = [row for row in self._pending['scrapes'] if row[0] != ticker]
+        for table, df in (('moat', moat), ('management', management)):
+            if df is None:
+                continue
+            for metric in df.columns:
+                for year, value in df[metric].items():
+                    self._pending['scrapes'].append(
+                        (ticker, table, int(year), metric, float(value), scraped_at)
+                    )
+        self._pending['stocks'].append((ticker, stock_name, clean_value(fcfps), scraped_at))
+
+    def load_scrape(self, ticker: str, max_age: float = MAX_AGE, now: float = None):
+        """Rebuilds a stored scrape if it is recent enough.
+
+        Args:
+            ticker (str): Ticker symbol.
+            max_age (float, optional): Oldest scrape, in seconds, to reuse.
+                                       Defaults to MAX_AGE.
+            now (float, optional): Unix time. Defaults to now.
+
+        Returns:
+            tuple: Stock name, moat dataframe, management dataframe and free
+                   cash flow per share, like scrape_link. None if the ticker
+                   has no recent scrape.
+        """
+        now = time.time() if now is None else now
+        stock = self.stocks[self.stocks['ticker'] == ticker]
+        if stock.empty or now - stock['scraped_at'].iloc[-1] > max_age:
+            return None
+
+        rows = self.scrapes[self.scrapes['ticker'] == ticker]
+        tables = {}
+        for table, columns in TABLE_COLUMNS.items():
+            part = rows[rows['table'] == table]
+            if part.empty:
+                tables[table] = None
+                continue
+            df = part.pivot(index='fiscal_year', columns='metric', values='value')
+            df = df[[col for col in columns if col in df.columns]].sort_index()
+            df.index = df.index.astype(int)
+            df.index.name = None
+            df.columns.name = None
+            tables[table] = df
+
+        fcfps = stock['fcfps'].iloc[-1]
+        fcfps = None if fcfps is None or np.isnan(fcfps) else float(fcfps)
+        return stock['name'].iloc[-1], tables['moat'], tables['management'], fcfps
+
+    def fresh_tickers(self, max_age: float = MAX_AGE, now: float = None):
+        """Tickers whose stored scrape is recent enough to reuse.
+
+        Args:
+            max_age (float, optional): Oldest scrape, in seconds, to reuse.
+                                       Defaults to MAX_AGE.
+            now (float, optional): Unix time. Defaults to now.
+
+        Returns:
+            set: Ticker symbols.
+        """
+        now = time.time() if now is None else now
+        stocks = self.stocks
+        return set(stocks.loc[now - stocks['scraped_at'] <= max_age, 'ticker'])
+
+    def save_prices(self, record: dict, valued_at: float = None):
+        """Upserts the prices of a valuation record, keyed by ticker and the
+        latest fiscal year of its moat table.
+
+        Args:
+            record (dict): Record from value_stock.
+            valued_at (float, optional): Unix time. Defaults to now.
+        """
+        valued_at = time.time() if valued_at is None else valued_at
+        years = [int(year) for table in ('moat', 'management') if record.get(table)
+                 for col in record[table].values() for year in col if year != 'Avgs']
+        fiscal_year = max(years) if years else -1
+
+        row = clean_value({field: record.get(field) for field in FIELDS})
+        row.update(fiscal_year=fiscal_year, valued_at=valued_at)
+        self._pending['prices'].append([row[col] for col in PRICE_COLUMNS])
+
+    def flush(self):
+        """Writes changed tables to disk."""
+        for name in self._pending:
+            getattr(self, name)  # Merges pending rows
+        if not self._dirty:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        for name in sorted(self._dirty):
+            df = self._tables[name]
+            path = self._path(name)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        self._dirty.clear()
+
+    def close(self):
+        """Flushes changes."""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
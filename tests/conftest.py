@@ -0,0 +1,33 @@
+import asyncio
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def serve():
+    """Serves aiohttp applications from a background event loop, so code
+    under test can run its own loop. Returns a function taking an app and
+    returning its base URL."""
+    from aiohttp import web
+
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    runners = []
+
+    def start(app):
+        async def setup():
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', 0).start()
+            runners.append(runner)
+            return runner.addresses[0][1]
+        port = asyncio.run_coroutine_threadsafe(setup(), loop).result(5)
+        return f'http://127.0.0.1:{port}'
+
+    yield start
+    for runner in runners:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
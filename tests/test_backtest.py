@@ -0,0 +1,89 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import History, backtest, forward_drawdowns, forward_returns
+
+
+def loop_returns(series: list, horizon: int):
+    """Forward returns of one series, one date at a time."""
+    returns = []
+    for i, close in enumerate(series):
+        if i + horizon >= len(series):
+            returns.append(math.nan)
+        else:
+            returns.append(series[i + horizon]/close - 1)
+    return returns
+
+
+def loop_drawdowns(series: list, horizon: int):
+    """Largest fall below each close within the next horizon closes."""
+    drawdowns = []
+    for i, close in enumerate(series):
+        window = [x for x in series[i + 1:i + horizon + 1] if not math.isnan(x)]
+        if i + horizon >= len(series) or math.isnan(close) or not window:
+            drawdowns.append(math.nan)
+        else:
+            drawdowns.append(min(min(window)/close - 1, 0))
+    return drawdowns
+
+
+def series():
+    rng = np.random.default_rng(0)
+    walk = 100*np.exp(np.cumsum(rng.normal(0, 0.02, 60)))
+    gaps = walk.copy()
+    gaps[[0, 5, 6, 7, 8, 9, 30, 59]] = np.nan
+    return np.column_stack([
+        walk,
+        gaps,
+        np.linspace(10, 70, 60),  # All rising
+        np.linspace(70, 10, 60),  # All falling
+        np.full(60, 5.0),
+        np.full(60, np.nan),
+    ])
+
+
+@pytest.mark.parametrize('horizon', [1, 2, 3, 4, 5, 7, 8, 21, 59, 60, 80])
+def test_kernels_match_loop(horizon):
+    prices = series()
+    returns, drawdowns = forward_returns(prices, horizon), forward_drawdowns(prices, horizon)
+    for col in range(prices.shape[1]):
+        closes = prices[:, col].tolist()
+        np.testing.assert_allclose(returns[:, col], loop_returns(closes, horizon),
+                                   rtol=1e-12, equal_nan=True)
+        np.testing.assert_allclose(drawdowns[:, col], loop_drawdowns(closes, horizon),
+                                   rtol=1e-12, equal_nan=True)
+
+
+def test_rising_and_falling_series():
+    prices = series()
+    drawdowns = forward_drawdowns(prices, 5)[:-5]
+    assert (drawdowns[:, 2] == 0).all()
+    np.testing.assert_allclose(drawdowns[:, 3], prices[5:, 3]/prices[:-5, 3] - 1)
+    assert (drawdowns[:, 4] == 0).all()
+    # A gap five wide leaves nothing to fall to after date 4
+    assert np.isnan(drawdowns[4, 1]) and not np.isnan(drawdowns[3, 1])
+
+
+def test_all_group_matches_loop():
+    prices = series()
+    dates = pd.bdate_range('2020-01-01', periods=len(prices))
+    tickers = [f'T{i}' for i in range(prices.shape[1])]
+    report = backtest(History(dates, tickers, prices, {}), horizons=[5, 21], chunk=4)
+    for horizon in (5, 21):
+        returns, drawdowns = [], []
+        for col in range(prices.shape[1]):
+            closes = prices[:, col].tolist()
+            for r, d in zip(loop_returns(closes, horizon), loop_drawdowns(closes, horizon)):
+                if not math.isnan(r):
+                    returns.append(r)
+                    drawdowns.append(d)
+        row = report.loc[('all', horizon)]
+        assert row['signals'] == len(returns)
+        assert row['mean_return'] == pytest.approx(np.mean(returns), rel=1e-12)
+        assert row['hit_rate'] == pytest.approx(np.mean(np.array(returns) > 0), rel=1e-12)
+        assert row['mean_drawdown'] == pytest.approx(np.mean(drawdowns), rel=1e-12)
+        assert row['max_drawdown'] == pytest.approx(min(drawdowns), rel=1e-12)
+        assert report.loc[('mos', horizon), 'signals'] == 0
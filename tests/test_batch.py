@@ -0,0 +1,89 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch import value_universe
+
+MARR = 0.15
+EPS_GR_LIM = 0.25
+
+
+# Reference prices written out from the formulas of the original scalar
+# functions, independently of the vector kernels in valuation.py.
+# npf.fv(r, n, 0, -pv) is pv*(1 + r)**n and npf.pv(r, n, 0, -fv) is fv/(1 + r)**n.
+
+def mos(eps, growth, marr=MARR):
+    growth = 0.1 if growth > EPS_GR_LIM else growth
+    eps_fv = eps*(1 + growth)**10
+    price_fv = eps_fv*growth*2*100
+    return price_fv/(1 + marr)**10/2
+
+
+def ten_cap(fcfps, shares, capex, tax, industry):
+    capex = 0 if industry == 'Financial Services' else capex
+    operating_cf = fcfps*shares - capex
+    owner_earnings = sum([operating_cf, capex/2, tax])
+    return owner_earnings/shares*10
+
+
+def payback(fcfps, marr=MARR):
+    return sum(fcfps*(1 + marr)**year for year in range(1, 11))
+
+
+def dcf(fcfps, growth, marr=MARR, terminal_growth=0.03):
+    growth = 0.1 if growth > EPS_GR_LIM else growth
+    cash_flow, value = fcfps, 0.0
+    for year in range(1, 11):
+        fade = min(max(year - 5, 0)/5, 1)
+        cash_flow *= 1 + growth + (terminal_growth - growth)*fade
+        value += cash_flow/(1 + marr)**year
+    terminal = cash_flow*(1 + terminal_growth)/(marr - terminal_growth)
+    return value + terminal/(1 + marr)**10
+
+
+@pytest.fixture
+def universe():
+    rng = np.random.default_rng(3)
+    n = 200
+    return pd.DataFrame({
+        'eps': rng.uniform(-5, 20, n),
+        'growth': rng.uniform(-0.2, 0.4, n),  # Some above EPS_GR_LIM
+        'fcfps': rng.uniform(-3, 15, n),
+        'shares': rng.uniform(1e7, 1e10, n),
+        'capex': -rng.uniform(0, 5e9, n),
+        'tax': rng.uniform(0, 3e9, n),
+        'industry': rng.choice(['Technology', 'Financial Services'], n),
+    }, index=[f'T{i}' for i in range(n)])
+
+
+def test_batch_matches_original_formulas(universe):
+    prices = value_universe(universe)
+    for ticker, row in universe.iterrows():
+        price = prices.loc[ticker]
+        assert price['MOS'] == pytest.approx(mos(row.eps, row.growth), rel=1e-12)
+        assert price['Ten Cap'] == pytest.approx(
+            ten_cap(row.fcfps, row.shares, row.capex, row.tax, row.industry), rel=1e-12)
+        # Summed in a different order, so this one can differ by an ulp
+        assert price['8 Yr Payback'] == pytest.approx(payback(row.fcfps), rel=1e-12)
+        assert price['DCF'] == pytest.approx(dcf(row.fcfps, row.growth), rel=1e-12)
+
+
+def test_batch_matches_npf_payback():
+    npf = pytest.importorskip('numpy_financial')
+    fcfps = np.array([0.5, 3.2, 7.77, 12.0])
+    prices = value_universe({'eps': fcfps, 'growth': fcfps/100, 'fcfps': fcfps,
+                             'shares': fcfps*1e9, 'capex': -fcfps, 'tax': fcfps})
+    for value, price in zip(fcfps, prices['8 Yr Payback']):
+        expected = np.sum([npf.fv(MARR, year, 0, -value) for year in range(1, 11)])
+        assert price == pytest.approx(expected, rel=1e-12)
+
+
+def test_missing_inputs_are_nan():
+    prices = value_universe({'eps': [np.nan, 2.0], 'growth': [0.1, 0.1],
+                             'fcfps': [1.0, np.nan], 'shares': [1e9, 1e9],
+                             'capex': [-1e8, -1e8], 'tax': [1e7, 1e7]})
+    assert math.isnan(prices['MOS'].iloc[0]) and not math.isnan(prices['MOS'].iloc[1])
+    assert prices.iloc[1][['Ten Cap', '8 Yr Payback', 'DCF']].isna().all()
+    assert not prices.iloc[0][['Ten Cap', '8 Yr Payback', 'DCF']].isna().any()
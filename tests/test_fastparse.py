@@ -0,0 +1,66 @@
+import copy
+import importlib.util
+import json
+import os
+
+import pytest
+
+import fastparse
+import valuation
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'benchmarks', 'fixtures')
+
+
+def generator():
+    spec = importlib.util.spec_from_file_location('generate',
+                                                  os.path.join(FIXTURES, 'generate.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def sections_of(fixtures: list):
+    return [stock['sections'] for stock in fixtures]
+
+
+def assert_same(parsed: dict, reference: dict):
+    assert list(parsed) == list(reference)
+    for field, value in reference.items():
+        assert parsed[field] == pytest.approx(value, nan_ok=True), field
+
+
+def check(batch: list):
+    # The reference parsers may edit their input, so each gets its own copy
+    references = [valuation.parse_section_lines_reference(copy.deepcopy(lines))
+                  for lines in batch]
+    for parsed, reference in zip(fastparse.parse_batch(batch), references):
+        assert_same(parsed, reference)
+    for lines, reference in zip(batch, references):
+        assert_same(valuation.parse_section_lines(lines), reference)
+
+
+def test_matches_reference_on_fixtures():
+    with open(os.path.join(FIXTURES, 'sections.json'), encoding='utf-8') as file:
+        fixtures = json.load(file)
+    # Full and short histories, "—" cells and a Financial Services stock
+    assert {len(stock['sections']['op_eff_years']) for stock in fixtures} == {8, 11, 14}
+    assert any('—' in line for stock in fixtures for line in stock['sections']['growth'])
+    check(sections_of(fixtures))
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_matches_reference_on_generated_fixtures(seed):
+    check(sections_of(generator().generate(seed)))
+
+
+@pytest.mark.filterwarnings('ignore:Mean of empty slice')
+def test_matches_reference_on_sparse_rows():
+    stock = generator().generate()[0]['sections']
+    sparse = copy.deepcopy(stock)
+    sparse['fin_health'][0] = 'Book Value/Share ' + ' '.join(['—']*11)
+    # The TTM cell, read by both parsers, stays a number
+    sparse['cash_flow'][0] = 'Free Cash Flow/Share — — — — — — — — — 1,234.50 —'
+    sparse['op_eff'][6] = 'Return on Equity % ' + ' '.join(['—']*13)
+    missing = dict(stock, growth=None, cash_flow=None)
+    check([sparse, missing, stock])
@@ -0,0 +1,100 @@
+import json
+import time
+
+import pytest
+
+import fetch
+from fetch import FundamentalsFetcher, prefetch
+from fundamentals import FundamentalsCache
+from resilience import Resilience
+
+ROW = {'maxAge': 1, 'endDate': {'raw': 1672444800, 'fmt': '2022-12-31'},
+       'capitalExpenditures': {'raw': -5e8, 'fmt': '-500M'},
+       'incomeTaxExpense': {'raw': 1e8, 'fmt': '100M'}}
+STORE = {'incomeStatementHistory': {'incomeStatementHistory': [ROW]},
+         'balanceSheetHistory': {'balanceSheetStatements': [ROW]},
+         'cashflowStatementHistory': {'cashflowStatements': [ROW]},
+         'assetProfile': {'sector': 'Technology', 'companyOfficers': []}}
+BACKOFF = 0.5  # Jittered, so the retry waits up to this long
+
+
+def page_text(store: dict):
+    app = {'context': {'dispatcher': {'stores': {'QuoteSummaryStore': store}}}}
+    return f'(function (root) {{\nroot.App.main = {json.dumps(app)};\n}}(this));'
+
+
+@pytest.fixture
+def resilience(monkeypatch):
+    guards = Resilience({'yahoo': {'rate': None, 'backoff': BACKOFF, 'failures': 100}})
+    monkeypatch.setattr(fetch, 'RESILIENCE', guards)
+    return guards
+
+
+@pytest.fixture
+def yahoo(serve):
+    """Stub of the quote API and quote pages. The first quote request is
+    throttled with a 429 when state['throttle'] is set."""
+    from aiohttp import web
+
+    state = {'throttle': False, 'quotes': [], 'pages': []}
+
+    async def quote(request):
+        symbols = request.query['symbols'].split(',')
+        state['quotes'].append((time.monotonic(), symbols))
+        if state['throttle']:
+            state['throttle'] = False
+            return web.Response(status=429)
+        return web.json_response({'quoteResponse': {'result': [
+            {'symbol': symbol, 'sharesOutstanding': 1e9, 'regularMarketPrice': 100.0}
+            for symbol in symbols if symbol != 'BAD']}})
+
+    async def page(request):
+        state['pages'].append((time.monotonic(), request.match_info['page']))
+        return web.Response(text=page_text(STORE))
+
+    app = web.Application()
+    app.router.add_get('/quote', quote)
+    app.router.add_get('/page/{ticker}/{page}', page)
+    url = serve(app)
+    return url, state
+
+
+def fetcher(url, concurrency=8):
+    return FundamentalsFetcher(concurrency, quote_url=f'{url}/quote', page_url=f'{url}/page')
+
+
+def test_quotes_are_batched(yahoo, resilience):
+    url, state = yahoo
+    tickers = [f'T{i:03}' for i in range(120)] + ['BAD']
+    cache = FundamentalsCache(cache_dir=None)
+    errors = prefetch(tickers, cache, fetcher(url), statements=['quote'])
+
+    assert sorted(len(symbols) for _, symbols in state['quotes']) == [21, 50, 50]
+    assert list(errors) == [('BAD', 'quote')] and isinstance(errors['BAD', 'quote'], KeyError)
+    assert cache.get('T119', 'quote')['sharesOutstanding'] == 1e9
+
+
+def test_statements_share_pages(yahoo, resilience):
+    url, state = yahoo
+    cache = FundamentalsCache(cache_dir=None)
+    assert prefetch(['AAPL'], cache, fetcher(url)) == {}
+    assert sorted(page for _, page in state['pages']) == [
+        'balance-sheet', 'cash-flow', 'financials', 'profile']
+    assert cache.get('AAPL', 'cash_flow').loc['capitalExpenditures'].iloc[0] == -5e8
+    assert cache.get('AAPL', 'company_info').loc['sector', 'Value'] == 'Technology'
+
+
+def test_throttled_request_is_retried_without_a_slot(yahoo, resilience):
+    url, state = yahoo
+    state['throttle'] = True
+    cache = FundamentalsCache(cache_dir=None)
+    errors = prefetch(['AAPL'], cache, fetcher(url, concurrency=1),
+                      statements=['quote', 'cash_flow'])
+
+    assert errors == {}
+    assert cache.get('AAPL', 'quote')['regularMarketPrice'] == 100.0
+    assert resilience.stats()['yahoo']['retries'] == 1
+    (throttled, _), (retried, _) = state['quotes']
+    (page, _), = state['pages']
+    # With one slot, the page is fetched while the quote waits out its backoff
+    assert throttled < page < retried
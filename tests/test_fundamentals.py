@@ -0,0 +1,87 @@
+import threading
+import time
+
+import fundamentals
+from fundamentals import FundamentalsCache
+
+
+class CountingCache(FundamentalsCache):
+    """Cache whose loads are counted instead of calling yahoo_fin."""
+
+    def __init__(self, delay: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.delay = delay
+        self.loads = []
+
+    def load(self, ticker, statement):
+        self.loads.append((ticker, statement))
+        time.sleep(self.delay)
+        return {'statement': statement, 'load': len(self.loads)}
+
+
+def test_quote_expires_before_statements(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(fundamentals.time, 'time', lambda: now[0])
+    cache = CountingCache(ttl=3600, quote_ttl=60)
+    cache.get('AAPL', 'quote')
+    cache.get('AAPL', 'cash_flow')
+
+    now[0] += 120
+    cache.get('AAPL', 'quote')
+    cache.get('AAPL', 'cash_flow')
+    assert cache.loads == [('AAPL', 'quote'), ('AAPL', 'cash_flow'), ('AAPL', 'quote')]
+
+
+def test_quote_ttl_is_capped_by_ttl(tmp_path):
+    cache = CountingCache(ttl=0, quote_ttl=60, cache_dir=str(tmp_path))
+    cache.get('AAPL', 'quote')
+    cache.get('AAPL', 'quote')
+    assert len(cache.loads) == 2
+
+
+def test_stale_quote_on_disk_is_reloaded(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(fundamentals.time, 'time', lambda: now[0])
+    CountingCache(cache_dir=str(tmp_path)).get('AAPL', 'quote')
+
+    now[0] += fundamentals.QUOTE_TTL + 1
+    cache = CountingCache(cache_dir=str(tmp_path))
+    assert cache.get('AAPL', 'quote')['load'] == 1
+    assert cache.loads == [('AAPL', 'quote')]
+
+
+def test_concurrent_misses_load_once():
+    cache = CountingCache(delay=0.1)
+    results = []
+    barrier = threading.Barrier(8)
+
+    def get():
+        barrier.wait()
+        results.append(cache.get('AAPL', 'cash_flow'))
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.loads == [('AAPL', 'cash_flow')]
+    assert len(results) == 8 and all(result is results[0] for result in results)
+    assert cache.misses == 1 and cache.hits == 7
+    assert cache._loading == {}
+
+
+def test_failed_load_is_not_cached():
+    class Failing(CountingCache):
+        def load(self, ticker, statement):
+            super().load(ticker, statement)
+            if len(self.loads) == 1:
+                raise OSError('throttled')
+            return 'ok'
+
+    cache = Failing()
+    try:
+        cache.get('AAPL', 'quote')
+    except OSError:
+        pass
+    assert cache.get('AAPL', 'quote') == 'ok'
+    assert cache._loading == {}
@@ -0,0 +1,83 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from forex_python import converter
+
+import fx
+from fx import FxRates
+from resilience import Resilience
+
+RATES = {'USD': {'CAD': 1.25, 'EUR': 0.9}, 'EUR': {'CAD': 1.5, 'USD': 1.1}}
+
+
+class StubRates:
+    """Stands in for forex_python's CurrencyRates."""
+
+    calls = []
+
+    def get_rates(self, base):
+        StubRates.calls.append(base)
+        if base not in RATES:
+            raise converter.RatesNotAvailableError('Currency Rates Source Not Ready')
+        return dict(RATES[base])
+
+
+@pytest.fixture
+def source(monkeypatch):
+    StubRates.calls = []
+    clock = [1000.0]
+    monkeypatch.setattr(converter, 'CurrencyRates', StubRates)
+    monkeypatch.setattr(fx.time, 'time', lambda: clock[0])
+    monkeypatch.setattr(fx, 'RESILIENCE', Resilience(
+        {'forex': {'rate': None, 'backoff': 0, 'attempts': 1, 'failures': 100}}))
+    return clock
+
+
+def test_rates_are_cached_until_the_ttl(source):
+    rates = FxRates(ttl=60)
+    assert rates.rate('USD') == 1.25
+    source[0] += 59
+    assert rates.convert(10, 'USD', 'EUR') == pytest.approx(9.0)
+    assert StubRates.calls == ['USD']
+
+    source[0] += 1
+    RATES['USD']['CAD'] = 1.3
+    try:
+        assert rates.rate('USD') == 1.3
+    finally:
+        RATES['USD']['CAD'] = 1.25
+    assert StubRates.calls == ['USD', 'USD']
+    assert rates.rate('CAD') == 1.0 and StubRates.calls == ['USD', 'USD']
+
+
+def test_pinned_rates_are_never_fetched(source, tmp_path):
+    path = str(tmp_path / 'rates.json')
+    FxRates().save(path, bases=['USD', 'EUR'])
+    with open(path) as file:
+        assert json.load(file) == RATES
+    StubRates.calls = []
+
+    rates = FxRates.from_file(path)
+    source[0] += 10**9
+    assert rates.rate('EUR', 'USD') == 1.1
+    np.testing.assert_allclose(rates.convert([1, 2], 'EUR'), [1.5, 3.0])
+    with pytest.raises(KeyError, match='No pinned exchange rates for GBP'):
+        rates.rate('GBP')
+    assert StubRates.calls == []
+
+
+def test_missing_currency(source):
+    rates = FxRates()
+    with pytest.raises(KeyError, match='No exchange rate from USD to JPY'):
+        rates.convert(10, 'USD', 'JPY')
+    with pytest.raises(converter.RatesNotAvailableError):
+        rates.convert(10, 'GBP')
+
+    df = pd.DataFrame({'price': [10.0, 20.0, 30.0], 'currency': ['USD', 'CAD', 'EUR']})
+    converted = rates.convert_columns(df, ['price'], 'currency')
+    assert converted['price'].tolist() == pytest.approx([12.5, 20.0, 45.0])
+    with pytest.raises(KeyError, match='No exchange rate from EUR to JPY'):
+        rates.convert_columns(df.assign(currency='EUR'), ['price'], 'currency', 'JPY')
+    assert df['price'].tolist() == [10.0, 20.0, 30.0]
@@ -0,0 +1,169 @@
+import time
+
+import pandas as pd
+import pytest
+
+import keystats
+import valuation
+from keystats import AVERAGES, TABLES, KeyStatsSource
+from resilience import Resilience
+
+AVERAGE_LABELS = ['Year over Year', '3-Year Average', '5-Year Average', '10-Year Average']
+
+
+def stock(years: int, seed: int, na: int = 0):
+    """Key stats JSON of a stock and the page text of the same tables. Every
+    na-th value is missing."""
+    labels = [str(year) for year in range(2023 - years, 2023)] + ['TTM']
+    counter = iter(range(10**6))
+
+    def value():
+        i = next(counter)
+        return None if na and i % na == na - 1 else round((i*37 + seed*11) % 500/10 - 10, 2)
+
+    entries = [{'fiscalPeriodYear': label,
+                'revenuePer': {average: value() for average in AVERAGES},
+                'epsPer': {average: value() for average in AVERAGES},
+                'roe': value(), 'roic': value(), 'bookValuePerShare': value(),
+                'freeCashFlowPerShare': abs(value() or 1.0)} for label in labels]
+    # The API doesn't promise any order
+    tables = {key: {'dataList': entries[::-1]} for key in TABLES}
+
+    def row(label, get, extra=''):
+        cells = ['—' if get(entry) is None else f'{get(entry):,.2f}' for entry in entries]
+        return ' '.join([label, *cells]) + extra
+
+    growth = ['Revenue % ' + ' '.join(labels) + ' 5-Yr']
+    growth += [row(label, lambda e, a=average: e['revenuePer'][a])
+               for label, average in zip(AVERAGE_LABELS, AVERAGES)]
+    growth += ['Operating Income %', 'Year over Year 1.00', '3-Year Average 1.00',
+               '5-Year Average 1.00', '10-Year Average 1.00', 'EPS %']
+    growth += [row(label, lambda e, a=average: e['epsPer'][a])
+               for label, average in zip(AVERAGE_LABELS, AVERAGES)]
+    lines = {
+        'growth': growth,
+        'op_eff_years': ['Metric', *labels[:-1], 'TTM', '5-Yr'],
+        'op_eff': ['Gross Margin % ' + '1.00 '*(years + 2)]*6 + [
+            row('Return on Equity %', lambda e: e['roe'], ' 1.00'),
+            row('Return on Invested Capital %', lambda e: e['roic'], ' 1.00'),
+        ],
+        'fin_health': [row('Book Value/Share', lambda e: e['bookValuePerShare'])],
+        'cash_flow': [row('Free Cash Flow/Share', lambda e: e['freeCashFlowPerShare'])],
+    }
+    return tables, lines
+
+
+STOCKS = {'AAPL': stock(11, 1), 'KO': stock(6, 2, na=7), 'MSFT': stock(11, 3)}
+
+
+@pytest.fixture
+def resilience(monkeypatch):
+    guards = Resilience({'keystats': {'rate': None, 'backoff': 0, 'failures': 100}})
+    monkeypatch.setattr(keystats, 'RESILIENCE', guards)
+    return guards
+
+
+@pytest.fixture
+def api(serve):
+    from aiohttp import web
+
+    state = {'unavailable': 2, 'requests': 0, 'searches': [], 'tables': []}
+    endpoints = {path.split('/')[-1]: key for key, path in TABLES.items()}
+
+    async def search(request):
+        ticker = request.query['q']
+        state['searches'].append(ticker)
+        results = [{'performanceId': f'0P{ticker}', 'ticker': ticker, 'exchange': exchange,
+                    'name': f'{ticker} Inc'} for exchange in ('XNYS', 'XNAS')]
+        return web.json_response({'results': results if ticker in STOCKS or ticker == 'NOKEY'
+                                  else []})
+
+    async def table(request):
+        state['requests'] += 1
+        ticker = request.match_info['id'][2:]
+        state['tables'].append((time.monotonic(), ticker))
+        if ticker == 'NOKEY':
+            return web.json_response({'error': 'Unauthorized'}, status=401)
+        if ticker == 'MSFT' and state['unavailable']:
+            state['unavailable'] -= 1
+            return web.Response(status=503)
+        return web.json_response(STOCKS[ticker][0][endpoints[request.match_info['table']]])
+
+    app = web.Application()
+    app.router.add_get('/search', search)
+    app.router.add_get('/stock/keyStats/{table}/{id}', table)
+    url = serve(app)
+    return KeyStatsSource(f'{url}/stock', f'{url}/search'), state
+
+
+def link(ticker):
+    return f'https://www.morningstar.com/stocks/xnas/{ticker.lower()}/valuation'
+
+
+def expected(ticker):
+    sections = valuation.parse_section_lines_reference(STOCKS[ticker][1])
+    moat, management = valuation.create_dataframes(
+        sections['rev'], sections['eps'], sections['bvps'], sections['roe'],
+        sections['roic'], sections['growth_yrs'], sections['op_eff_yrs'])
+    return moat, management, sections['fcfps']
+
+
+def test_parse_batch_matches_page_text():
+    tables = [tables for tables, _ in STOCKS.values()]
+    for parsed, (_, lines) in zip(keystats.parse_batch(tables), STOCKS.values()):
+        reference = valuation.parse_section_lines_reference(lines)
+        for field, value in parsed.items():
+            assert value == pytest.approx(reference[field], nan_ok=True), field
+
+
+def test_scrape_links_matches_page_scrape(api, resilience):
+    source, _ = api
+    results = list(source.scrape_links([link(ticker) for ticker in STOCKS]))
+    assert [name for name, *_ in results] == [f'{t} {t} Inc | Valuation' for t in STOCKS]
+    for ticker, (_, moat, management, fcfps) in zip(STOCKS, results):
+        want_moat, want_management, want_fcfps = expected(ticker)
+        pd.testing.assert_frame_equal(moat, want_moat)
+        pd.testing.assert_frame_equal(management, want_management)
+        assert fcfps == want_fcfps
+
+
+def test_transient_errors_are_retried(api, resilience):
+    source, state = api
+    (_, moat, _, _), = source.scrape_links([link('MSFT')])
+    assert state['unavailable'] == 0
+    assert moat is not None
+    assert resilience.stats()['keystats']['retries'] == 2
+
+
+def test_failing_stocks_are_skipped(api, resilience, capsys):
+    source, _ = api
+    results = list(source.scrape_links([link('NOKEY'), link('ZZZZ'), link('AAPL')]))
+    assert [result[0] for result in results[:2]] == ['NOKEY', 'ZZZZ']
+    assert all(part is None for result in results[:2] for part in result[1:])
+    assert results[2][1] is not None
+    out = capsys.readouterr().out
+    assert 'ERROR ~ XNAS:ZZZZ not found' in out
+    assert 'ERROR ~ Key stats failed for' in out and '401' in out
+
+
+def test_throttled_request_is_retried_without_a_slot(api, monkeypatch):
+    source, state = api
+    source.concurrency = 1
+    guards = Resilience({'keystats': {'rate': None, 'backoff': 0.5, 'failures': 100}})
+    monkeypatch.setattr(keystats, 'RESILIENCE', guards)
+    results = list(source.scrape_links([link('MSFT'), link('AAPL')]))
+    assert all(moat is not None for _, moat, _, _ in results)
+
+    msft = [at for at, ticker in state['tables'] if ticker == 'MSFT']
+    aapl = [at for at, ticker in state['tables'] if ticker == 'AAPL']
+    # With one slot, AAPL is fetched while MSFT waits out its backoffs
+    assert min(msft) < min(aapl) and max(aapl) < max(msft)
+
+
+def test_security_is_searched_once(api, resilience):
+    source, state = api
+    quote = 'https://www.morningstar.com/stocks/xnas/aapl/quote'
+    links = [link('AAPL'), quote, link('ZZZZ'), link('ZZZZ'), link('AAPL')]
+    results = list(source.scrape_links(links, chunk=3))
+    assert [result[1] is not None for result in results] == [True, True, False, False, True]
+    assert sorted(state['searches']) == ['AAPL', 'ZZZZ']
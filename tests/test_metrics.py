@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from metrics import Metrics, StageStats
+
+
+def test_stage_stats_are_bounded_and_exact():
+    stats = StageStats(size=100)
+    durations = np.random.default_rng(0).uniform(0, 1, 10000)
+    for seconds in durations:
+        stats.add(float(seconds))
+    assert len(stats.sample) == 100
+    assert stats.count == 10000
+    assert stats.total == pytest.approx(durations.sum())
+    assert stats.max == durations.max()
+
+
+def test_summary_percentiles_come_from_the_sample():
+    metrics = Metrics()
+    for seconds in np.linspace(0, 1, 50001):
+        metrics.record('scrape', float(seconds))
+    summary = metrics.summary()['scrape']
+    assert summary['count'] == 50001
+    assert summary['total'] == pytest.approx(25000.5)
+    assert summary['max'] == 1.0
+    assert summary['p50'] == pytest.approx(0.5, abs=0.05)
+    assert summary['p95'] == pytest.approx(0.95, abs=0.02)
+    assert len(metrics.durations['scrape'].sample) <= 4096
+
+
+def test_stage_records_duration_and_ticker():
+    metrics = Metrics()
+    with metrics.ticker('AAPL'), metrics.stage('valuation'):
+        pass
+    assert metrics.summary()['valuation']['count'] == 1
+    assert 'valuation' in metrics.tickers['AAPL']
+
+
+def test_nested_failure_counts_once():
+    metrics = Metrics()
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            with metrics.ticker('AAPL'), metrics.stage('keystats'), metrics.stage('scrape'):
+                raise ValueError('no data')
+    assert metrics.counters['errors'] == 2
+    assert metrics.counters['errors.keystats'] == 2
+    assert metrics.counters['errors.scrape'] == 2
+    assert metrics.context.error is None
+
+
+def test_new_error_in_outer_stage_counts_again():
+    metrics = Metrics()
+    with pytest.raises(KeyError):
+        with metrics.stage('valuation'):
+            try:
+                with metrics.stage('fundamentals'):
+                    raise ValueError('throttled')
+            except ValueError:
+                raise KeyError('capitalExpenditures')
+    assert metrics.counters['errors'] == 2
+    assert metrics.counters['errors.fundamentals'] == 1
+    assert metrics.counters['errors.valuation'] == 1
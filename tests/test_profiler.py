@@ -0,0 +1,70 @@
+import os
+import threading
+
+from metrics import Metrics
+from profiler import AGGREGATE, TICKERS, Profiler
+
+
+def busy(metrics: Metrics, ticker: str, ready: threading.Barrier, done: threading.Event):
+    with metrics.ticker(ticker), metrics.stage('scrape'), metrics.stage('parse'):
+        ready.wait()
+        done.wait()
+
+
+def profile(tickers: list, rounds: int = 3):
+    """Samples threads that sit inside stages of each ticker."""
+    metrics = Metrics()
+    ready, done = threading.Barrier(len(tickers) + 1), threading.Event()
+    threads = [threading.Thread(target=busy, args=(metrics, ticker, ready, done))
+               for ticker in tickers]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    profiler = Profiler(metrics=metrics)
+    try:
+        for _ in range(rounds):
+            profiler.sample()
+    finally:
+        done.set()
+        for thread in threads:
+            thread.join()
+    return profiler
+
+
+def read(path: str):
+    with open(path) as file:
+        return [line.rsplit(' ', 1) for line in file.read().splitlines()]
+
+
+def test_collapsed_stacks_start_with_stages():
+    profiler = profile(['AAPL'])
+    (stack, count), = profiler.samples['AAPL'].items()
+    frames = stack.split(';')
+    assert frames[:2] == ['[scrape]', '[parse]']
+    assert frames[-1].startswith('wait (threading.py:')
+    assert any(frame.startswith('busy (test_profiler.py:') for frame in frames)
+    assert count == 3
+
+
+def test_idle_threads_are_not_sampled():
+    metrics = Metrics()
+    metrics.context  # Registered, but not in a stage or ticker
+    profiler = Profiler(metrics=metrics)
+    profiler.sample()
+    assert profiler.samples == {}
+
+
+def test_write_keeps_tickers_apart_from_the_aggregate(tmp_path):
+    profiler = profile(['ALL', 'BRK/B'])
+    paths = profiler.write(str(tmp_path))
+    assert sorted(os.path.relpath(path, tmp_path) for path in paths) == sorted([
+        f'{AGGREGATE}.folded', os.path.join(TICKERS, 'ALL.folded'),
+        os.path.join(TICKERS, 'BRK_B.folded')])
+
+    aggregate = read(os.path.join(tmp_path, f'{AGGREGATE}.folded'))
+    tickers = [read(os.path.join(tmp_path, TICKERS, name))
+               for name in ('ALL.folded', 'BRK_B.folded')]
+    assert sum(int(count) for _, count in aggregate) == 6
+    for lines in tickers:
+        assert sum(int(count) for _, count in lines) == 3
+        assert all(stack.startswith('[scrape];[parse];') for stack, _ in lines)
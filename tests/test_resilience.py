@@ -0,0 +1,76 @@
+import pytest
+
+from resilience import HOSTS, CircuitBreaker, CircuitOpenError, HostGuard, TransientError
+
+
+def yahoo_guard(**settings):
+    return HostGuard('yahoo', **dict(HOSTS['yahoo'], rate=None, backoff=0, **settings))
+
+
+def failing(error):
+    calls = []
+
+    def func():
+        calls.append(1)
+        raise error
+    return func, calls
+
+
+@pytest.mark.parametrize('error', [ConnectionError('reset'), TimeoutError(),
+                                   TransientError('HTTP 429')])
+def test_transport_errors_are_retried(error):
+    guard = yahoo_guard(attempts=3, failures=10)
+    func, calls = failing(error)
+    with pytest.raises(type(error)):
+        guard.call(func)
+    assert len(calls) == 3
+    assert guard.counters['failures'] == 3
+    assert guard.counters['retries'] == 2
+
+
+@pytest.mark.parametrize('error', [AssertionError('Invalid response from server'),
+                                   IndexError('list index out of range')])
+def test_missing_yahoo_data_fails_at_once(error):
+    guard = yahoo_guard(attempts=3, failures=2)
+    func, calls = failing(error)
+    for _ in range(5):
+        with pytest.raises(type(error)):
+            guard.call(func)
+    assert len(calls) == 5
+    assert guard.counters['failures'] == 0 and guard.counters['retries'] == 0
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_transport_errors_open_the_circuit():
+    guard = yahoo_guard(attempts=1, failures=2)
+    func, calls = failing(ConnectionError())
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            guard.call(func)
+    assert guard.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        guard.call(func)
+    assert len(calls) == 2
+
+
+def test_other_errors_are_not_a_success():
+    guard = yahoo_guard(attempts=1, failures=2)
+    with pytest.raises(ConnectionError):
+        guard.call(failing(ConnectionError())[0])
+    with pytest.raises(KeyError):
+        guard.call(failing(KeyError('sharesOutstanding'))[0])
+    assert guard.counters['failures'] == 1
+    with pytest.raises(ConnectionError):
+        guard.call(failing(ConnectionError())[0])
+    assert guard.breaker.state == CircuitBreaker.OPEN
+
+
+def test_other_error_in_trial_call_keeps_circuit_open():
+    guard = yahoo_guard(attempts=1, failures=1, reset=0)
+    with pytest.raises(ConnectionError):
+        guard.call(failing(ConnectionError())[0])
+    with pytest.raises(AssertionError):
+        guard.call(failing(AssertionError())[0])
+    assert guard.breaker.state == CircuitBreaker.OPEN
+    assert guard.call(lambda: 'ok') == 'ok'
+    assert guard.breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from screener import DISCOUNTS, Filter, Screener, screen, screen_row
+
+
+def records(n: int = 200, seed: int = 0):
+    rng = random.Random(seed)
+    for i in range(n):
+        price = rng.choice([None, float('nan'), 50.0, 100.0, 150.0])
+        yield {
+            'ticker': f'T{i}',
+            'industry': rng.choice(['Technology', 'Financial Services']),
+            'current_price': 100.0 if price is None else price,
+            # Few distinct prices, so many discounts tie
+            'mos': rng.choice([None, float('nan'), -10.0, 0.0, 80.0, 100.0, 125.0, 200.0]),
+            'ten_cap': rng.choice([None, 90.0, 110.0]),
+            'roic_avg': rng.choice([None, 5.0, 12.0, 20.0]),
+        }
+
+
+def reference(records, k: int, rank: str = 'mos', filters: list = ()):
+    """Rows that pass every filter and have a discount, sorted and cut at k."""
+    key = DISCOUNTS[rank]
+    rows = [screen_row(record) for record in records]
+    rows = [row for row in rows
+            if all(Filter(f)(row) for f in filters) and row[key] is not None]
+    return sorted(rows, key=lambda row: row[key], reverse=True)[:k]
+
+
+@pytest.mark.parametrize('k', [0, 1, 5, 20, 199, 200, 1000])
+@pytest.mark.parametrize('rank', ['mos', 'ten_cap'])
+def test_matches_sorted(k, rank):
+    results = screen(records(), k, rank)
+    assert results == reference(records(), k, rank)
+    assert len(results) <= k
+
+
+def test_ties_keep_the_earlier_record():
+    tied = [{'ticker': t, 'current_price': 50.0, 'mos': 100.0} for t in 'ABCDE']
+    assert [row['ticker'] for row in screen(tied, 3)] == ['A', 'B', 'C']
+    assert [row['ticker'] for row in screen(tied[::-1], 3)] == ['E', 'D', 'C']
+
+
+@pytest.mark.parametrize('filters', [
+    ['roic_avg>15'],
+    ['roic_avg>=12', 'industry=Technology'],
+    ['mos_discount>0.5'],
+    ['industry!=Technology', 'ten_cap<100'],
+])
+def test_filters_match_sorted(filters):
+    assert screen(records(), 10, filters=filters) == reference(records(), 10, filters=filters)
+
+
+def test_filters_that_remove_everything():
+    screener = Screener(5, filters=['roic_avg>100'], show=False)
+    for record in records():
+        screener.write(record)
+    assert screener.results() == []
+    assert (screener.seen, screener.passed) == (200, 0)
+    assert screener.to_frame().empty
+
+
+def test_k_larger_than_the_universe():
+    universe = list(records(12, seed=1))
+    results = screen(universe, 100)
+    assert results == reference(universe, 100)
+    assert len(results) == sum(row['mos_discount'] is not None
+                               for row in map(screen_row, universe))
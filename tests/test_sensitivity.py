@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch import universe_arrays
+from sensitivity import monte_carlo, nanpercentile_rows, scenario_prices
+from valuation import MARR
+
+PERCENTILES = (0, 5, 25, 50, 62.5, 95, 100)
+
+
+def prices():
+    rng = np.random.default_rng(7)
+    prices = rng.normal(100, 40, (60, 25))
+    prices[rng.random(prices.shape) < 0.3] = np.nan
+    prices[1] = np.nan  # All missing
+    prices[2, 1:] = np.nan  # One value
+    prices[3] = np.round(prices[3]/50)*50  # Ties
+    prices[4, :] = 7.0
+    return prices
+
+
+@pytest.mark.filterwarnings('ignore:All-NaN slice')
+def test_matches_nanpercentile():
+    values = prices()
+    np.testing.assert_allclose(nanpercentile_rows(values, PERCENTILES),
+                               np.nanpercentile(values, PERCENTILES, axis=1).T,
+                               rtol=1e-12, equal_nan=True)
+    assert np.isnan(nanpercentile_rows(values, PERCENTILES)[1]).all()
+
+
+@pytest.mark.filterwarnings('ignore:All-NaN slice')
+def test_bands_match_nanpercentile():
+    rng = np.random.default_rng(3)
+    n = 40
+    universe = pd.DataFrame({
+        'eps': rng.uniform(-5, 20, n),
+        'growth': rng.uniform(-0.2, 0.4, n),
+        'fcfps': rng.uniform(-3, 15, n),
+        'shares': rng.uniform(1e7, 1e10, n),
+        'capex': -rng.uniform(0, 5e9, n),
+        'tax': rng.uniform(0, 3e9, n),
+    }, index=[f'T{i}' for i in range(n)])
+    universe.iloc[::7, 0] = np.nan
+
+    bands = monte_carlo(universe, draws=500, percentiles=(5, 50, 95), seed=1)
+    draws = np.random.default_rng(1)
+    marr, shift = draws.normal(MARR, 0.02, 500), draws.normal(0.0, 0.03, 500)
+    for name, values in scenario_prices(universe_arrays(universe), marr, shift).items():
+        np.testing.assert_allclose(bands[name].to_numpy(),
+                                   np.nanpercentile(values, (5, 50, 95), axis=1).T,
+                                   rtol=1e-12, equal_nan=True, err_msg=name)
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+import pytest
+
+import valuation
+from fundamentals import QUOTE_TTL
+from service import ValuationService
+
+
+class StubSource:
+    """Key stats source whose scrapes block until released."""
+
+    def __init__(self):
+        self.scrapes = []
+        self.release = threading.Event()
+
+    def scrape_links(self, links):
+        self.scrapes.extend(links)
+        assert self.release.wait(5)
+        for link in links:
+            yield f'{link} | Valuation', {'moat': 1}, {'management': 1}, 2.0
+
+
+@pytest.fixture
+def service(monkeypatch):
+    def value_stock(name, moat, management, fcfps):
+        return {'name': name, 'fcfps': fcfps}
+
+    monkeypatch.setattr(valuation, 'value_stock', value_stock)
+    service = ValuationService(workers=2, source=StubSource())
+    yield service
+    service.source.release.set()
+    service.close()
+
+
+def test_record_ttl_is_capped_at_quote_ttl(service):
+    assert service.ttl == QUOTE_TTL
+    assert ValuationService(source=StubSource(), ttl=60).ttl == 60
+    assert ValuationService(source=StubSource(), ttl=QUOTE_TTL*3).ttl == QUOTE_TTL
+
+
+def test_concurrent_requests_share_one_scrape(service):
+    async def run():
+        requests = [asyncio.create_task(service.value('AAPL')) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        requests[0].cancel()
+        service.source.release.set()
+        results = await asyncio.gather(*requests[1:])
+        with pytest.raises(asyncio.CancelledError):
+            await requests[0]
+        return results
+
+    results = asyncio.run(run())
+    assert service.source.scrapes == ['https://www.morningstar.com/stocks/xnas/aapl/valuation']
+    assert all(result == results[0] for result in results)
+    assert results[0]['fcfps'] == 2.0
+    assert service.counters['coalesced'] == 4
+    assert service.counters['valued'] == 1 and service.pending == {}
+
+
+def test_cancelled_request_still_caches_the_record(service):
+    async def run():
+        request = asyncio.create_task(service.value('AAPL'))
+        await asyncio.sleep(0.05)
+        request.cancel()
+        service.source.release.set()
+        while service.pending:
+            await asyncio.sleep(0.01)
+        return await service.value('AAPL')
+
+    record = asyncio.run(run())
+    assert record['fcfps'] == 2.0
+    assert len(service.source.scrapes) == 1
+    assert service.counters['hits'] == 1
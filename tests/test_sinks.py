@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from sinks import FIELDS, open_sink
+
+
+def record(ticker: str, mos: float = None):
+    return {'ticker': ticker, 'name': f'{ticker} Inc', 'industry': 'Technology',
+            'current_price': 100.0, 'mos': mos, 'dcf': 120.0}
+
+
+def read(path: str):
+    import pyarrow.parquet as pq
+
+    return pq.read_table(path).to_pylist()
+
+
+@pytest.mark.parametrize('ext', ['jsonl', 'csv', 'parquet'])
+def test_outputs_are_appended(tmp_path, ext):
+    path = str(tmp_path / f'results.{ext}')
+    for ticker in ('AAPL', 'MSFT'):
+        with open_sink(path, batch_size=1) as sink:
+            sink.write(record(ticker, 80.0))
+            sink.write(record(ticker.lower()))
+    with open(path, 'rb') as file:
+        text = file.read()
+    if ext == 'parquet':
+        rows = read(path)
+        assert [row['ticker'] for row in rows] == ['AAPL', 'aapl', 'MSFT', 'msft']
+        assert [row['mos'] for row in rows] == [80.0, None, 80.0, None]
+    else:
+        for ticker in (b'AAPL', b'aapl', b'MSFT', b'msft'):
+            assert text.count(ticker + b' Inc') == 1
+
+
+def test_parquet_append_fills_new_columns(tmp_path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = str(tmp_path / 'results.parquet')
+    # A file written before the dcf field was added
+    pq.write_table(pa.table({'ticker': ['KO'], 'mos': [40.0]}), path)
+    with open_sink(path) as sink:
+        sink.write(record('AAPL', 80.0))
+
+    rows = read(path)
+    assert list(rows[0]) == FIELDS
+    assert (rows[0]['ticker'], rows[0]['mos'], rows[0]['dcf']) == ('KO', 40.0, None)
+    assert (rows[1]['ticker'], rows[1]['dcf']) == ('AAPL', 120.0)
+    assert not os.path.exists(path + '.tmp')
+
+
+def test_csv_append_to_pre_dcf_header(tmp_path):
+    import csv
+
+    path = str(tmp_path / 'results.csv')
+    old_fields = [field for field in FIELDS if field != 'dcf']
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=old_fields)
+        writer.writeheader()
+        writer.writerow({'ticker': 'KO', 'mos': 40.0, 'roic_avg': 12.5})
+    with open_sink(path) as sink:
+        sink.write(dict(record('AAPL', 80.0), roic_avg=30.0))
+    with open_sink(path) as sink:
+        sink.write(record('MSFT'))
+
+    with open(path, newline='') as file:
+        rows = list(csv.DictReader(file))
+    assert list(rows[0]) == FIELDS
+    assert [row['ticker'] for row in rows] == ['KO', 'AAPL', 'MSFT']
+    assert (rows[0]['dcf'], rows[0]['roic_avg']) == ('', '12.5')
+    assert (rows[1]['dcf'], rows[1]['roic_avg']) == ('120.0', '30.0')
+    assert rows[2]['mos'] == '' and rows[2]['dcf'] == '120.0'
+    assert not os.path.exists(path + '.tmp')
@@ -0,0 +1,44 @@
+import json
+import os
+
+import pandas as pd
+from lxml import html
+
+import valuation
+from snapshot import element_lines, parse_snapshot, snapshot_lines
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+PAGE = os.path.join(FIXTURES, 'valuation.html')
+
+
+def selenium_lines():
+    """Lines WebElement.text gives for each section of the saved page."""
+    with open(os.path.join(FIXTURES, 'valuation_lines.json'), encoding='utf-8') as file:
+        return json.load(file)
+
+
+def test_snapshot_lines_match_selenium():
+    # The page has indented labels split over lines, &nbsp;, hidden spans,
+    # a hidden row, scripts in cells and header cells with hidden notes
+    name, lines = snapshot_lines(PAGE)
+    assert name == 'AAPL Apple Inc | Valuation'
+    assert lines == selenium_lines()
+
+
+def test_parse_snapshot_matches_scraped_lines():
+    name, moat, management, fcfps = parse_snapshot(PAGE)
+    sections = valuation.parse_section_lines(selenium_lines())
+    want_moat, want_management = valuation.create_dataframes(
+        sections['rev'], sections['eps'], sections['bvps'], sections['roe'],
+        sections['roic'], sections['growth_yrs'], sections['op_eff_yrs'])
+    pd.testing.assert_frame_equal(moat, want_moat)
+    pd.testing.assert_frame_equal(management, want_management)
+    assert fcfps == sections['fcfps']
+
+
+def test_element_lines_of_blocks():
+    element = html.fromstring(
+        '<div><div>Free Cash  Flow</div><p>1.0<span hidden>x</span>'
+        '<br>2.0</p>\n<style>p { color: red }</style><span style="visibility: hidden">3</span>'
+        '<span>4.0</span> <b>5</b></div>')
+    assert element_lines(element) == ['Free Cash Flow', '1.0', '2.0', '4.0 5']
@@ -0,0 +1,46 @@
+import pandas as pd
+
+from store import ResultsStore
+
+DAY = 24 * 60 * 60
+
+
+def tables():
+    moat = pd.DataFrame({'Revenue %': [10.0, 12.0], 'EPS %': [8.0, 9.0],
+                         'BVPS %': [5.0, 6.0]}, index=[2022, 2023])
+    management = pd.DataFrame({'ROE %': [20.0, 21.0], 'ROIC %': [15.0, 16.0]},
+                              index=[2022, 2023])
+    return moat, management
+
+
+def test_scrape_round_trip(tmp_path):
+    moat, management = tables()
+    with ResultsStore(str(tmp_path)) as store:
+        store.save_scrape('AAPL', 'AAPL Apple | Valuation', moat, management, 6.5,
+                          scraped_at=1000.0)
+
+    store = ResultsStore(str(tmp_path))
+    assert store.fresh_tickers(DAY, now=2000.0) == {'AAPL'}
+    name, loaded_moat, loaded_management, fcfps = store.load_scrape('AAPL', DAY, now=2000.0)
+    assert name == 'AAPL Apple | Valuation' and fcfps == 6.5
+    pd.testing.assert_frame_equal(loaded_moat, moat)
+    pd.testing.assert_frame_equal(loaded_management, management)
+
+
+def test_failed_scrape_is_not_fresh(tmp_path):
+    with ResultsStore(str(tmp_path)) as store:
+        store.save_scrape('AAPL', 'AAPL Apple | Valuation', None, None, None,
+                          scraped_at=1000.0)
+        assert store.fresh_tickers(DAY, now=2000.0) == set()
+        assert store.load_scrape('AAPL', DAY, now=2000.0) is None
+
+
+def test_failed_scrape_keeps_previous_age(tmp_path):
+    moat, management = tables()
+    with ResultsStore(str(tmp_path)) as store:
+        store.save_scrape('AAPL', 'AAPL Apple | Valuation', moat, management, 6.5,
+                          scraped_at=1000.0)
+        store.save_scrape('AAPL', 'AAPL Apple | Valuation', None, None, None,
+                          scraped_at=1000.0 + 2*DAY)
+        assert store.fresh_tickers(DAY, now=1000.0 + 2*DAY) == set()
+        assert store.fresh_tickers(3*DAY, now=1000.0 + 2*DAY) == {'AAPL'}
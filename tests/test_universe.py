@@ -0,0 +1,73 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import valuation
+from universe import StockSnapshot, Universe
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'benchmarks', 'fixtures', 'sections.json')
+
+# Padding rows and all-NA columns average to NaN, as in get_data_averages
+pytestmark = pytest.mark.filterwarnings('ignore:Mean of empty slice')
+
+
+def fixtures():
+    with open(FIXTURES, encoding='utf-8') as file:
+        stocks = json.load(file)
+    # Stocks whose moat or management table can't be built
+    no_moat = dict(stocks[0]['sections'], growth=None)
+    no_management = dict(stocks[1]['sections'], op_eff=None)
+    stocks += [{'ticker': 'NOMOAT', 'sections': no_moat},
+               {'ticker': 'NOMGMT', 'sections': no_management}]
+    return stocks
+
+
+def reference(sections: dict):
+    """Averages and EPS growth through create_dataframes and get_data_averages."""
+    p = valuation.parse_section_lines_reference(sections)
+    moat, management = valuation.create_dataframes(p['rev'], p['eps'], p['bvps'], p['roe'],
+                                                   p['roic'], p['growth_yrs'], p['op_eff_yrs'])
+    if moat is None:
+        assert management is None
+        return p, None, None, valuation.cap_eps_growth(valuation.EPS_GR)
+    moat = valuation.get_data_averages(moat)
+    management = valuation.get_data_averages(management)
+    growth = valuation.cap_eps_growth(np.nanmean(moat.iloc[-1])/100)
+    return p, moat.loc['Avgs'].to_numpy(), management.loc['Avgs'].to_numpy(), growth
+
+
+@pytest.fixture
+def stocks():
+    stocks = fixtures()
+    return [(stock['ticker'], *reference(stock['sections'])) for stock in stocks]
+
+
+def test_averages_match_dataframes(stocks):
+    universe = Universe.from_sections([s[0] for s in stocks], [s[0] for s in stocks],
+                                      [s[1] for s in stocks])
+    moat, management, growth = (universe.moat_averages(), universe.management_averages(),
+                                universe.eps_growth())
+    for i, (ticker, _, moat_avgs, management_avgs, eps_growth) in enumerate(stocks):
+        if moat_avgs is None:
+            assert universe.moat_counts[i] == 0 and universe.management_counts[i] == 0, ticker
+            assert np.isnan(moat[i]).all() and np.isnan(management[i]).all()
+        else:
+            np.testing.assert_allclose(moat[i], moat_avgs, rtol=1e-12)
+            np.testing.assert_allclose(management[i], management_avgs, rtol=1e-12)
+        assert growth[i] == pytest.approx(eps_growth, rel=1e-12), ticker
+    assert {stocks[i][0] for i in range(len(stocks)) if universe.moat_counts[i] == 0} == {
+        'NOMOAT', 'NOMGMT'}
+
+
+def test_snapshots_match_universe(stocks):
+    snapshots = [StockSnapshot.from_sections(s[0], s[0], s[1]) for s in stocks]
+    universe = Universe.from_snapshots(snapshots)
+    for snapshot, (_, _, moat_avgs, _, _) in zip(universe, stocks):
+        frame = snapshot.moat_frame()
+        if moat_avgs is None:
+            assert frame is None and snapshot.management_frame() is None
+        else:
+            np.testing.assert_allclose(frame.loc['Avgs'].to_numpy(), moat_avgs, rtol=1e-12)
@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+import valuation
+from fundamentals import FundamentalsCache
+from sinks import print_record
+
+
+def statement(**rows):
+    # Latest fiscal year first, read positionally like yahoo_fin statements
+    return pd.DataFrame({0: rows}).astype(float)
+
+
+@pytest.fixture
+def fundamentals(monkeypatch):
+    cache = FundamentalsCache(cache_dir=None)
+    monkeypatch.setattr(valuation, 'FUNDAMENTALS', cache)
+    return cache
+
+
+def seed(cache, ticker, quote):
+    cache.put(ticker, 'quote', quote)
+    cache.put(ticker, 'cash_flow', statement(capitalExpenditures=-2e8))
+    cache.put(ticker, 'income_statement', statement(incomeTaxExpense=1e8, netIncome=5e8))
+    cache.put(ticker, 'balance_sheet', statement(longTermDebt=1e9))
+    cache.put(ticker, 'company_info', pd.DataFrame({'Value': {'sector': 'Technology'}}))
+
+
+def test_ten_cap_price_is_none_without_shares(fundamentals):
+    seed(fundamentals, 'X', {'regularMarketPrice': 10.0, 'epsCurrentYear': 1.0})
+    assert valuation.get_ten_cap_price('X', 1.5, 'Technology') is None
+
+
+def test_ten_cap_price_with_shares(fundamentals):
+    seed(fundamentals, 'X', {'sharesOutstanding': 1e8})
+    # (1.5*1e8 + 2e8 - 1e8 + 1e8)/1e8*10
+    assert valuation.get_ten_cap_price('X', 1.5, 'Technology') == pytest.approx(35.0)
+
+
+def test_record_without_shares_prints(fundamentals, capsys):
+    seed(fundamentals, 'X', {'regularMarketPrice': 10.0})
+    moat = pd.DataFrame({'Revenue %': [10.0], 'EPS %': [12.0], 'BVPS %': [8.0]}, index=[2023])
+    management = pd.DataFrame({'ROE %': [20.0], 'ROIC %': [15.0]}, index=[2023])
+
+    record = valuation.value_stock('X Corp | Valuation', moat, management, 1.5)
+    assert record['ten_cap'] is None
+    assert record['mos'] is None
+    print_record(record)
+    assert 'X Corp' in capsys.readouterr().out
+
+
+def test_import_leaves_out_the_pipeline():
+    # A fresh interpreter, since this session has imported everything
+    modules = ['pipeline', 'fetch', 'profiler', 'screener', 'sinks', 'store',
+               'workqueue', 'yearstore', 'selenium', 'yahoo_fin', 'forex_python']
+    code = f'import sys, valuation; print(*sorted(set(sys.modules) & {set(modules)}))'
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                         check=True, cwd=root)
+    assert out.stdout.split() == []
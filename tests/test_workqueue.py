@@ -0,0 +1,66 @@
+import pytest
+
+from workqueue import DONE, FAILED, LEASED, PENDING, WorkQueue
+
+LEASE = 60
+LINKS = ['https://www.morningstar.com/stocks/xnas/aapl/valuation',
+         'https://www.morningstar.com/stocks/xnas/msft/valuation']
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.db'), lease=LEASE, max_attempts=2)
+    queue.add(LINKS)
+    return queue
+
+
+def test_lease_hides_pages_until_it_expires(queue):
+    assert queue.claim('a', n=5, now=1000.0) == LINKS
+    assert queue.claim('b', now=1000.0 + LEASE - 1) == []
+    assert queue.stats()[LEASED] == 2
+
+
+def test_expired_lease_is_claimed_again(queue):
+    link, = queue.claim('a', now=1000.0)
+    assert queue.claim('b', now=1000.0 + LEASE + 1) == [link]
+    # The worker that lost the lease can't finish the page any more
+    assert not queue.complete(link, 'a')
+    assert queue.complete(link, 'b')
+    assert queue.stats()[DONE] == 1
+
+
+def test_heartbeat_keeps_the_lease(queue):
+    link, = queue.claim('a', now=1000.0)
+    assert queue.heartbeat('a', now=1000.0 + LEASE - 1) == 1
+    assert queue.claim('b', now=1000.0 + LEASE + 1) == [LINKS[1]]
+    assert queue.complete(link, 'a')
+
+
+def test_expired_lease_without_attempts_left_fails(queue):
+    link, = queue.claim('a', now=1000.0)
+    assert queue.claim('b', now=2000.0) == [link]
+    assert queue.claim('c', now=3000.0) == [LINKS[1]]
+    assert queue.failures() == [(link, 'lease expired')]
+
+
+def test_fail_requeues_until_max_attempts(queue):
+    link, = queue.claim('a', now=1000.0)
+    assert queue.fail(link, 'a', 'HTTP 503')
+    assert queue.stats()[PENDING] == 2
+
+    assert queue.claim('a', now=1001.0) == [link]
+    assert queue.fail(link, 'a', 'HTTP 503')
+    assert queue.stats()[FAILED] == 1
+    assert queue.failures() == [(link, 'HTTP 503')]
+    assert queue.claim('a', n=5, now=1002.0) == [LINKS[1]]
+
+    assert queue.retry_failed() == 1
+    assert queue.claim('a', now=1003.0) == [link]
+
+
+def test_release_keeps_the_attempt(queue):
+    link, = queue.claim('a', now=1000.0)
+    assert queue.release('a') == 1
+    assert queue.claim('a', now=1001.0) == [link]
+    assert queue.fail(link, 'a', 'HTTP 503')
+    assert queue.stats()[PENDING] == 2
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pytest
+
+from yearstore import FIELDS, YearStore
+
+
+def record(ticker: str, first: int = 2019, years: int = 3):
+    """Valuation record with tables like those value_stock returns."""
+    keys = [str(year) for year in range(first, first + years)] + ['Avgs']
+    moat = {column: {key: float(i) for i, key in enumerate(keys)}
+            for column in ('Revenue %', 'EPS %', 'BVPS %')}
+    management = {'ROE %': {key: 10.0 for key in keys},
+                  'ROIC %': {key: None for key in keys},
+                  'Debt/Equity': {key: 0.5 for key in keys}}
+    return {'ticker': ticker, 'moat': moat, 'management': management, 'fcfps': 4.5}
+
+
+def test_round_trip(tmp_path):
+    root = str(tmp_path / 'years')
+    with YearStore(root) as store:
+        store.write(record('AAPL'))
+        store.write(record('MSFT', first=2020))
+
+    store = YearStore(root, readonly=True)
+    assert store.tickers == ['AAPL', 'MSFT']
+    assert sorted(store.years) == [2019, 2020, 2021, 2022]
+    assert isinstance(store.data, np.memmap)
+
+    history = store.history('AAPL')
+    year = store.years.index(2021)
+    assert list(history[year]) == pytest.approx([2.0, 2.0, 2.0, 10.0, np.nan, 4.5],
+                                                nan_ok=True)
+    assert np.isnan(history[store.years.index(2019), FIELDS.index('fcfps')])
+    assert list(store.metric('revenue', 2019)) == pytest.approx([0.0, np.nan], nan_ok=True)
+    assert list(store.metric('fcfps', 2022)) == pytest.approx([np.nan, 4.5], nan_ok=True)
+
+    frame = store.to_frame('eps')
+    assert list(frame.columns) == [2019, 2020, 2021, 2022]
+    assert frame.loc['MSFT'].tolist() == pytest.approx([np.nan, 0.0, 1.0, 2.0], nan_ok=True)
+
+
+def test_grows_past_capacity(tmp_path):
+    root = str(tmp_path / 'years')
+    tickers = [f'T{i}' for i in range(5)]
+    with YearStore(root, capacity=2) as store:
+        for i, ticker in enumerate(tickers):
+            store.put(ticker, 2020, {'eps': float(i)})
+            store.put(ticker, 2021 + i % 2, {'roe': float(i)})
+        assert store.capacity == 8
+
+    store = YearStore(root, readonly=True)
+    assert store.capacity == 8 and store.tickers == tickers
+    assert os.path.getsize(os.path.join(root, 'values.f8')) == 3*8*len(FIELDS)*8
+    assert store.metric('eps', 2020).tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert store.metric('roe', 2021).tolist() == pytest.approx(
+        [0.0, np.nan, 2.0, np.nan, 4.0], nan_ok=True)
+    assert not os.path.exists(os.path.join(root, 'values.f8.tmp'))
+
+
+def test_missing_ticker_or_year(tmp_path):
+    root = str(tmp_path / 'years')
+    with pytest.raises(FileNotFoundError):
+        YearStore(root, readonly=True)
+
+    store = YearStore(root)
+    assert store.history('AAPL') is None
+    assert store.metric('eps').shape == (0, 0)
+    store.put('AAPL', 2020, {'eps': 1.0})
+    store.close()
+
+    store = YearStore(root, readonly=True)
+    assert store.history('MSFT') is None
+    assert np.isnan(store.metric('eps', 1999)).all() and store.metric('eps', 1999).shape == (1,)
+    assert store.metric('roic', 2020).tolist() == pytest.approx([np.nan], nan_ok=True)
@@ -0,0 +1,285 @@
+"""Compact array-backed storage of the scraped moat and management metrics.
+
+A StockSnapshot holds one ticker's tables as small float64 arrays, and a
+Universe holds every ticker in contiguous padded arrays. Averages and EPS
+growth are computed for the whole universe at once. DataFrames are only built
+when a table is displayed, and they match what create_dataframes and
+get_data_averages give for the same values.
+"""
+import numpy as np
+import pandas as pd
+
+from valuation import EPS_GR, INDEXES, cap_eps_growth
+
+MOAT_COLUMNS = ['Revenue %', 'EPS %', 'BVPS %']
+MANAGEMENT_COLUMNS = ['ROE %', 'ROIC %']
+MAX_YEARS = max(len(idxs) for idxs in INDEXES['years'].values())
+
+
+def table_array(columns: list, years: list):
+    """Stacks column lists into a (years, columns) float64 array.
+
+    Args:
+        columns (list): Lists of values, or None for missing columns.
+        years (list): Fiscal years of the rows. None if missing.
+
+    Returns:
+        tuple: int64 years and the values. Both empty if the table can't be
+               built, i.e. create_dataframes would return None.
+    """
+    if years is None or any(col is not None and len(col) != len(years) for col in columns):
+        return np.empty(0, dtype=np.int64), np.empty((0, len(columns)))
+    values = np.full((len(years), len(columns)), np.nan)
+    for i, col in enumerate(columns):
+        if col is not None:
+            values[:, i] = col
+    return np.asarray(years, dtype=np.int64), values
+
+
+def section_tables(sections: dict):
+    """Moat and management arrays of parsed sections. Like create_dataframes,
+    a stock gets both tables or neither: if one can't be built, both are
+    empty.
+
+    Args:
+        sections (dict): Output of parse_section_lines.
+
+    Returns:
+        tuple: Moat years, moat values, management years and management
+               values, as table_array returns them.
+    """
+    moat_years, moat = table_array([sections['rev'], sections['eps'], sections['bvps']],
+                                   sections['growth_yrs'])
+    management_years, management = table_array([sections['roe'], sections['roic']],
+                                               sections['op_eff_yrs'])
+    if not len(moat_years) or not len(management_years):
+        moat_years, moat = moat_years[:0], moat[:0]
+        management_years, management = management_years[:0], management[:0]
+    return moat_years, moat, management_years, management
+
+
+def table_frame(years: np.ndarray, values: np.ndarray, columns: list,
+                averages: bool = True):
+    """Builds a display DataFrame of a table.
+
+    Args:
+        years (np.ndarray): Fiscal years.
+        values (np.ndarray): (years, columns) values.
+        columns (list): Column names.
+        averages (bool, optional): Append the "Avgs" row like
+                                   get_data_averages. Defaults to True.
+
+    Returns:
+        pd.DataFrame: Table. None if it has no rows.
+    """
+    if not len(years):
+        return None
+    df = pd.DataFrame(values, index=years.tolist(), columns=columns)
+    if averages:
+        df.loc['Avgs'] = np.nanmean(values, axis=0)
+    return df
+
+
+class StockSnapshot:
+    """One ticker's scraped metrics.
+
+    Args:
+        ticker (str): Ticker symbol.
+        name (str): Page title, e.g. "AAPL Apple Inc | Valuation".
+        moat_years (np.ndarray): Fiscal years of the moat table.
+        moat (np.ndarray): (years, 3) Revenue %, EPS % and BVPS %.
+        management_years (np.ndarray): Fiscal years of the management table.
+        management (np.ndarray): (years, 2) ROE % and ROIC %.
+        fcfps (float): Free cash flow per share. NaN if missing.
+    """
+    __slots__ = ('ticker', 'name', 'moat_years', 'moat', 'management_years',
+                 'management', 'fcfps')
+
+    def __init__(self, ticker: str, name: str, moat_years: np.ndarray, moat: np.ndarray,
+                 management_years: np.ndarray, management: np.ndarray, fcfps: float):
+        self.ticker = ticker
+        self.name = name
+        self.moat_years = moat_years
+        self.moat = moat
+        self.management_years = management_years
+        self.management = management
+        self.fcfps = fcfps
+
+    @classmethod
+    def from_sections(cls, ticker: str, name: str, sections: dict):
+        """Builds a snapshot from parsed sections.
+
+        Args:
+            ticker (str): Ticker symbol.
+            name (str): Page title.
+            sections (dict): Output of parse_section_lines.
+
+        Returns:
+            StockSnapshot: Snapshot of the sections.
+        """
+        fcfps = sections['fcfps']
+        return cls(ticker, name, *section_tables(sections),
+                   np.nan if fcfps is None else float(fcfps))
+
+    def moat_frame(self, averages: bool = True):
+        """Moat DataFrame for display. None if the table is missing."""
+        return table_frame(self.moat_years, self.moat, MOAT_COLUMNS, averages)
+
+    def management_frame(self, averages: bool = True):
+        """Management DataFrame for display. None if the table is missing."""
+        return table_frame(self.management_years, self.management,
+                           MANAGEMENT_COLUMNS, averages)
+
+    def __repr__(self):
+        return f'StockSnapshot({self.ticker!r}, years={self.moat_years.tolist()})'
+
+
+class Universe:
+    """Metrics of many tickers in contiguous arrays. Tables are padded to
+    MAX_YEARS rows with NaN, and row counts record how many are used.
+
+    Args:
+        capacity (int, optional): Tickers to allocate room for. Defaults to 0.
+    """
+    __slots__ = ('tickers', 'names', 'fcfps', 'moat_years', 'moat', 'moat_counts',
+                 'management_years', 'management', 'management_counts', '_size')
+
+    def __init__(self, capacity: int = 0):
+        self.tickers = []
+        self.names = []
+        self._size = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        """Grows the arrays to capacity, keeping their contents."""
+        shapes = {
+            'fcfps': ((), np.float64, np.nan),
+            'moat_years': ((MAX_YEARS,), np.int64, 0),
+            'moat': ((MAX_YEARS, len(MOAT_COLUMNS)), np.float64, np.nan),
+            'moat_counts': ((), np.intp, 0),
+            'management_years': ((MAX_YEARS,), np.int64, 0),
+            'management': ((MAX_YEARS, len(MANAGEMENT_COLUMNS)), np.float64, np.nan),
+            'management_counts': ((), np.intp, 0),
+        }
+        for name, (shape, dtype, fill) in shapes.items():
+            array = np.full((capacity,) + shape, fill, dtype=dtype)
+            if self._size:
+                array[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, array)
+
+    @classmethod
+    def from_snapshots(cls, snapshots: list):
+        """Packs snapshots into a universe.
+
+        Args:
+            snapshots (list): StockSnapshot objects.
+
+        Returns:
+            Universe: Universe holding them in order.
+        """
+        universe = cls(len(snapshots))
+        for snapshot in snapshots:
+            universe.append(snapshot)
+        return universe
+
+    @classmethod
+    def from_sections(cls, tickers: list, names: list, sections: list):
+        """Packs parsed sections, e.g. from fastparse.parse_batch, without
+        building a snapshot or DataFrame per ticker.
+
+        Args:
+            tickers (list): Ticker symbols.
+            names (list): Page titles.
+            sections (list): Output of parse_section_lines per ticker.
+
+        Returns:
+            Universe: Universe holding them in order.
+        """
+        universe = cls(len(tickers))
+        for ticker, name, parsed in zip(tickers, names, sections):
+            universe._append(ticker, name, *section_tables(parsed),
+                             np.nan if parsed['fcfps'] is None else parsed['fcfps'])
+        return universe
+
+    def append(self, snapshot: StockSnapshot):
+        """Adds a snapshot, doubling the capacity when full.
+
+        Args:
+            snapshot (StockSnapshot): Snapshot to add.
+        """
+        self._append(snapshot.ticker, snapshot.name, snapshot.moat_years, snapshot.moat,
+                     snapshot.management_years, snapshot.management, snapshot.fcfps)
+
+    def _append(self, ticker, name, moat_years, moat, management_years, management, fcfps):
+        if self._size == len(self.fcfps):
+            self._allocate(max(2*self._size, 16))
+        i = self._size
+        self.tickers.append(ticker)
+        self.names.append(name)
+        self.fcfps[i] = fcfps
+        for years, values, table in ((moat_years, moat, 'moat'),
+                                     (management_years, management, 'management')):
+            count = min(len(years), MAX_YEARS)
+            getattr(self, f'{table}_years')[i, :count] = years[:count]
+            getattr(self, table)[i, :count] = values[:count]
+            getattr(self, f'{table}_counts')[i] = count
+        self._size += 1
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, i: int):
+        """Snapshot of one ticker. Its arrays are views into the universe."""
+        if not -self._size <= i < self._size:
+            raise IndexError(i)
+        i %= self._size
+        moat_count, management_count = self.moat_counts[i], self.management_counts[i]
+        return StockSnapshot(
+            self.tickers[i], self.names[i],
+            self.moat_years[i, :moat_count], self.moat[i, :moat_count],
+            self.management_years[i, :management_count],
+            self.management[i, :management_count], float(self.fcfps[i]),
+        )
+
+    def __iter__(self):
+        return (self[i] for i in range(self._size))
+
+    def moat_averages(self):
+        """(tickers, 3) average Revenue %, EPS % and BVPS % of every ticker,
+        the "Avgs" row of get_data_averages."""
+        return np.nanmean(self.moat[:self._size], axis=1)
+
+    def management_averages(self):
+        """(tickers, 2) average ROE % and ROIC % of every ticker."""
+        return np.nanmean(self.management[:self._size], axis=1)
+
+    def eps_growth(self):
+        """EPS growth rates get_mos_price uses for every ticker: the mean of
+        the moat averages as a decimal, capped, or EPS_GR without a moat
+        table.
+
+        Returns:
+            np.ndarray: Growth rates.
+        """
+        growth = np.nanmean(self.moat_averages(), axis=1)/100
+        growth = np.where(self.moat_counts[:self._size] > 0, growth, EPS_GR)
+        return cap_eps_growth(growth)
+
+    def to_frame(self):
+        """Averages of every ticker as one DataFrame, for display.
+
+        Returns:
+            pd.DataFrame: One row per ticker with the averaged metrics and
+                          free cash flow per share.
+        """
+        data = np.column_stack([self.moat_averages(), self.management_averages(),
+                                self.fcfps[:self._size]])
+        return pd.DataFrame(data, index=pd.Index(self.tickers, name='ticker'),
+                            columns=MOAT_COLUMNS + MANAGEMENT_COLUMNS + ['FCF/Share'])
+
+    @property
+    def nbytes(self):
+        """Bytes held by the arrays."""
+        return sum(getattr(self, name).nbytes for name in
+                   ('fcfps', 'moat_years', 'moat', 'moat_counts', 'management_years',
+                    'management', 'management_counts'))
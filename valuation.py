@@ -1,30 +1,23 @@
-import sys
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
-import numpy_financial as npf
 import pandas as pd
-import yahoo_fin.stock_info as si
-from forex_python.converter import CurrencyRates
 
-from selenium.webdriver import Chrome
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import TimeoutException
+from fundamentals import CACHE_DIR, FundamentalsCache
+from fx import FxRates
+from metrics import METRICS
+from resilience import RESILIENCE
+
+# selenium, yahoo_fin and forex_python are imported inside the functions that
+# use them so that importing this module for valuation only stays fast. The
+# command line and the run orchestration live in pipeline.py for the same reason.
 
 pd.set_option('display.float_format', lambda x: '%.2f' % x)
 
 PATH = 'C:\\Program Files\chromedriver.exe'
 WINDOW_SIZE = '1920,1080'
 
-OPTIONS = Options()
-OPTIONS.add_argument("--headless")
-OPTIONS.add_argument("--window-size=%s" % WINDOW_SIZE)
-OPTIONS.add_experimental_option('excludeSwitches', ['enable-logging'])
-
 # Which index to select while going through each row in the tables
 INDEXES = {
     'years' : {
@@ -58,6 +51,46 @@ XPATHS = {
     'cash_flow': ROOT_XPATH+'[6]'+DIVS+'/div[1]/table/tbody/tr[6]'
 }
 
+# Sections read by the single script extraction
+SECTION_KEYS = ['growth', 'op_eff_years', 'op_eff', 'fin_health', 'cash_flow']
+
+# Clicks every section button, waits for the tables and returns their text
+EXTRACT_SCRIPT = """
+const [xpaths, locators, timeout, currencyId, done] = arguments;
+const deadline = Date.now() + timeout;
+const clicked = new Set();
+const find = (xpath) => document.evaluate(
+    xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null
+).singleNodeValue;
+
+function poll() {
+    for (const id of locators) {
+        const button = document.getElementById(id);
+        if (button && !clicked.has(id)) {
+            button.click();
+            clicked.add(id);
+        }
+    }
+    const sections = {};
+    const missing = [];
+    for (const [key, xpath] of Object.entries(xpaths)) {
+        const node = find(xpath);
+        sections[key] = node ? node.innerText : null;
+        if (!node) missing.push(key);
+    }
+    if (missing.length && Date.now() < deadline) {
+        setTimeout(poll, 100);
+        return;
+    }
+    let currency = null;
+    const element = currencyId === null ? null : document.getElementById('i' + currencyId);
+    const span = element ? element.querySelector('span') : null;
+    if (span) currency = span.innerText.split(/\\s+/)[0];
+    done({title: document.title, sections: sections, missing: missing, currency: currency});
+}
+poll();
+"""
+
 # Button locators
 LOCATORS = [
     'keyStatsgrowthTable',
@@ -70,6 +103,9 @@ LOCATORS = [
 MARR = 0.15
 EPS_GR = 0.1
 EPS_GR_LIM = 0.25
+DCF_HIGH_YEARS = 5  # Years free cash flow grows at the stock's growth rate
+DCF_FADE_YEARS = 5  # Years the growth rate fades linearly to TERMINAL_GR
+TERMINAL_GR = 0.03
 
 TICKER_BRIDGE = {
     'BRK.B': 'BRK-B'
@@ -77,8 +113,117 @@ TICKER_BRIDGE = {
 
 NA = '—'
 
-S = Service(PATH)
-DRIVER = Chrome(service=S, options=OPTIONS)
+# yahoo_fin statements shared by every valuation
+FUNDAMENTALS = FundamentalsCache(cache_dir=CACHE_DIR)
+
+# Exchange rates shared by every currency conversion
+FX = FxRates()
+
+# Lean browser profile: resources and third-party hosts that are not needed
+# to render the valuation tables
+BLOCKED_RESOURCES = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.webp', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.mp4', '*.webm',
+]
+BLOCKED_HOSTS = [
+    '*doubleclick.net*', '*googlesyndication.com*', '*google-analytics.com*',
+    '*googletagmanager.com*', '*googletagservices.com*', '*facebook.net*',
+    '*facebook.com*', '*scorecardresearch.com*', '*adsrvr.org*',
+    '*amazon-adsystem.com*', '*taboola.com*', '*outbrain.com*',
+    '*newrelic.com*', '*nr-data.net*', '*hotjar.com*', '*optimizely.com*',
+    '*onetrust.com*', '*cookielaw.org*', '*bing.com*', '*twitter.com*',
+]
+
+
+def chrome_options(lean: bool = False):
+    """Builds the headless Chrome options used by the scraper.
+
+    Args:
+        lean (bool, optional): Disable images, extensions and GPU compositing
+                               and stop waiting for the page once the DOM is
+                               ready. Defaults to False.
+
+    Returns:
+        Options: Selenium Chrome options.
+    """
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    options.add_argument("--headless")
+    options.add_argument("--window-size=%s" % WINDOW_SIZE)
+    options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    if lean:
+        options.add_argument('--disable-extensions')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--disable-software-rasterizer')
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_experimental_option(
+            'prefs', {'profile.managed_default_content_settings.images': 2}
+        )
+        options.page_load_strategy = 'eager'
+    return options
+
+
+class ScraperSession:
+    """Owns a Chrome web driver that is only started the first time it is
+    used and quit when the session is closed.
+
+    Usage:
+        with ScraperSession() as session:
+            links = get_links(session.driver)
+
+    Args:
+        path (str, optional): Path to chromedriver. Defaults to PATH.
+        options (Options, optional): Chrome options. Defaults to
+                                     chrome_options(lean).
+        lean (bool, optional): Use the lean profile and block BLOCKED_RESOURCES
+                               and BLOCKED_HOSTS. Defaults to False.
+        blocked_urls (list, optional): URL patterns blocked in the lean
+                                       profile. Defaults to
+                                       BLOCKED_RESOURCES + BLOCKED_HOSTS.
+    """
+
+    def __init__(self, path: str = PATH, options=None, lean: bool = False,
+                 blocked_urls: list = None):
+        self.path = path
+        self.options = options
+        self.lean = lean
+        self.blocked_urls = BLOCKED_RESOURCES + BLOCKED_HOSTS \
+            if blocked_urls is None else blocked_urls
+        self._driver = None
+
+    @property
+    def driver(self):
+        """Chrome web driver, started on first access."""
+        if self._driver is None:
+            from selenium.webdriver import Chrome
+            from selenium.webdriver.chrome.service import Service
+
+            options = self.options if self.options is not None else chrome_options(self.lean)
+            self._driver = Chrome(service=Service(self.path), options=options)
+            if self.lean and self.blocked_urls:
+                self._driver.execute_cdp_cmd('Network.enable', {})
+                self._driver.execute_cdp_cmd('Network.setBlockedURLs',
+                                             {'urls': self.blocked_urls})
+        return self._driver
+
+    @property
+    def started(self):
+        """True if the web driver has been started."""
+        return self._driver is not None
+
+    def quit(self):
+        """Quits the web driver if it was started."""
+        if self._driver is not None:
+            self._driver.quit()
+            self._driver = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.quit()
+        return False
 
 
 def check_length(rows: list, years: bool = False):
@@ -117,30 +262,34 @@ def check_years(rows: list):
         return None
 
 
-def click_button(locator: str):
+def click_button(driver, locator: str):
     """Web driver waits until button is located and clicks it.
 
     Args:
+        driver (WebDriver): Web driver to use.
         locator_idx (int): ID of button.
     """
-    WebDriverWait(DRIVER, 10).until(
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    WebDriverWait(driver, 10).until(
         EC.presence_of_element_located((By.XPATH, f'//button[@id="{locator}"]'))
     ).click()
 
 
-def convert_curr(number: str|int|float, curr: str):
-    """_summary_
+def convert_curr(number: int|float|np.ndarray|pd.Series, curr: str):
+    """Converts a number, or a whole array or column of numbers, from a
+    currency to CAD using the cached FX rate table.
 
     Args:
-        number (str | int | float): _description_
-        curr (str): _description_
+        number (int | float | np.ndarray | pd.Series): Value(s) to convert.
+        curr (str): Currency code of the value(s).
 
     Returns:
-        _type_: _description_
+        int | float | np.ndarray | pd.Series: Value(s) in CAD.
     """
-    cr = CurrencyRates().get_rates(curr)
-    conversion = cr.get('CAD')
-    return number*conversion
+    return FX.convert(number, curr)
 
 def create_dataframes(revenue: list, eps: list, bvps: list, roe: list, roic: list, growth_yrs: list, management_years: list):
     """Stores data into dataframes.
@@ -188,80 +337,113 @@ def create_dataframes(revenue: list, eps: list, bvps: list, roe: list, roic: lis
         return None, None
 
 
-def data_available(xpath: str, section: str):
+def data_available(driver, xpath: str, section: str):
     """Searches value and returns true if found, otherwise an exeption.
 
     Args:
+        driver (WebDriver): Web driver to use.
         xpath (str): XPath of element(s) to be searched.
         section (str): Section being searched.
 
     Returns:
         bool: True if element(s) found, otherwise False.
     """
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
     try:
-        WebDriverWait(DRIVER, 3).until(
+        WebDriverWait(driver, 3).until(
             EC.presence_of_element_located((By.XPATH, xpath))
         )
         return True
     except TimeoutException:
+        METRICS.count('timeouts')
+        METRICS.count(f'timeouts.{section}')
         print(f'ERROR ~ Scraping timed out at section: {section}')
         return False
 
 
-def get_currency(id):
+def get_currency(driver, id):
     """_summary_
 
     Args:
+        driver (WebDriver): Web driver to use.
         id (_type_): _description_
 
     Returns:
         _type_: _description_
     """
-    curr = WebDriverWait(DRIVER, 30).until(
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    curr = WebDriverWait(driver, 30).until(
         EC.presence_of_element_located((By.ID, f'i{id}'))
     ).find_element(By.TAG_NAME, 'span').text.split()[0]
     return curr
 
 
-def get_data(section: str, locator: str, growth_section: bool = False,
+def get_data(driver, section: str, locator: str, growth_section: bool = False,
              op_eff_section: bool = False, fin_health_section: bool = False):
     """Get data according to which section is being searched.
 
     Args:
+        driver (WebDriver): Web driver to use.
         section (str): Section being searched.
         locator (str): Button ID tag in HTML.
 
     Returns:
         list|float: Returns a list or a float depending on the section.
     """
-    click_button(locator)
-    if growth_section:
-        return get_growth_data(section)
+    with METRICS.stage(f'section.{section}'):
+        click_button(driver, locator)
+        if growth_section:
+            return get_growth_data(driver, section)
 
-    elif op_eff_section:
-        return get_operating_and_efficiency_data(section)
+        elif op_eff_section:
+            return get_operating_and_efficiency_data(driver, section)
 
-    elif fin_health_section:
-        return get_financial_health_data(section)
+        elif fin_health_section:
+            return get_financial_health_data(driver, section)
 
-    return get_cash_flow_data(section)
+        return get_cash_flow_data(driver, section)
 
 
-def get_growth_data(section: str):
+def get_growth_data(driver, section: str):
     """Searches for "Revenue %", "EPS %", and years in the "Growth"
     section by XPATH and returns it.
 
     Args:
+        driver (WebDriver): Web driver to use.
         section (str): The section to be searched.
 
     Returns:
         list: Returns values relative to the current year in a list and the
         years selected by INDEXES. None if conditions are not met.
     """
-    if not data_available(XPATHS.get('growth'), section):
+    from selenium.webdriver.common.by import By
+
+    if not data_available(driver, XPATHS.get('growth'), section):
         return None
-    growth_data = DRIVER.find_element(By.XPATH, XPATHS.get(section))\
+    growth_data = driver.find_element(By.XPATH, XPATHS.get(section))\
         .text.splitlines()
+    return parse_growth_data(growth_data, section)
+
+
+def parse_growth_data(growth_data: list, section: str = 'growth'):
+    """Parses the lines of the "Growth" table into "Revenue %", "EPS %" and
+    years.
+
+    Args:
+        growth_data (list): Text of the growth table split by lines.
+        section (str, optional): The section being parsed. Defaults to 'growth'.
+
+    Returns:
+        list: Returns values relative to the current year in a list and the
+        years selected by INDEXES.
+    """
     years = growth_data[0].split()[2:-2]
     select_years = get_years(years)[::-1]  # Reverse list
 
@@ -270,25 +452,44 @@ def get_growth_data(section: str):
     return rev_final, eps_final, select_years
 
 
-def get_operating_and_efficiency_data(section: str):
+def get_operating_and_efficiency_data(driver, section: str):
     """Searches for "Return on Equity %" and "Return on Invested Capital %"
     in "Operating and Efficiency" section by XPATH and returns it.
 
     Args:
+        driver (WebDriver): Web driver to use.
         section (str): The section to be searched.
 
     Returns:
         list: Returns average values relative to the current year and the years
         selected by INDEXES. None if conditions are not met.
     """
-    if not data_available(XPATHS.get('op_eff_years'), section):
-        return None, None, None
-    op_eff_years = DRIVER.find_element(By.XPATH, XPATHS.get('op_eff_years'))\
-        .text.splitlines()[1:-2]
+    from selenium.webdriver.common.by import By
 
-    select_years = get_years(op_eff_years)[::-1]  # Reverse list
-    op_eff_data = DRIVER.find_element(By.XPATH, XPATHS.get('op_eff'))\
+    if not data_available(driver, XPATHS.get('op_eff_years'), section):
+        return None, None, None
+    op_eff_years = driver.find_element(By.XPATH, XPATHS.get('op_eff_years'))\
         .text.splitlines()
+    op_eff_data = driver.find_element(By.XPATH, XPATHS.get('op_eff'))\
+        .text.splitlines()
+    return parse_operating_and_efficiency_data(op_eff_years, op_eff_data, section)
+
+
+def parse_operating_and_efficiency_data(op_eff_years: list, op_eff_data: list,
+                                        section: str = 'op_eff'):
+    """Parses the lines of the "Operating and Efficiency" table into
+    "Return on Equity %", "Return on Invested Capital %" and years.
+
+    Args:
+        op_eff_years (list): Text of the table header split by lines.
+        op_eff_data (list): Text of the table body split by lines.
+        section (str, optional): The section being parsed. Defaults to 'op_eff'.
+
+    Returns:
+        list: Returns average values relative to the current year and the years
+        selected by INDEXES.
+    """
+    select_years = get_years(op_eff_years[1:-2])[::-1]  # Reverse list
 
     roe_element = [op_eff_data[6]]
     roic_element = [op_eff_data[7]]
@@ -296,40 +497,60 @@ def get_operating_and_efficiency_data(section: str):
     roic = transform(roic_element, section=section)
     return roe, roic, select_years
 
-def get_financial_health_data(section: str):
+def get_financial_health_data(driver, section: str):
     """Searches for "Book Value/Share" in "Financial Health" section by XPATH and returns it.
 
     Args:
+        driver (WebDriver): Web driver to use.
         section (str): The section to be searched.
 
     Returns:
         list: Returns values relative to the current year.
               None if conditions are not met.
     """
-    if not data_available(XPATHS.get('fin_health'), section):
+    from selenium.webdriver.common.by import By
+
+    if not data_available(driver, XPATHS.get('fin_health'), section):
         return None
-    fin_health = DRIVER.find_element(By.XPATH, XPATHS.get('fin_health'))\
+    fin_health = driver.find_element(By.XPATH, XPATHS.get('fin_health'))\
         .text.splitlines()
     return transform(fin_health, section=section)
 
 
-def get_cash_flow_data(section: str):
+def get_cash_flow_data(driver, section: str):
     """Searches for "Free Cash Flow/Share" in "Cash Flow" section by XPATH and returns it.
 
     Args:
+        driver (WebDriver): Web driver to use.
         section (str): The section to be searched.
 
     Returns:
         float: Returns value of the most recent year recorded.
                None if conditions are not met.
     """
-    if not data_available(XPATHS.get('cash_flow'), section):
+    from selenium.webdriver.common.by import By
+
+    if not data_available(driver, XPATHS.get('cash_flow'), section):
         return None
-    cash_flow = DRIVER.find_element(By.XPATH, XPATHS.get('cash_flow'))\
+    cash_flow = driver.find_element(By.XPATH, XPATHS.get('cash_flow'))\
         .text.splitlines()
     return transform(cash_flow, section=section)
 
 
+def scalar_price(price: np.ndarray):
+    """Turns the result of a vectorized price function for one stock into a
+    float. The kernels give NaN for missing inputs, the scalar functions None.
+
+    Args:
+        price (np.ndarray): 0-d price.
+
+    Returns:
+        float: The price. None if it is NaN.
+    """
+    price = float(price)
+    return None if np.isnan(price) else price
+
+
 def get_ten_cap_price(ticker: str, fcfps: np.float64, industry: str = None):
     """Calculates the price of a stock to be 10x owner earnings/share.
 
@@ -348,27 +569,19 @@ def get_ten_cap_price(ticker: str, fcfps: np.float64, industry: str = None):
         if industry == 'Financial Services':
             cap_ex = 0
         else:
-            cap_ex = si.get_cash_flow(ticker).loc['capitalExpenditures'][0]  # Usually negative
-        shares = si.get_quote_data(ticker).get('sharesOutstanding')
-        operating_cf = fcfps*shares - cap_ex
-
-        maintenance_cap_ex = cap_ex / 2
-        income_tax_exp = si.get_income_statement(ticker).loc['incomeTaxExpense'][0]
-        owner_earnings = np.sum([operating_cf, maintenance_cap_ex, income_tax_exp])
-        return (owner_earnings/shares* 10)
+            cap_ex = FUNDAMENTALS.get(ticker, 'cash_flow').loc['capitalExpenditures'][0]  # Usually negative
+        shares = FUNDAMENTALS.get(ticker, 'quote').get('sharesOutstanding')
+        income_tax_exp = FUNDAMENTALS.get(ticker, 'income_statement').loc['incomeTaxExpense'][0]
+        return scalar_price(get_ten_cap_prices(fcfps, shares, cap_ex, income_tax_exp))
 
     except KeyError as err:
         try:
             if ticker in TICKER_BRIDGE:
                 ticker = TICKER_BRIDGE.get(ticker)
-            shares = si.get_quote_data(ticker).get('sharesOutstanding')
-            cap_ex = si.get_cash_flow(ticker).loc['capitalExpenditures'][0]  # Usually negative
-            operating_cf = fcfps*shares - cap_ex
-
-            maintenance_cap_ex = cap_ex / 2
-            income_tax_exp = si.get_income_statement(ticker).loc['incomeTaxExpense'][0]
-            owner_earnings = np.sum([operating_cf, maintenance_cap_ex, income_tax_exp])
-            return (owner_earnings/shares* 10)
+            shares = FUNDAMENTALS.get(ticker, 'quote').get('sharesOutstanding')
+            cap_ex = FUNDAMENTALS.get(ticker, 'cash_flow').loc['capitalExpenditures'][0]  # Usually negative
+            income_tax_exp = FUNDAMENTALS.get(ticker, 'income_statement').loc['incomeTaxExpense'][0]
+            return scalar_price(get_ten_cap_prices(fcfps, shares, cap_ex, income_tax_exp))
 
         except KeyError:
             print(f'ERROR ~ {err} missing.')
@@ -377,35 +590,90 @@ def get_ten_cap_price(ticker: str, fcfps: np.float64, industry: str = None):
     except TypeError:
         return None
 
-def get_mos_price(ticker: str, moat: pd.DataFrame):
+
+def get_ten_cap_prices(fcfps: np.ndarray, shares: np.ndarray,
+                       cap_ex: np.ndarray, income_tax_exp: np.ndarray):
+    """Vectorized ten cap price: 10x owner earnings/share for many stocks.
+
+    Args:
+        fcfps (np.ndarray): Free cash flow per share.
+        shares (np.ndarray): Shares outstanding.
+        cap_ex (np.ndarray): Capital expenditures, usually negative. Zero for
+                             Financial Services.
+        income_tax_exp (np.ndarray): Income tax expense.
+
+    Returns:
+        np.ndarray: Ten cap prices. NaN where inputs are missing.
+    """
+    fcfps, shares, cap_ex, income_tax_exp = (
+        np.asarray(arr, dtype=np.float64)
+        for arr in (fcfps, shares, cap_ex, income_tax_exp)
+    )
+    operating_cf = fcfps*shares - cap_ex
+    maintenance_cap_ex = cap_ex / 2
+    owner_earnings = operating_cf + maintenance_cap_ex + income_tax_exp
+    return owner_earnings/shares*10
+
+
+def cap_eps_growth(growth: float|np.ndarray):
+    """Replaces EPS growth rates above EPS_GR_LIM with the 10% default.
+
+    Args:
+        growth (float | np.ndarray): EPS growth rates as decimals.
+
+    Returns:
+        np.ndarray: Capped growth rates.
+    """
+    growth = np.asarray(growth, dtype=np.float64)
+    return np.where(growth > EPS_GR_LIM, 0.1, growth)
+
+
+def get_mos_price(ticker: str, moat: pd.DataFrame, marr: float = MARR):
     """Calculates the margin of safety price of a stock by finding its
     instrinsic value and dividing by two.
 
     Args:
         ticker (str): Ticker symbol.
         moat (pd.DataFrame): Moat dataframe needed to grab averages.
+        marr (float, optional): Discount rate. Defaults to MARR.
 
     Returns:
         float: The margin of safety price. None if conditions are not met.
     """
-    current_eps = si.get_quote_data(ticker).get('epsCurrentYear')
+    current_eps = FUNDAMENTALS.get(ticker, 'quote').get('epsCurrentYear')
+    eps_gr = EPS_GR
     if moat is not None:
-        global EPS_GR
-        EPS_GR = np.nanmean(moat.iloc[-1])/100
-
-    if EPS_GR > EPS_GR_LIM:
-        EPS_GR = 0.1
+        eps_gr = np.nanmean(moat.iloc[-1])/100
+    eps_gr = cap_eps_growth(eps_gr)
 
     if current_eps is None:
         return None
+    return scalar_price(get_mos_prices(current_eps, eps_gr, marr))
+
+
+def get_mos_prices(eps: np.ndarray, growth: np.ndarray, marr: float = MARR):
+    """Vectorized margin of safety price for many stocks: EPS grown for ten
+    years at its growth rate, priced at a P/E of twice the growth, discounted
+    back at the MARR and halved.
+
+    Args:
+        eps (np.ndarray): Current year EPS.
+        growth (np.ndarray): EPS growth rates as decimals, already capped.
+        marr (float, optional): Discount rate. Defaults to MARR.
+
+    Returns:
+        np.ndarray: Margin of safety prices. NaN where inputs are missing.
+    """
+    eps = np.asarray(eps, dtype=np.float64)
+    growth = np.asarray(growth, dtype=np.float64)
 
     # EPS estimated growth rate
-    eps_fv = npf.fv(EPS_GR, 10, 0, -current_eps)
+    eps_fv = eps*(1 + growth)**10
 
-    pe_fv = EPS_GR*2*100
+    pe_fv = growth*2*100
     price_fv = eps_fv*pe_fv
 
-    intrinsic_value = npf.pv(MARR, 10, 0, -price_fv)
+    intrinsic_value = price_fv/(1 + marr)**10
     return intrinsic_value/2
 
 
@@ -421,8 +689,90 @@ def get_8_year_payback_price(fcfps: float):
     """
     if fcfps is None:
         return None
-    fcf_fvs = [npf.fv(MARR, year, 0, -fcfps) for year in range(1, 11)]
-    return np.sum(fcf_fvs)
+    return scalar_price(get_8_year_payback_prices(fcfps))
+
+
+def get_8_year_payback_prices(fcfps: np.ndarray, marr: float = MARR):
+    """Vectorized payback price for many stocks. The sum of the ten future
+    values of free cash flow per share is computed as a geometric series.
+
+    Args:
+        fcfps (np.ndarray): Free cash flow per share for the most recent year.
+        marr (float, optional): Rate. Defaults to MARR.
+
+    Returns:
+        np.ndarray: The sum of future values over ten years.
+    """
+    fcfps = np.asarray(fcfps, dtype=np.float64)
+    growth = 1 + np.asarray(marr, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        series = np.where(growth == 1, 10.0, (growth**11 - growth)/(growth - 1))
+    return fcfps*series
+
+
+def get_dcf_price(fcfps: float, moat: pd.DataFrame, marr: float = MARR):
+    """Calculates the intrinsic value of a stock by discounting its projected
+    free cash flow per share. Grows at the same rate get_mos_price uses.
+
+    Args:
+        fcfps (float): Free cash flow per share for the most recent year.
+        moat (pd.DataFrame): Moat dataframe needed to grab averages.
+        marr (float, optional): Discount rate. Defaults to MARR.
+
+    Returns:
+        float: The discounted cash flow value. None if conditions are not met.
+    """
+    if fcfps is None:
+        return None
+    growth = EPS_GR
+    if moat is not None:
+        growth = np.nanmean(moat.iloc[-1])/100
+    return scalar_price(get_dcf_prices(fcfps, cap_eps_growth(growth), marr))
+
+
+def get_dcf_prices(fcfps: np.ndarray, growth: np.ndarray, marr: float = MARR,
+                   high_years: int = DCF_HIGH_YEARS, fade_years: int = DCF_FADE_YEARS,
+                   terminal_growth: float = TERMINAL_GR):
+    """Vectorized multi-stage discounted cash flow value for many stocks.
+    Free cash flow per share grows at its growth rate for high_years, then
+    the rate fades linearly to terminal_growth over fade_years. The cash flow
+    after that is valued as a perpetuity growing at terminal_growth. Every
+    cash flow is discounted at the MARR.
+
+    Args:
+        fcfps (np.ndarray): Free cash flow per share for the most recent year.
+        growth (np.ndarray): Growth rates as decimals, already capped.
+        marr (float, optional): Discount rate. Defaults to MARR.
+        high_years (int, optional): Years of the high-growth stage.
+                                    Defaults to DCF_HIGH_YEARS.
+        fade_years (int, optional): Years of the fade stage.
+                                    Defaults to DCF_FADE_YEARS.
+        terminal_growth (float, optional): Growth rate after the fade stage.
+                                           Defaults to TERMINAL_GR.
+
+    Returns:
+        np.ndarray: Discounted cash flow values. NaN where inputs are missing
+                    or the MARR doesn't exceed terminal_growth.
+    """
+    fcfps = np.asarray(fcfps, dtype=np.float64)
+    growth = np.asarray(growth, dtype=np.float64)
+    marr = np.asarray(marr, dtype=np.float64)
+    rate = 1 + marr
+
+    # One pass per projected year keeps memory to a few arrays of the
+    # universe's shape
+    cash_flow = fcfps
+    present_value = np.zeros(np.broadcast_shapes(fcfps.shape, growth.shape, rate.shape))
+    for year in range(1, high_years + fade_years + 1):
+        fade = min(max(year - high_years, 0)/max(fade_years, 1), 1.0)
+        cash_flow = cash_flow*(1 + growth + (terminal_growth - growth)*fade)
+        present_value = present_value + cash_flow/rate**year
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terminal_value = np.where(marr > terminal_growth,
+                                  cash_flow*(1 + terminal_growth)/(marr - terminal_growth),
+                                  np.nan)
+    return present_value + terminal_value/rate**(high_years + fade_years)
 
 
 def get_years(years: list):
@@ -490,14 +840,21 @@ def get_data_averages(df: pd.DataFrame):
         return None
 
 
-def get_links():
+def get_links(driver):
     """Getting links of top 50 most viewed stocks from morningstar.com.
 
+    Args:
+        driver (WebDriver): Web driver to use.
+
     Returns:
         list: List containing stock links
     """
-    DRIVER.get('https://www.morningstar.com/stocks')
-    parent_nodes = WebDriverWait(DRIVER, 10).until(
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    load_page(driver, 'https://www.morningstar.com/stocks')
+    parent_nodes = WebDriverWait(driver, 10).until(
         EC.presence_of_all_elements_located((By.XPATH, XPATHS.get('top50')))
     )[:32]
     child_nodes = [elem.find_element(By.XPATH, './/*') for elem in parent_nodes]
@@ -505,6 +862,33 @@ def get_links():
     return links
 
 
+def load_page(driver, link: str):
+    """Loads a page through the shared morningstar rate limiter, retries and
+    circuit breaker.
+
+    Args:
+        driver (WebDriver): Web driver to use.
+        link (str): Page to load.
+    """
+    from selenium.common.exceptions import WebDriverException
+
+    with METRICS.stage('page_load'):
+        RESILIENCE.call('morningstar', driver.get, link, retry_on=(WebDriverException,))
+
+
+def ticker_from_link(link: str):
+    """Gets the ticker symbol from a Morningstar stock link, e.g.
+    https://www.morningstar.com/stocks/xnas/aapl/valuation -> AAPL.
+
+    Args:
+        link (str): Stock link.
+
+    Returns:
+        str: Ticker symbol.
+    """
+    return link.rstrip('/').split('/')[-2].upper()
+
+
 def moat_data_cleaner(data: list):
     """Scrapes only values that are numbers.
 
@@ -517,13 +901,21 @@ def moat_data_cleaner(data: list):
     return [[elem.replace(',', '') for elem in data_list if is_valid(elem)] for data_list in data]
 
 
-def page_load_catalyst():
+def page_load_catalyst(driver):
     """Web driver clicks all buttons once located to load data faster.
+
+    Args:
+        driver (WebDriver): Web driver to use.
     """
-    for locator in LOCATORS:
-        WebDriverWait(DRIVER, 5).until(
-            EC.presence_of_element_located((By.XPATH, f'//button[@id="{locator}"]'))
-        ).click()
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    with METRICS.stage('catalyst'):
+        for locator in LOCATORS:
+            WebDriverWait(driver, 5).until(
+                EC.presence_of_element_located((By.XPATH, f'//button[@id="{locator}"]'))
+            ).click()
 
 
 def get_debt_to_earnings_ratio(ticker: str):
@@ -537,8 +929,8 @@ def get_debt_to_earnings_ratio(ticker: str):
         float: Debt to income ratio.
     """
     try:
-        long_term_debt = si.get_balance_sheet(ticker).loc['longTermDebt'][0]
-        earnings = si.get_income_statement(ticker).loc['netIncome'][0]
+        long_term_debt = FUNDAMENTALS.get(ticker, 'balance_sheet').loc['longTermDebt'][0]
+        earnings = FUNDAMENTALS.get(ticker, 'income_statement').loc['netIncome'][0]
         de = long_term_debt/earnings
         return de.round(1)
 
@@ -574,6 +966,171 @@ def scrape_data(rows: list, section: str):
     return scrape_data_format1(rows, cash_flow_section=True)
 
 
+def scrape_link(driver, link: str):
+    """Loads a valuation page and scrapes every section into dataframes.
+
+    Args:
+        driver (WebDriver): Web driver to use.
+        link (str): Morningstar valuation page.
+
+    Returns:
+        tuple: Stock name, moat dataframe, management dataframe and free cash
+               flow per share.
+    """
+    load_page(driver, link)
+    stock_name = driver.title
+    page_load_catalyst(driver)
+
+    # Scrape data
+    rev_final, eps_final, growth_yrs = get_data(driver, 'growth', LOCATORS[0], growth_section=True)
+    roe_final, roic_final, op_eff_yrs = get_data(driver, 'op_eff', LOCATORS[1], op_eff_section=True)
+    bvps_final = get_data(driver, 'fin_health', LOCATORS[2], fin_health_section=True)
+    fcfps_final = get_data(driver, 'cash_flow', LOCATORS[3])
+
+    # Store data
+    moat, management = create_dataframes(
+        rev_final, eps_final, bvps_final,
+        roe_final, roic_final, growth_yrs, op_eff_yrs
+    )
+    return stock_name, moat, management, fcfps_final
+
+
+def extract_page(driver, timeout: float = 10, currency_id: str = None):
+    """Reads the title, currency and the text of every section of a loaded
+    valuation page in one script execution.
+
+    Args:
+        driver (WebDriver): Web driver to use.
+        timeout (float, optional): Seconds to wait for sections. Defaults to 10.
+        currency_id (str, optional): ID used by get_currency. Defaults to None.
+
+    Returns:
+        dict: title, currency, sections (key -> text, None if missing) and
+              the list of missing sections.
+    """
+    driver.set_script_timeout(timeout + 5)
+    xpaths = {key: XPATHS.get(key) for key in SECTION_KEYS}
+    return driver.execute_async_script(EXTRACT_SCRIPT, xpaths, LOCATORS,
+                                       timeout*1000, currency_id)
+
+
+def parse_section_lines(lines: dict):
+    """Parses the text lines of every valuation section with the compiled
+    fastparse parser.
+
+    Args:
+        lines (dict): Key in SECTION_KEYS -> section text split by lines.
+                      None for missing sections.
+
+    Returns:
+        dict: rev, eps, growth_yrs, roe, roic, op_eff_yrs, bvps and fcfps.
+              Values of missing sections are None.
+    """
+    import fastparse
+
+    return fastparse.parse_section_lines(lines)
+
+
+def parse_section_lines_reference(lines: dict):
+    """Parses the text lines of every valuation section one row and one
+    value at a time, with the original section parsers. It is slower than
+    parse_section_lines and kept as the reference it is tested against.
+
+    Args:
+        lines (dict): Key in SECTION_KEYS -> section text split by lines.
+                      None for missing sections.
+
+    Returns:
+        dict: rev, eps, growth_yrs, roe, roic, op_eff_yrs, bvps and fcfps.
+              Values of missing sections are None.
+    """
+    sections = dict.fromkeys(
+        ['rev', 'eps', 'growth_yrs', 'roe', 'roic', 'op_eff_yrs', 'bvps', 'fcfps']
+    )
+    if lines.get('growth') is not None:
+        sections['rev'], sections['eps'], sections['growth_yrs'] = \
+            parse_growth_data(lines['growth'])
+
+    if lines.get('op_eff_years') is not None and lines.get('op_eff') is not None:
+        sections['roe'], sections['roic'], sections['op_eff_yrs'] = \
+            parse_operating_and_efficiency_data(lines['op_eff_years'], lines['op_eff'])
+
+    if lines.get('fin_health') is not None:
+        sections['bvps'] = transform(lines['fin_health'], section='fin_health')
+
+    if lines.get('cash_flow') is not None:
+        sections['fcfps'] = transform(lines['cash_flow'], section='cash_flow')
+    return sections
+
+
+def scrape_link_script(driver, link: str):
+    """Loads a valuation page and scrapes every section with a single script
+    execution instead of one WebDriver call per click, wait and read.
+
+    Args:
+        driver (WebDriver): Web driver to use.
+        link (str): Morningstar valuation page.
+
+    Returns:
+        tuple: Stock name, moat dataframe, management dataframe and free cash
+               flow per share.
+    """
+    load_page(driver, link)
+    with METRICS.stage('extract'):
+        page = extract_page(driver)
+    for section in page['missing']:
+        METRICS.count('timeouts')
+        METRICS.count(f'timeouts.{section}')
+        print(f'ERROR ~ Scraping timed out at section: {section}')
+
+    lines = {key: text.splitlines() if text is not None else None
+             for key, text in page['sections'].items()}
+    sections = parse_section_lines(lines)
+
+    # Store data
+    moat, management = create_dataframes(
+        sections['rev'], sections['eps'], sections['bvps'],
+        sections['roe'], sections['roic'],
+        sections['growth_yrs'], sections['op_eff_yrs']
+    )
+    return page['title'], moat, management, sections['fcfps']
+
+
+def scrape_links(links: list, workers: int = 1, scraper=None, lean: bool = False):
+    """Scrapes links with a pool of workers, each one owning its own Chrome
+    driver. Results are yielded in the same order as the links.
+
+    Args:
+        links (list): Morningstar valuation pages.
+        workers (int, optional): Number of Chrome workers. Defaults to 1.
+        scraper (callable, optional): scrape_link or scrape_link_script.
+                                      Defaults to scrape_link.
+        lean (bool, optional): Use the lean browser profile. Defaults to False.
+
+    Yields:
+        tuple: Output of scrape_link for each link.
+    """
+    scraper = scrape_link if scraper is None else scraper
+    local = threading.local()
+    sessions = []
+    lock = threading.Lock()
+
+    def scrape(link):
+        if not hasattr(local, 'session'):
+            local.session = ScraperSession(lean=lean)
+            with lock:
+                sessions.append(local.session)
+        with METRICS.ticker(ticker_from_link(link)), METRICS.stage('scrape'):
+            return scraper(local.session.driver, link)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            yield from executor.map(scrape, links)
+    finally:
+        for session in sessions:
+            session.quit()
+
+
 def scrape_data_format1(rows: list,
                         fin_health_section: bool = False,
                         cash_flow_section: bool = False):
@@ -650,18 +1207,37 @@ def transform(source: list, section: str):
     return scrape_data(value, section)
 
 
-def print_results(stock_info: str, moat: pd.DataFrame, management: pd.DataFrame, fcfps: float):
-    """Prints all relevant information for valuation.
+def get_average(df: pd.DataFrame, column: str):
+    """Gets the average of a column from a dataframe returned by
+    get_data_averages.
+
+    Args:
+        df (pd.DataFrame): Dataframe with an "Avgs" row.
+        column (str): Column to read.
+
+    Returns:
+        float: The average. None if it is missing.
+    """
+    if df is None or column not in df.columns or 'Avgs' not in df.index:
+        return None
+    return df.loc['Avgs', column]
+
+
+def value_stock(stock_info: str, moat: pd.DataFrame, management: pd.DataFrame, fcfps: float):
+    """Values a stock and collects everything relevant for valuation in a record.
 
     Args:
         stock_info (str): Gives the ticker, company name, and stock market.
         moat (pd.DataFrame): Dataframe holding Revenue %, EPS %, and BVPS %.
         management (pd.DataFrame): Dataframe holding mean ROI % and ROIC % over the years.
         fcfps (float): The latest year free cash flow per share.
+
+    Returns:
+        dict: Valuation record. Tables are stored as {column: {year: value}}.
     """
     ticker = stock_info.split()[0]
     try:
-        industry = si.get_company_info(ticker).loc['sector']['Value']
+        industry = FUNDAMENTALS.get(ticker, 'company_info').loc['sector']['Value']
 
     except TypeError:
         industry = 'NA'
@@ -672,75 +1248,48 @@ def print_results(stock_info: str, moat: pd.DataFrame, management: pd.DataFrame,
     management = get_data_averages(management)
 
     # Price calculations
-    current_price = si.get_quote_data(ticker).get('regularMarketPrice')
+    current_price = FUNDAMENTALS.get(ticker, 'quote').get('regularMarketPrice')
     ten_cap = get_ten_cap_price(ticker, fcfps, industry)
     mos = get_mos_price(ticker, moat)
     payback = get_8_year_payback_price(fcfps)
+    dcf = get_dcf_price(fcfps, moat)
+
+    return {
+        'ticker': ticker,
+        'name': stock_info.split('|')[0].strip(),
+        'industry': industry,
+        'current_price': current_price,
+        'mos': mos,
+        'ten_cap': ten_cap,
+        'payback': payback,
+        'dcf': dcf,
+        'debt_to_earnings': de,
+        'fcfps': fcfps,
+        'revenue_avg': get_average(moat, 'Revenue %'),
+        'eps_avg': get_average(moat, 'EPS %'),
+        'bvps_avg': get_average(moat, 'BVPS %'),
+        'roe_avg': get_average(management, 'ROE %'),
+        'roic_avg': get_average(management, 'ROIC %'),
+        'moat': moat.to_dict() if moat is not None else None,
+        'management': management.to_dict() if management is not None else None
+    }
 
-    print('-'*75)
-    # Ticker, name, stock market
-    print(stock_info.split('|')[0])
-    print(f'Industry - {industry}')
-
-    if moat is not None:
-        moat = moat.T
-    print(f'\nMoat\n{moat}\n')
-
-    if management is not None:
-        management = management.T
-    print(f'Management\n{management}')
-
-    if fcfps is not None:
-        print(f'\nDebt/Earnings: {de}\n')
-
-    if current_price is not None:
-        print(f'Current Price: ${current_price}')
-    else:
-        print(f'Current Price: {current_price}')
-    if mos is not None:
-        print(f'MOS: ${int(mos)}')
-
-    if ten_cap is not None and payback is not None:
-        print(f'Ten Cap: ${int(ten_cap)}\n8 Yr Paypack: ${int(payback)}')
-    print('-'*75)
 
+def print_results(stock_info: str, moat: pd.DataFrame, management: pd.DataFrame, fcfps: float):
+    """Prints all relevant information for valuation.
 
-def main():
-    """Runs the entire pipeline to value a stock: data collection through webscraping,
-    data cleaning, data manipulation, and stock valuation. Prints the top 50 most
-    viewed stocks.
+    Args:
+        stock_info (str): Gives the ticker, company name, and stock market.
+        moat (pd.DataFrame): Dataframe holding Revenue %, EPS %, and BVPS %.
+        management (pd.DataFrame): Dataframe holding mean ROI % and ROIC % over the years.
+        fcfps (float): The latest year free cash flow per share.
     """
-    try:
-        start_time = time.time()
-        links = get_links()
-        for link in links:
-            DRIVER.get(link)
-            stock_name = DRIVER.title
-            page_load_catalyst()
-
-            # Scrape data
-            rev_final, eps_final, growth_yrs = get_data('growth', LOCATORS[0], growth_section=True)
-            roe_final, roic_final, op_eff_yrs = get_data('op_eff', LOCATORS[1], op_eff_section=True)
-            bvps_final = get_data('fin_health', LOCATORS[2], fin_health_section=True)
-            fcfps_final = get_data('cash_flow', LOCATORS[3])
-
-            # Store data
-            moat, management = create_dataframes(
-                rev_final, eps_final, bvps_final,
-                roe_final, roic_final, growth_yrs, op_eff_yrs
-            )
-            if moat is not None or management is not None:
-                print_results(stock_name, moat, management, fcfps_final)
-
-        DRIVER.quit()
-        time_taken = time.time() - start_time
-        print(f'Average time taken per stock: {np.round(time_taken/len(links), 2)} seconds')
-        print('-'*75)
+    from sinks import print_record
 
-    except KeyboardInterrupt:
-        DRIVER.quit()
-        sys.exit()
+    print_record(value_stock(stock_info, moat, management, fcfps))
 
 
 if __name__ == '__main__':
-    main()
+    from pipeline import run
+
+    run()
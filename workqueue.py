@@ -0,0 +1,327 @@
+"""Ticker universe files and a SQLite work queue shared by many workers.
+
+A universe file lists one stock per line: a Morningstar valuation URL, an
+"EXCHANGE:SYMBOL" pair or a bare symbol on the default exchange. Blank lines
+and "#" comments are ignored.
+
+The queue keeps one row per valuation page. Workers claim pages under a
+lease and keep it alive with heartbeats while they work. Failed pages go back
+to the queue until they run out of attempts, and pages whose lease ran out
+because their worker died are claimed again by other workers. Every worker
+opens the same SQLite file, so it must be on a filesystem with working file
+locks.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+QUEUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'queue.db')
+STOCK_URL = 'https://www.morningstar.com/stocks/{exchange}/{symbol}/valuation'
+EXCHANGE = 'xnas'
+LEASE = 5 * 60  # Seconds a claim is held without a heartbeat
+MAX_ATTEMPTS = 3
+
+PENDING, LEASED, DONE, FAILED = 'pending', 'leased', 'done', 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    link TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_until);
+"""
+
+
+def entry_link(entry: str, exchange: str = EXCHANGE):
+    """Turns a universe file entry into a valuation page link.
+
+    Args:
+        entry (str): URL, "EXCHANGE:SYMBOL" or symbol.
+        exchange (str, optional): Exchange of bare symbols. Defaults to EXCHANGE.
+
+    Returns:
+        str: Morningstar valuation URL.
+    """
+    if '://' in entry:
+        return entry.replace('/quote', '/valuation')
+    if ':' in entry:
+        exchange, entry = entry.split(':', 1)
+    return STOCK_URL.format(exchange=exchange.lower(), symbol=entry.lower())
+
+
+def read_universe(path: str, exchange: str = EXCHANGE):
+    """Reads a universe file.
+
+    Args:
+        path (str): File with one entry per line.
+        exchange (str, optional): Exchange of bare symbols. Defaults to EXCHANGE.
+
+    Returns:
+        list: Valuation links, without duplicates, in file order.
+    """
+    links = []
+    with open(path) as file:
+        for line in file:
+            entry = line.split('#', 1)[0].strip()
+            if entry:
+                links.append(entry_link(entry, exchange))
+    return list(dict.fromkeys(links))
+
+
+def worker_name():
+    """Default worker ID: host name and process ID."""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class WorkQueue:
+    """Queue of valuation pages in a SQLite file.
+
+    Args:
+        path (str, optional): Database file. Defaults to QUEUE_PATH.
+        lease (float, optional): Seconds a claim is held without a heartbeat.
+                                 Defaults to LEASE.
+        max_attempts (int, optional): Claims of a page before it is marked
+                                      failed. Defaults to MAX_ATTEMPTS.
+    """
+
+    def __init__(self, path: str = QUEUE_PATH, lease: float = LEASE,
+                 max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        """Opens a connection. One per call, so threads never share one."""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return _Connection(conn)
+
+    def add(self, links: list):
+        """Adds pages to the queue. Pages already queued are left as they are.
+
+        Args:
+            links (list): Valuation links.
+
+        Returns:
+            int: Number of new pages.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            before = conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
+            conn.executemany(
+                'INSERT OR IGNORE INTO tasks (link, updated_at) VALUES (?, ?)',
+                ((link, now) for link in links)
+            )
+            return conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0] - before
+
+    def claim(self, worker: str, n: int = 1, now: float = None):
+        """Leases up to n pages that are pending or whose lease expired.
+        Expired pages without attempts left are marked failed instead.
+
+        Args:
+            worker (str): Worker ID.
+            n (int, optional): Pages to claim. Defaults to 1.
+            now (float, optional): Unix time. Defaults to now.
+
+        Returns:
+            list: Claimed links. Empty when nothing is left to do.
+        """
+        now = time.time() if now is None else now
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                'UPDATE tasks SET status = ?, error = ?, worker = NULL, updated_at = ? '
+                'WHERE status = ? AND lease_until < ? AND attempts >= ?',
+                (FAILED, 'lease expired', now, LEASED, now, self.max_attempts)
+            )
+            rows = conn.execute(
+                'SELECT link FROM tasks WHERE status = ? OR (status = ? AND lease_until < ?) '
+                'ORDER BY rowid LIMIT ?',
+                (PENDING, LEASED, now, n)
+            ).fetchall()
+            links = [row['link'] for row in rows]
+            conn.executemany(
+                'UPDATE tasks SET status = ?, worker = ?, lease_until = ?, '
+                'attempts = attempts + 1, updated_at = ? WHERE link = ?',
+                ((LEASED, worker, now + self.lease, now, link) for link in links)
+            )
+            return links
+
+    def heartbeat(self, worker: str, now: float = None):
+        """Extends the leases of every page a worker holds.
+
+        Args:
+            worker (str): Worker ID.
+            now (float, optional): Unix time. Defaults to now.
+
+        Returns:
+            int: Number of leases extended.
+        """
+        now = time.time() if now is None else now
+        with self._connect() as conn:
+            return conn.execute(
+                'UPDATE tasks SET lease_until = ?, updated_at = ? WHERE status = ? AND worker = ?',
+                (now + self.lease, now, LEASED, worker)
+            ).rowcount
+
+    def complete(self, link: str, worker: str):
+        """Marks a page done. Ignored if the worker no longer holds it.
+
+        Args:
+            link (str): Valuation link.
+            worker (str): Worker ID.
+
+        Returns:
+            bool: True if the page was marked done.
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                'UPDATE tasks SET status = ?, worker = NULL, error = NULL, updated_at = ? '
+                'WHERE link = ? AND status = ? AND worker = ?',
+                (DONE, time.time(), link, LEASED, worker)
+            ).rowcount == 1
+
+    def fail(self, link: str, worker: str, error: str = None):
+        """Returns a page to the queue after an error, or marks it failed if
+        it has no attempts left. Ignored if the worker no longer holds it.
+
+        Args:
+            link (str): Valuation link.
+            worker (str): Worker ID.
+            error (str, optional): Error message. Defaults to None.
+
+        Returns:
+            bool: True if the page was updated.
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                'UPDATE tasks SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, '
+                'worker = NULL, lease_until = NULL, error = ?, updated_at = ? '
+                'WHERE link = ? AND status = ? AND worker = ?',
+                (self.max_attempts, FAILED, PENDING, error, time.time(), link, LEASED, worker)
+            ).rowcount == 1
+
+    def release(self, worker: str):
+        """Returns every page a worker holds to the queue without using up an
+        attempt, e.g. on shutdown.
+
+        Args:
+            worker (str): Worker ID.
+
+        Returns:
+            int: Number of pages released.
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                'UPDATE tasks SET status = ?, worker = NULL, lease_until = NULL, '
+                'attempts = MAX(attempts - 1, 0), updated_at = ? WHERE status = ? AND worker = ?',
+                (PENDING, time.time(), LEASED, worker)
+            ).rowcount
+
+    def retry_failed(self):
+        """Puts failed pages back in the queue with fresh attempts.
+
+        Returns:
+            int: Number of pages requeued.
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                'UPDATE tasks SET status = ?, attempts = 0, error = NULL, updated_at = ? '
+                'WHERE status = ?',
+                (PENDING, time.time(), FAILED)
+            ).rowcount
+
+    def stats(self):
+        """Counts pages by status.
+
+        Returns:
+            dict: Status -> number of pages.
+        """
+        counts = dict.fromkeys((PENDING, LEASED, DONE, FAILED), 0)
+        with self._connect() as conn:
+            for row in conn.execute('SELECT status, COUNT(*) FROM tasks GROUP BY status'):
+                counts[row[0]] = row[1]
+        return counts
+
+    def failures(self):
+        """Failed pages and their last error.
+
+        Returns:
+            list: (link, error) tuples.
+        """
+        with self._connect() as conn:
+            return [tuple(row) for row in conn.execute(
+                'SELECT link, error FROM tasks WHERE status = ? ORDER BY rowid', (FAILED,)
+            )]
+
+
+class _Connection:
+    """Closes a sqlite3 connection when leaving a with block, rolling back
+    an open transaction on errors and committing it otherwise."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self.conn.in_transaction:
+                self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.conn.close()
+        return False
+
+
+class Heartbeat:
+    """Background thread renewing a worker's leases until stopped.
+
+    Args:
+        queue (WorkQueue): Queue holding the leases.
+        worker (str): Worker ID.
+        interval (float, optional): Seconds between heartbeats. Defaults to a
+                                    third of the lease.
+    """
+
+    def __init__(self, queue: WorkQueue, worker: str, interval: float = None):
+        self.queue = queue
+        self.worker = worker
+        self.interval = queue.lease / 3 if interval is None else interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.queue.heartbeat(self.worker)
+            except sqlite3.Error as err:
+                print(f'ERROR ~ Heartbeat failed: {err}')
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
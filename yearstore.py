@@ -0,0 +1,266 @@
+"""Memory-mapped store of every ticker's metrics by fiscal year.
+
+The scraped moat and management tables and the free cash flow per share are
+kept in one raw float64 file, opened with np.memmap as a (years, tickers,
+fields) array. The file is year-major: each fiscal year is one block with a
+row for every ticker the store has room for. Adding a year appends a block
+without touching the others, and new tickers fill rows already allocated.
+Only running out of rows rewrites the file, with twice the room. NaN marks
+missing values.
+
+index.json maps tickers to rows and years to blocks. It is replaced
+atomically after the data is written, so readers always see a consistent
+store. One process should write at a time.
+
+A metric for every ticker and year, one ticker's history and a metric in
+one year are all views of the map, so they load without copying.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from sinks import Sink
+
+YEARS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'years')
+CAPACITY = 1024  # Tickers allocated per year before the file is regrown
+FIELDS = ['revenue', 'eps', 'bvps', 'roe', 'roic', 'fcfps']
+
+# Table column -> field
+COLUMN_FIELDS = {
+    'Revenue %': 'revenue',
+    'EPS %': 'eps',
+    'BVPS %': 'bvps',
+    'ROE %': 'roe',
+    'ROIC %': 'roic',
+}
+
+
+def fiscal_year(key):
+    """Fiscal year of a table row key. None for rows like "Avgs"."""
+    try:
+        return int(key)
+    except (TypeError, ValueError):
+        return None
+
+
+class YearStore(Sink):
+    """Store of per-year metrics in a memory-mapped file. It is also a sink,
+    so valuation records can be written to it as a run goes.
+
+    Args:
+        root (str, optional): Directory of the store. Defaults to YEARS_DIR.
+        capacity (int, optional): Tickers to allocate room for in a new store.
+                                  Defaults to CAPACITY.
+        readonly (bool, optional): Open for reading only. Defaults to False.
+        batch_size (int, optional): Records written per flush. Defaults to 100.
+    """
+
+    def __init__(self, root: str = YEARS_DIR, capacity: int = CAPACITY,
+                 readonly: bool = False, batch_size: int = 100):
+        super().__init__(batch_size)
+        self.root = root
+        self.readonly = readonly
+        self.capacity = capacity
+        self.tickers = []
+        self.years = []
+        if os.path.exists(self._path('index.json')):
+            with open(self._path('index.json')) as file:
+                index = json.load(file)
+            if index['fields'] != FIELDS:
+                raise ValueError(f'Store fields {index["fields"]} do not match {FIELDS}')
+            self.capacity = index['capacity']
+            self.tickers = index['tickers']
+            self.years = index['years']
+        elif readonly:
+            raise FileNotFoundError(f'No year store in {root}')
+        else:
+            os.makedirs(root, exist_ok=True)
+            open(self._path('values.f8'), 'ab').close()
+        self.rows = {ticker: row for row, ticker in enumerate(self.tickers)}
+        self.blocks = {year: block for block, year in enumerate(self.years)}
+        self._map()
+
+    def _path(self, name: str):
+        return os.path.join(self.root, name)
+
+    @property
+    def block_size(self):
+        """Values per fiscal year block."""
+        return self.capacity*len(FIELDS)
+
+    def _map(self):
+        """Maps the data file as (years, capacity, fields)."""
+        self.data = None
+        if self.years:
+            self.data = np.memmap(self._path('values.f8'), dtype=np.float64,
+                                  mode='r' if self.readonly else 'r+',
+                                  shape=(len(self.years), self.capacity, len(FIELDS)))
+
+    def _save_index(self):
+        index = {'fields': FIELDS, 'capacity': self.capacity,
+                 'tickers': self.tickers, 'years': self.years}
+        tmp = self._path('index.json.tmp')
+        with open(tmp, 'w') as file:
+            json.dump(index, file)
+        os.replace(tmp, self._path('index.json'))
+
+    def add_year(self, year: int):
+        """Makes room for a fiscal year by appending a NaN block.
+
+        Args:
+            year (int): Fiscal year.
+
+        Returns:
+            int: Block of the year.
+        """
+        if year not in self.blocks:
+            # Written at the block's offset, over anything left by a run that
+            # died before saving the index
+            with open(self._path('values.f8'), 'r+b') as file:
+                file.seek(len(self.years)*self.block_size*8)
+                file.write(np.full(self.block_size, np.nan).tobytes())
+                file.truncate()
+            self.blocks[year] = len(self.years)
+            self.years.append(year)
+            self._map()
+        return self.blocks[year]
+
+    def add_ticker(self, ticker: str):
+        """Gives a ticker a row, regrowing the file if every row is taken.
+
+        Args:
+            ticker (str): Ticker symbol.
+
+        Returns:
+            int: Row of the ticker.
+        """
+        if ticker not in self.rows:
+            if len(self.tickers) == self.capacity:
+                self._regrow(2*self.capacity)
+            self.rows[ticker] = len(self.tickers)
+            self.tickers.append(ticker)
+        return self.rows[ticker]
+
+    def _regrow(self, capacity: int):
+        """Rewrites the file with room for capacity tickers per year."""
+        if self.years:
+            tmp = self._path('values.f8.tmp')
+            grown = np.memmap(tmp, dtype=np.float64, mode='w+',
+                              shape=(len(self.years), capacity, len(FIELDS)))
+            grown[:] = np.nan
+            grown[:, :self.capacity] = self.data
+            grown.flush()
+            del grown
+            self.data = None
+            os.replace(tmp, self._path('values.f8'))
+        self.capacity = capacity
+        self._save_index()
+        self._map()
+
+    def put(self, ticker: str, year: int, values: dict):
+        """Sets metrics of a ticker in a fiscal year.
+
+        Args:
+            ticker (str): Ticker symbol.
+            year (int): Fiscal year.
+            values (dict): Field in FIELDS -> value. None is stored as NaN.
+        """
+        row = self.add_ticker(ticker)
+        block = self.add_year(year)
+        for field, value in values.items():
+            self.data[block, row, FIELDS.index(field)] = np.nan if value is None else value
+
+    def write_tables(self, ticker: str, moat: dict, management: dict, fcfps: float):
+        """Stores scraped tables. Free cash flow per share belongs to the
+        latest fiscal year of the tables.
+
+        Args:
+            ticker (str): Ticker symbol.
+            moat (dict): {column: {year: value}}, or a DataFrame. None if missing.
+            management (dict): Same as moat.
+            fcfps (float): Latest free cash flow per share. None if missing.
+        """
+        rows = {}
+        for table in (moat, management):
+            if isinstance(table, pd.DataFrame):
+                table = table.to_dict()
+            for column, values in (table or {}).items():
+                field = COLUMN_FIELDS.get(column)
+                if field is None:
+                    continue
+                for key, value in values.items():
+                    year = fiscal_year(key)
+                    if year is not None:
+                        rows.setdefault(year, {})[field] = value
+        if fcfps is not None and rows:
+            rows[max(rows)]['fcfps'] = fcfps
+        for year, values in rows.items():
+            self.put(ticker, year, values)
+
+    def _write_batch(self, batch: list):
+        for record in batch:
+            self.write_tables(record['ticker'], record.get('moat'),
+                              record.get('management'), record.get('fcfps'))
+
+    def flush(self):
+        """Writes buffered records, the mapped data and then the index."""
+        super().flush()
+        if not self.readonly:
+            if self.data is not None:
+                self.data.flush()
+            self._save_index()
+
+    def close(self):
+        self.flush()
+        self.data = None
+
+    def metric(self, field: str, year: int = None):
+        """Zero-copy view of one field for every ticker.
+
+        Args:
+            field (str): Field in FIELDS.
+            year (int, optional): Fiscal year. Defaults to every year.
+
+        Returns:
+            np.ndarray: (tickers,) values in the year, or (years, tickers)
+                        values with years in the order of self.years.
+        """
+        col = FIELDS.index(field)
+        n = len(self.tickers)
+        if year is not None:
+            if year not in self.blocks:
+                return np.full(n, np.nan)
+            return self.data[self.blocks[year], :n, col]
+        if self.data is None:
+            return np.empty((0, n))
+        return self.data[:, :n, col]
+
+    def history(self, ticker: str):
+        """Zero-copy view of one ticker's fields.
+
+        Args:
+            ticker (str): Ticker symbol.
+
+        Returns:
+            np.ndarray: (years, fields) values with years in the order of
+                        self.years. None if the ticker isn't stored.
+        """
+        if ticker not in self.rows or self.data is None:
+            return None
+        return self.data[:, self.rows[ticker]]
+
+    def to_frame(self, field: str):
+        """One field as a tickers x years DataFrame, years sorted, for display.
+
+        Args:
+            field (str): Field in FIELDS.
+
+        Returns:
+            pd.DataFrame: Copy of the values.
+        """
+        order = np.argsort(self.years, kind='stable')
+        values = self.metric(field)[order].T if self.years else np.empty((len(self.tickers), 0))
+        return pd.DataFrame(values, index=pd.Index(self.tickers, name='ticker'),
+                            columns=[self.years[i] for i in order])